@@ -0,0 +1,324 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import shutil
+import tempfile
+import statistics
+import itertools
+import subprocess
+
+DEFAULT_BASELINE = 'benchmarks/baseline.json'
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000] # number of tiles in the synthetic maps
+ENTITY_COUNTS = [10, 100, 1000]
+EFFECT_COUNTS = [1000, 10000]
+MIN_TIME = 0.2 # each measurement repeats the benchmark until it has run for at least this long (seconds)
+REPEATS = 5 # measurements per benchmark (the median is reported)
+REGRESSION_THRESHOLD = 0.2 # slowdown (fraction of the baseline) that counts as a regression
+
+# ============ Benchmarks ===================#
+# Times the hot paths of the game on synthetic maps of increasing size, headless (SDL's dummy drivers), and writes
+# the results as JSON so they can be kept as a baseline and compared against later:
+#   python benchmark.py --save         (record a baseline in benchmarks/baseline.json)
+#   python benchmark.py --compare      (exit code 1 if anything got slower than the threshold since the baseline)
+# Every result is the median time of one call in seconds. Baselines are only comparable on the same machine.
+
+# ============ Synthetic Maps ===================#
+# Rolling terrain: each column has a grass tile on top of stone down to a fixed depth, plus a decoration on top every
+# few columns. The map is as wide as it needs to be to hold tile_count tiles, so bigger maps are mostly wider.
+TERRAIN_DEPTH = 24
+
+def make_map(game, tile_count, seed = 0):
+    from scripts.tilemap import Tilemap
+    rng = random.Random(seed)
+    tilemap = Tilemap(game, 16)
+    width = max(1, tile_count // TERRAIN_DEPTH)
+    height = 0
+    placed = 0
+    for x in range(width):
+        height = max(-8, min(8, height + rng.choice((-1, 0, 0, 1)))) # surface height wanders up and down
+        for y in range(TERRAIN_DEPTH):
+            if placed == tile_count:
+                break
+            tilemap.set_tile(x, height + y, 'grass' if y == 0 else 'stone', rng.randint(0, 8))
+            placed += 1
+        if x % 5 == 0:
+            tilemap.add_offgrid({'type': 'decor', 'variant': rng.randint(0, 3), 'pos': [x * 16 + rng.random() * 8, (height - 1) * 16 + 4]})
+    tilemap.dirty_cells.clear() # treat the map like a freshly loaded one
+    return tilemap
+
+# pixel bounds of the terrain (x range, y range)
+def map_bounds(tilemap, tile_count):
+    width = max(1, tile_count // TERRAIN_DEPTH)
+    return (0, width * tilemap.tile_size), (-8 * tilemap.tile_size, (8 + TERRAIN_DEPTH) * tilemap.tile_size)
+
+# ============ Timing ===================#
+# median (and fastest) time of one call of fn, calling it in batches of at least MIN_TIME seconds
+def measure(fn, repeats = REPEATS, min_time = MIN_TIME):
+    clock = time.perf_counter
+    start = clock()
+    fn()
+    single = clock() - start
+    calls = max(1, int(min_time / max(single, 1e-7)))
+    times = []
+    for i in range(repeats):
+        start = clock()
+        for j in range(calls):
+            fn()
+        times.append((clock() - start) / calls)
+    return {'seconds': statistics.median(times), 'min': min(times), 'calls': calls * repeats}
+
+# time fn on its own when it needs topping up now and then by refill (which isn't timed), e.g. updating effects that
+# die off
+def measure_steps(refill, fn, repeats = REPEATS, min_time = MIN_TIME):
+    clock = time.perf_counter
+    times = []
+    for i in range(repeats):
+        total = 0
+        calls = 0
+        while total < min_time / repeats or calls < 10:
+            refill()
+            start = clock()
+            fn()
+            total += clock() - start
+            calls += 1
+        times.append(total / calls)
+    return {'seconds': statistics.median(times), 'min': min(times), 'calls': calls * repeats}
+
+# time a benchmark that changes something and has to be set up again before every call (e.g. autotiling a map)
+def measure_once(setup, fn, repeats = 3):
+    times = []
+    for i in range(repeats):
+        state = setup()
+        start = time.perf_counter()
+        fn(state)
+        times.append(time.perf_counter() - start)
+    return {'seconds': statistics.median(times), 'min': min(times), 'calls': repeats}
+
+# ============ Suite ===================#
+def run_suite(sizes, name_filter = None):
+    from game import Game
+    from scripts.entities import Enemy
+    from scripts.particle import ParticleSystem
+    from scripts.spark import SparkPool
+    from scripts.activation import SLEEP_COARSE, SLEEP_NONE
+    import pygame
+
+    game = Game(headless = True)
+    results = {}
+
+    def record(name, result):
+        results[name] = result
+        print('%-44s %12.3f us' % (name, result['seconds'] * 1e6), flush = True)
+
+    def wanted(name):
+        return name_filter is None or name_filter in name
+
+    temp_dir = tempfile.mkdtemp()
+    for size in sizes:
+        tag = '[%d tiles]' % size
+        names = ['tilemap.%s %s' % (name, tag) for name in ('physics_rects_around', 'solid_check', 'render.warm', 'render.cold',
+                 'autotile', 'autotile_changed', 'save.json', 'load.json', 'save.map', 'load.map')]
+        names += ['entities.tick%s [%d enemies, %d tiles]' % (mode, count, size) for count in ENTITY_COUNTS for mode in ('', '.all_awake', '.all_awake.unbatched')] + ['frame ' + tag]
+        if not any(wanted(name) for name in names):
+            continue # don't build maps nothing is going to use
+        tilemap = make_map(game, size)
+        tile_count = len(tilemap.chunks)
+        (x0, x1), (y0, y1) = map_bounds(tilemap, size)
+        rng = random.Random(1)
+        points = [(rng.uniform(x0, x1), rng.uniform(y0, y1)) for i in range(1024)]
+        point = itertools.cycle(points)
+
+        if wanted('tilemap.physics_rects_around ' + tag):
+            record('tilemap.physics_rects_around ' + tag, measure(lambda: tilemap.physics_rects_around(next(point))))
+        if wanted('tilemap.solid_check ' + tag):
+            record('tilemap.solid_check ' + tag, measure(lambda: tilemap.solid_check(next(point))))
+
+        # rendering a 320x240 view: warm (the chunks are already baked) and cold (everything has to be baked again)
+        surf = pygame.Surface((320, 240), pygame.SRCALPHA)
+        views = [(int(x) - 160, int(y) - 120) for x, y in points[:64]]
+        view = itertools.cycle(views)
+        if wanted('tilemap.render.warm ' + tag):
+            for offset in views:
+                tilemap.render(surf, offset) # bake the chunks (the cache may not hold all of them on big maps)
+            record('tilemap.render.warm ' + tag, measure(lambda: tilemap.render(surf, views[0])))
+        if wanted('tilemap.render.cold ' + tag):
+            def render_cold():
+                tilemap.render_cache.invalidate_all()
+                tilemap.render(surf, next(view))
+            record('tilemap.render.cold ' + tag, measure(render_cold))
+
+        if wanted('tilemap.autotile ' + tag):
+            record('tilemap.autotile ' + tag, measure_once(lambda: make_map(game, size), lambda tilemap: tilemap.autotile(), repeats = 1 if size >= 100000 else 3))
+
+        # autotiling after a small edit (a 4x4 block of stone, put down and then removed again)
+        if wanted('tilemap.autotile_changed ' + tag):
+            block = itertools.cycle(points[:64])
+            def edit():
+                x, y = next(block)
+                tile_x, tile_y = int(x // tilemap.tile_size), int(y // tilemap.tile_size)
+                for i in range(16):
+                    if not tilemap.remove_tile(tile_x + i % 4, tile_y + i // 4):
+                        tilemap.set_tile(tile_x + i % 4, tile_y + i // 4, 'stone', 0)
+            record('tilemap.autotile_changed ' + tag, measure_steps(edit, tilemap.autotile_changed))
+
+        # saving and loading in both map formats
+        for extension in ('.json', '.map'):
+            path = os.path.join(temp_dir, 'bench' + extension)
+            if wanted('tilemap.save' + extension + ' ' + tag) or wanted('tilemap.load' + extension + ' ' + tag):
+                once = size >= 100000
+                record('tilemap.save' + extension + ' ' + tag, measure(lambda: tilemap.save(path), repeats = 1 if once else REPEATS, min_time = 0 if once else MIN_TIME))
+                loaded = make_map(game, 0)
+                def load():
+                    loaded.load(path)
+                    loaded.chunks.decode_all() # binary maps decode chunks lazily, count the decoding too
+                record('tilemap.load' + extension + ' ' + tag, measure(load, repeats = 1 if once else REPEATS, min_time = 0 if once else MIN_TIME))
+
+        # the whole simulation tick with lots of enemies spread over the map, with the far away ones asleep as usual,
+        # with every enemy awake (see scripts/activation.py), and with every enemy awake and updated one at a time
+        # instead of in batches (see scripts/physics.py)
+        if size == sizes[-1] or size >= 100000:
+            for count in ENTITY_COUNTS:
+                for mode, sleep, batched in (('', SLEEP_COARSE, True), ('.all_awake', SLEEP_NONE, True), ('.all_awake.unbatched', SLEEP_NONE, False)):
+                    name = 'entities.tick%s [%d enemies, %d tiles]' % (mode, count, size)
+                    if not wanted(name):
+                        continue
+                    setup_level(game, tilemap, size, count, Enemy)
+                    game.activation.sleep = sleep
+                    game.physics.batched = batched
+                    for i in range(120):
+                        step(game) # let the enemies land first
+                    record(name, measure(lambda: step(game)))
+                    check_level(game, tilemap, tile_count, count, name)
+            game.activation.sleep = SLEEP_COARSE
+            game.physics.batched = True
+
+        # one whole frame of the game (a tick, rendering and presenting) on the synthetic map
+        name = 'frame [%d tiles]' % size
+        if wanted(name):
+            setup_level(game, tilemap, size, 10, Enemy)
+            game.particles.enabled = True
+            game.sparks.enabled = True
+            def frame():
+                step(game)
+                game.render(1)
+            record(name, measure(frame))
+            check_level(game, tilemap, tile_count, 10, name)
+            game.particles.enabled = False
+            game.sparks.enabled = False
+
+    # particles and sparks
+    for count in EFFECT_COUNTS:
+        name = 'particles.update [%d]' % count
+        if wanted(name):
+            particles = ParticleSystem(game, capacity = count)
+            def refill_particles():
+                if len(particles) < count // 2: # top the particles back up when too many have died
+                    particles.clear()
+                    for i in range(count):
+                        particles.add('leaf', (i % 300, i % 200), velocity = (-0.1, 0.3), frame = i % 20)
+            record(name, measure_steps(refill_particles, particles.update))
+
+        name = 'sparks.update [%d]' % count
+        if wanted(name):
+            sparks = SparkPool(capacity = count)
+            def refill_sparks():
+                if len(sparks) < count // 2:
+                    sparks.clear()
+                    for i in range(count):
+                        sparks.add((i % 300, i % 200), i * 0.1, 1 + i % 4)
+            record(name, measure_steps(refill_sparks, sparks.update))
+
+    shutil.rmtree(temp_dir)
+    return results
+
+# put the game on a synthetic map with a number of enemies spread along the surface
+def setup_level(game, tilemap, size, enemy_count, enemy_class):
+    if game.tilemap is tilemap:
+        game.tilemap = tilemap.copy() # (reset restores level 0 into the game's tilemap, which mustn't be the synthetic map)
+    game.reset(0, 0)
+    game.tilemap = tilemap
+    (x0, x1), (y0, y1) = map_bounds(tilemap, size)
+    rng = random.Random(2)
+    game.enemies = [enemy_class(game, (rng.uniform(x0, x1), y0 - 32), (8,15)) for i in range(enemy_count)]
+    game.player.pos = [x0 + 32, y0 - 32]
+    game.activation.reset(game.enemies)
+    game.leaf_spawners = []
+    game.transition = 0
+
+# One tick of the game on the synthetic level. The player can't die: a death restarts the level, which would load level 0
+# into the synthetic map (Game.load_level restores the game's tilemap in place) and replace the enemies. The enemies
+# can't all die either, since nothing dashes into them, so the level is never cleared
+def step(game):
+    game.step(0)
+    game.dead = 0
+
+# make sure a measurement really ran on the level setup_level built
+def check_level(game, tilemap, tile_count, enemy_count, name):
+    if game.tilemap is not tilemap or len(tilemap.chunks) != tile_count or len(game.enemies) != enemy_count:
+        raise AssertionError('%s: the synthetic level was replaced while it was being measured (%d/%d tiles, %d/%d enemies)'
+                             % (name, len(tilemap.chunks), tile_count, len(game.enemies), enemy_count))
+
+# ============ Baselines ===================#
+def machine_info():
+    import pygame
+    import numpy as np
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output = True, text = True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'commit': commit, 'python': platform.python_version(),
+            'pygame': pygame.version.ver, 'numpy': np.__version__, 'platform': platform.platform(),
+            'machine': platform.machine(), 'processor': platform.processor(), 'cpus': os.cpu_count()}
+
+def save_results(path, results):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok = True)
+    f = open(path, 'w')
+    json.dump({'machine': machine_info(), 'results': results}, f, indent = 1, sort_keys = True)
+    f.close()
+
+# print how every result compares to the baseline, returns the names of the ones that got slower than threshold
+def compare(baseline_path, results, threshold):
+    f = open(baseline_path)
+    baseline = json.load(f)['results']
+    f.close()
+    regressions = []
+    print('\n%-44s %12s %12s %8s' % ('benchmark', 'baseline us', 'now us', 'change'))
+    for name, result in results.items():
+        if name not in baseline:
+            print('%-44s %12s %12.3f %8s' % (name, '-', result['seconds'] * 1e6, 'new'))
+            continue
+        before = baseline[name]['seconds']
+        change = result['seconds'] / before - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print('%-44s %12.3f %12.3f %+7.1f%%%s' % (name, before * 1e6, result['seconds'] * 1e6, change * 100, flag))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description = 'benchmark the hot paths of the game')
+    parser.add_argument('--sizes', type = int, nargs = '*', default = DEFAULT_SIZES, help = 'number of tiles in the synthetic maps')
+    parser.add_argument('--quick', action = 'store_true', help = 'only the small maps (1K and 10K tiles)')
+    parser.add_argument('--filter', help = 'only run the benchmarks whose name contains this')
+    parser.add_argument('--save', metavar = 'PATH', nargs = '?', const = DEFAULT_BASELINE, help = 'write the results (a new baseline) to this file (default: %s)' % DEFAULT_BASELINE)
+    parser.add_argument('--compare', metavar = 'PATH', nargs = '?', const = DEFAULT_BASELINE, help = 'compare the results against this baseline (default: %s)' % DEFAULT_BASELINE)
+    parser.add_argument('--threshold', type = float, default = REGRESSION_THRESHOLD, help = 'slowdown that counts as a regression (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    sizes = [size for size in args.sizes if size <= 10000] if args.quick else args.sizes
+    results = run_suite(sorted(sizes), args.filter)
+    if args.save:
+        save_results(args.save, results)
+    if args.compare:
+        regressions = compare(args.compare, results, args.threshold)
+        if regressions:
+            print('\n%d regression(s) over %d%%' % (len(regressions), args.threshold * 100))
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
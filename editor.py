@@ -1,7 +1,9 @@
 import sys
 import pygame
-from scripts.utils import load_images
+from scripts.assets import AssetLoader, LazyAssets
 from scripts.tilemap import Tilemap
+from scripts.present import Presenter
+from scripts.autosave import Autosave
 # import json
 
 RENDER_SCALE = 2.0
@@ -16,17 +18,24 @@ class Editor:
         self.screen = pygame.display.set_mode((640,480)) # This is what is shown on the computer screen
 
         self.display = pygame.Surface((320,240)) # This is the game graphics display
+        self.presenter = Presenter(self.screen, self.display.get_size()) # upscales the display onto the screen (see scripts/present.py)
+        self.last_view = None # what the display showed last frame (nothing is redrawn while it stays the same)
 
         self.clock = pygame.time.Clock()
 
-        # Create a Dictionary containing all the game assets
-        self.assets = {
-            'decor': load_images('tiles/decor'),
-            'grass': load_images('tiles/grass'),
-            'large_decor': load_images('tiles/large_decor'),
-            'stone': load_images('tiles/stone'),
-            'spawners': load_images('tiles/spawners')
-        }
+        # Get the images ready, they are loaded the first time an asset uses them (shares the atlas cache file with the game, see scripts/assets.py)
+        self.loader = AssetLoader()
+        self.loader.prepare()
+        images = self.loader.images
+
+        # Create a Dictionary containing all the game assets (each entry is built the first time it is used)
+        self.assets = LazyAssets({
+            'decor': lambda: images('tiles/decor'),
+            'grass': lambda: images('tiles/grass'),
+            'large_decor': lambda: images('tiles/large_decor'),
+            'stone': lambda: images('tiles/stone'),
+            'spawners': lambda: images('tiles/spawners')
+        })
 
         self.movement = [False,False,False,False]
 
@@ -38,6 +47,13 @@ class Editor:
         except FileNotFoundError:
             pass
 
+        # Journal every edit and save in the background (see scripts/autosave.py), picking up where the editor left
+        # off if it crashed with unsaved edits
+        self.autosave = Autosave(self.tilemap, 'map.json')
+        recovered = self.autosave.start()
+        if recovered:
+            print('recovered ' + str(recovered) + ' unsaved edits from ' + self.autosave.journal_path)
+
         self.scroll = [0,0] # create a list representing the camera position
 
 
@@ -47,6 +63,14 @@ class Editor:
         self.tile_variant = 0  # which member of the tile category are we using
 
         self.ongrid = True
+        self.auto_autotile = False # autotile every edit as it is made (toggled with y)
+
+        # Editing tools: 'brush' paints under the mouse, 'rect' fills the rectangle dragged out with the mouse, 'fill'
+        # flood fills the area clicked on, 'copy' copies the rectangle dragged out (pasted at the mouse with v)
+        self.tool = 'brush'
+        self.stroke = None # cell the mouse was over last frame while a button is held (None when no button is held)
+        self.drag_start = None # corner cell of the rectangle being dragged out
+        self.clipboard = None # the last region copied (see Tilemap.copy_region)
 
         # Mouse input variables
         self.clicking = False
@@ -57,67 +81,75 @@ class Editor:
     def run(self): # This is the game loop
         while True:
 
-            self.display.fill((0,0,0,))
-
             render_scroll = (int(self.scroll[0]),int(self.scroll[1])) # integer version of scroll position
 
-            self.tilemap.render(self.display, offset = render_scroll) # render tilemap objects
-
-            current_tile_img = self.assets[self.tile_list[self.tile_group]][self.tile_variant].copy()
-            current_tile_img.set_alpha(100) # make this image semi-transparent
-
             # Get current mouse position
             mpos = pygame.mouse.get_pos()
             mpos = (mpos[0] / RENDER_SCALE, mpos[1] / RENDER_SCALE)
             tile_pos = (int((mpos[0] + self.scroll[0]) // self.tilemap.tile_size), int((mpos[1] + self.scroll[1]) // self.tilemap.tile_size))
 
+            # Only redraw the display if something on it could have changed since last frame
+            view = (render_scroll, mpos, self.tile_group, self.tile_variant, self.ongrid, self.tilemap.revision, self.tool, self.drag_start)
+            idle = view == self.last_view
+            self.last_view = view
+
+            if not idle:
+                self.display.fill((0,0,0,))
+
+                self.tilemap.render(self.display, offset = render_scroll) # render tilemap objects
+
+                current_tile_img = self.assets[self.tile_list[self.tile_group]][self.tile_variant].copy()
+                current_tile_img.set_alpha(100) # make this image semi-transparent
+
             # Place tiles
             if self.clicking:
                 if not self.ongrid and self.can_place_offgrid:
                     # Add an item to the list of offgrid tiles
-                    self.tilemap.offgrid_tiles.append({'type': self.tile_list[self.tile_group],'variant': self.tile_variant, \
-                                                       'pos': (mpos[0] + self.scroll[0], mpos[1] + self.scroll[1])})
+                    self.tilemap.add_offgrid({'type': self.tile_list[self.tile_group],'variant': self.tile_variant, \
+                                              'pos': (mpos[0] + self.scroll[0], mpos[1] + self.scroll[1])})
                     self.can_place_offgrid = False
                 elif self.ongrid:
-                    # Add an item to the dictionary based on mouse position and current tile selection
-                    self.tilemap.tilemap[str(tile_pos[0]) + ';' + str(tile_pos[1])] = {'type': self.tile_list[self.tile_group], \
-                                                                                        'variant': self.tile_variant, 'pos': tile_pos}
+                    # Add tiles to the tilemap with the current tool, based on mouse position and current tile selection
+                    self.apply_tool(tile_pos, self.tile_list[self.tile_group], self.tile_variant)
                     # print(self.tilemap.tilemap)
             # Remove tiles
             if self.right_clicking:
-                # Get a key representation of the current mouse position in tile coordinates
-                tile_loc = str(tile_pos[0]) + ';' + str(tile_pos[1])
-                # If there is a tile at the current mouse location, delete it from the dictionary
-                if tile_loc in self.tilemap.tilemap:
-                    del self.tilemap.tilemap[tile_loc]
-
-                # Handle removal of offgrid tiles
-                for tile in self.tilemap.offgrid_tiles.copy():
-                    # for each tile in the list of offgrid tiles, get the tile's image
-                    tile_img = self.assets[tile['type']][tile['variant']]
-                    # Get a rectangle bounding the image of the currently selected tile
-                    tile_r = pygame.Rect(tile['pos'][0] - self.scroll[0],tile['pos'][1] - self.scroll[1],\
-                                         tile_img.get_width(),tile_img.get_height())
-                    # check if the tile is colliding with the mouse
-                    if tile_r.collidepoint(mpos):
-                        # remove the current tile from the list of tiles
-                        self.tilemap.offgrid_tiles.remove(tile)
-            # Show the current tile selection
-            self.display.blit(current_tile_img,(5,5))
-
-            # blit the current tile selection near the mouse; 
-            
-            # if we are on-grid, the location is the tile location relative to the camera position
-            if self.ongrid:
-                self.display.blit(current_tile_img,(tile_pos[0]*self.tilemap.tile_size - self.scroll[0],\
-                                                    tile_pos[1]*self.tilemap.tile_size - self.scroll[1]))
-            else:
-                self.display.blit(current_tile_img,mpos)
+                # Erase the tiles under the current tool at the mouse location (in tile coordinates)
+                self.apply_tool(tile_pos, None, 0)
+
+                # Handle removal of offgrid tiles: ask the tilemap's spatial index which decorations are under the mouse
+                for tile in self.tilemap.offgrid_at((mpos[0] + self.scroll[0], mpos[1] + self.scroll[1])):
+                    self.tilemap.remove_offgrid(tile)
+            # Autotile the tiles that were just placed or removed (and their neighbors) right away
+            if self.auto_autotile:
+                self.tilemap.autotile_changed()
+            if not idle:
+                # Show the current tile selection
+                self.display.blit(current_tile_img,(5,5))
+
+                # blit the current tile selection near the mouse; 
+
+                # if we are on-grid, the location is the tile location relative to the camera position
+                if self.ongrid:
+                    self.display.blit(current_tile_img,(tile_pos[0]*self.tilemap.tile_size - self.scroll[0],\
+                                                        tile_pos[1]*self.tilemap.tile_size - self.scroll[1]))
+                else:
+                    self.display.blit(current_tile_img,mpos)
+
+                # outline the rectangle being dragged out
+                if self.drag_start is not None:
+                    x, y, w, h = self.drag_rect(tile_pos)
+                    ts = self.tilemap.tile_size
+                    pygame.draw.rect(self.display, (255,255,255) if self.tool == 'rect' else (100,200,255), \
+                                     (x * ts - render_scroll[0], y * ts - render_scroll[1], w * ts, h * ts), 1)
 
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
+                    self.autosave.close() # finish writing the journal
                     pygame.quit()
                     sys.exit()
+                if event.type == pygame.WINDOWEXPOSED:
+                    self.presenter.invalidate() # the window has to be drawn again
 
                 # Handle Mouse Input
                 if event.type == pygame.MOUSEBUTTONDOWN:
@@ -145,11 +177,14 @@ class Editor:
                 if event.type == pygame.MOUSEBUTTONUP:
                     if event.button == 1:
                         self.clicking = False # Left Mouse Released
+                        if self.ongrid:
+                            self.end_stroke(tile_pos, self.tile_list[self.tile_group], self.tile_variant)
 
                         # Reset ability to place offgrid tiles
                         if not self.can_place_offgrid: self.can_place_offgrid = True
                     if event.button == 3:
                         self.right_clicking = False # Right Mouse Released
+                        self.end_stroke(tile_pos, None, 0)
 
                 # Handle Keyboard Input
 
@@ -174,11 +209,30 @@ class Editor:
                     if event.key == pygame.K_g:
                         self.ongrid = not self.ongrid 
                     # File I/O
-                    if event.key == pygame.K_o: # output
-                        self.tilemap.save('map.json')
-                    # Auto-tiling
+                    if event.key == pygame.K_o: # output (saved on a background thread)
+                        self.autosave.save()
+                    # Auto-tiling (the whole map)
                     if event.key == pygame.K_t: 
                         self.tilemap.autotile()
+                    # Editing tools
+                    if event.key == pygame.K_b:
+                        self.tool = 'brush'
+                    if event.key == pygame.K_r:
+                        self.tool = 'rect'
+                    if event.key == pygame.K_f:
+                        self.tool = 'fill'
+                    if event.key == pygame.K_c:
+                        self.tool = 'copy'
+                    # Paste the copied region with its top left corner at the mouse
+                    if event.key == pygame.K_v and self.clipboard is not None:
+                        self.tilemap.paste_region(self.clipboard, tile_pos[0], tile_pos[1])
+                        if self.auto_autotile:
+                            self.tilemap.autotile_changed()
+                    # Toggle autotiling of every edit as it is made
+                    if event.key == pygame.K_y:
+                        self.auto_autotile = not self.auto_autotile
+                        if self.auto_autotile:
+                            self.tilemap.autotile_changed() # catch up with the edits made while it was off
 
                 if event.type == pygame.KEYUP:
                     if event.key == pygame.K_LEFT or event.key == pygame.K_a:
@@ -196,13 +250,55 @@ class Editor:
                         self.shift = False 
 
 
+            # Hand the latest edits over to be journaled (and autosave every so often)
+            self.autosave.update()
+
             # Move the screen based on user input
             self.scroll[0] += (self.movement[1] - self.movement[0]) * 3
             self.scroll[1] += (self.movement[3] - self.movement[2]) * 3
 
             # self.screen.blit(self.img,self.img_pos)
-            self.screen.blit(pygame.transform.scale(self.display, self.screen.get_size()),(0,0)) # Render the game graphics onto an up-scaled display
-            pygame.display.update()
+            # Render the game graphics onto an up-scaled display (skipped while the editor is idle)
+            self.presenter.present(self.display, dirty = [] if idle else None)
             self.clock.tick(60)
 
-Editor().run()
\ No newline at end of file
+    # ============ Editing Tools ===================#
+    # called every frame while a mouse button is held down on the grid (a tile_type of None erases)
+    def apply_tool(self, tile_pos, tile_type, variant):
+        first = self.stroke is None # the button was only just pressed
+        if self.tool == 'brush':
+            # paint the whole line from where the mouse was last frame, so fast strokes don't skip cells
+            self.tilemap.paint_line(tile_pos if first else self.stroke, tile_pos, tile_type, variant)
+        elif self.tool == 'fill':
+            if first:
+                self.tilemap.flood_fill(tile_pos[0], tile_pos[1], tile_type, variant, self.view_bounds())
+        elif first:
+            self.drag_start = tile_pos # rect and copy work on the rectangle dragged out until the button is let go
+        self.stroke = tile_pos
+
+    # called when the mouse button is let go
+    def end_stroke(self, tile_pos, tile_type, variant):
+        if self.drag_start is not None:
+            x, y, w, h = self.drag_rect(tile_pos)
+            if self.tool == 'rect':
+                self.tilemap.fill_rect(x, y, w, h, tile_type, variant)
+            elif self.tool == 'copy':
+                self.clipboard = self.tilemap.copy_region(x, y, w, h)
+            if self.auto_autotile:
+                self.tilemap.autotile_changed()
+        self.stroke = None
+        self.drag_start = None
+
+    # rectangle (x, y, w, h in tiles) between the cell the drag started on and tile_pos, both included
+    def drag_rect(self, tile_pos):
+        x = min(self.drag_start[0], tile_pos[0])
+        y = min(self.drag_start[1], tile_pos[1])
+        return (x, y, abs(self.drag_start[0] - tile_pos[0]) + 1, abs(self.drag_start[1] - tile_pos[1]) + 1)
+
+    # the cells on screen (flood fills don't spread past them)
+    def view_bounds(self):
+        ts = self.tilemap.tile_size
+        return (int(self.scroll[0] // ts), int(self.scroll[1] // ts), self.display.get_width() // ts + 2, self.display.get_height() // ts + 2)
+
+if __name__ == '__main__':
+    Editor().run()
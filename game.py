@@ -2,17 +2,35 @@ import sys
 import random
 import pygame
 from scripts.entities import PhysicsEntity, Player, Enemy
-from scripts.utils import load_image, load_images
+from scripts.assets import AssetLoader, LazyAssets
 from scripts.tilemap import Tilemap
+from scripts.level import LevelCache
 from scripts.clouds import Cloud, Clouds
 from scripts.utils import Animation
-from scripts.particle import Particle
-from scripts.spark import Spark
+from scripts.particle import ParticleSystem
+from scripts.spark import SparkPool
+from scripts.projectile import ProjectileStore
+from scripts.outline import OutlineRenderer
+from scripts.resources import RenderResources
+from scripts.present import Presenter
+from scripts.timestep import FixedTimestep
+from scripts.inputs import LEFT, RIGHT, JUMP, DASH, SilentSound
+from scripts.replay import Recording, Replay, load_recording, state_digest
+from scripts.profiler import Profiler
+from scripts.activation import EnemyActivation
+from scripts.physics import PhysicsWorld
 import math
 import os
 
 class Game:
-    def __init__(self):
+    # headless = True runs without a window or audio device (SDL's dummy drivers), for driving the simulation from
+    # code as fast as possible with step(). Nothing is rendered and the sound effects do nothing
+    def __init__(self, headless = False):
+        self.headless = headless
+        if headless:
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+            os.environ['SDL_AUDIODRIVER'] = 'dummy'
+            os.environ['SDL_NO_SIGNAL_HANDLERS'] = '1' # let Ctrl+C / SIGTERM stop the process (SDL would turn them into QUIT events nobody reads)
 
         pygame.init()
 
@@ -38,39 +56,64 @@ class Game:
         self.screen = pygame.display.set_mode(SCREEN_RESOLUTION) # This is what is shown on the computer screen
         self.display = pygame.Surface(GRAPHICS_DISPLAY_SIZE, pygame.SRCALPHA) # This is the game graphics display
         self.display_2 = pygame.Surface(GRAPHICS_DISPLAY_SIZE) # This surface is used to create the "outlines" effect
+        self.outline = OutlineRenderer() # draws the outlines onto display_2 (F2 cycles full / off / fast quality)
+        self.presenter = Presenter(self.screen, GRAPHICS_DISPLAY_SIZE) # upscales display_2 onto the screen (see scripts/present.py)
 
         # Create a clock object to control frame rate
         self.clock = pygame.time.Clock()
 
-        # Create a Dictionary containing all the game assets
-        self.assets = {
-            'decor': load_images('tiles/decor'),
-            'grass': load_images('tiles/grass'),
-            'large_decor': load_images('tiles/large_decor'),
-            'stone': load_images('tiles/stone'),
-            'player': load_image('entities/player.png'),
-            'background': load_image('background.png'),
-            'clouds': load_images('clouds'),
-            'enemy/idle': Animation(load_images('entities/enemy/idle'),img_dur = 6),
-            'enemy/run': Animation(load_images('entities/enemy/run'),img_dur = 4),
-            'player/idle': Animation(load_images('entities/player/idle'),img_dur = 6),
-            'player/run': Animation(load_images('entities/player/run'),img_dur = 4),
-            'player/jump': Animation(load_images('entities/player/jump')),
-            'player/slide': Animation(load_images('entities/player/slide')),
-            'player/wall_slide': Animation(load_images('entities/player/wall_slide')),
-            'particle/leaf': Animation(load_images('particles/leaf'), img_dur = 20, loop=False),
-            'particle/particle': Animation(load_images('particles/particle'), img_dur = 6, loop=False),
-            'gun': load_image('gun.png'),
-            'projectile': load_image('projectile.png'),
-        }
+        # Get the images ready: this is one read of the atlas cache file (the images in it are converted the first time
+        # an asset uses them), or a parallel decode of all the PNGs when the atlas has to be rebuilt (see scripts/assets.py)
+        self.loader = AssetLoader()
+        self.loader.prepare()
+        images = self.loader.images
+        image = self.loader.image
+
+        # Create a Dictionary containing all the game assets (each entry is built the first time it is used)
+        self.assets = LazyAssets({
+            'decor': lambda: images('tiles/decor'),
+            'grass': lambda: images('tiles/grass'),
+            'large_decor': lambda: images('tiles/large_decor'),
+            'stone': lambda: images('tiles/stone'),
+            'player': lambda: image('entities/player.png'),
+            'background': lambda: image('background.png'),
+            'clouds': lambda: images('clouds'),
+            'enemy/idle': lambda: Animation(images('entities/enemy/idle'),img_dur = 6),
+            'enemy/run': lambda: Animation(images('entities/enemy/run'),img_dur = 4),
+            'player/idle': lambda: Animation(images('entities/player/idle'),img_dur = 6),
+            'player/run': lambda: Animation(images('entities/player/run'),img_dur = 4),
+            'player/jump': lambda: Animation(images('entities/player/jump')),
+            'player/slide': lambda: Animation(images('entities/player/slide')),
+            'player/wall_slide': lambda: Animation(images('entities/player/wall_slide')),
+            'particle/leaf': lambda: Animation(images('particles/leaf'), img_dur = 20, loop=False),
+            'particle/particle': lambda: Animation(images('particles/particle'), img_dur = 6, loop=False),
+            'gun': lambda: image('gun.png'),
+            'projectile': lambda: image('projectile.png'),
+        })
+
+        # Surfaces that are reused every frame: the scaled background and the transition masks (see scripts/resources.py)
+        self.resources = RenderResources(self.assets)
+        self.resources.prepare_transitions(self.display.get_size()) # (so the first transitions don't have to draw their masks)
+
+        # Particle system that stores every particle in the game (see scripts/particle.py)
+        self.particles = ParticleSystem(self)
+        self.sparks = SparkPool() # pool of all the spark effects (see scripts/spark.py)
+        self.projectiles = ProjectileStore(self) # store of all the enemy projectiles (see scripts/projectile.py)
+
+        # Particles and sparks are only for show, so a headless game doesn't simulate them
+        # (whatever spawns them still draws the same random numbers, so the game plays out the same either way)
+        if headless:
+            self.particles.enabled = False
+            self.sparks.enabled = False
 
         # Load Sound effects into a dictionary
+        sound = SilentSound if headless else pygame.mixer.Sound
         self.sfx = {
-            'jump': pygame.mixer.Sound('data/sfx/jump.wav'),
-            'dash': pygame.mixer.Sound('data/sfx/dash.wav'),
-            'hit': pygame.mixer.Sound('data/sfx/hit.wav'),
-            'shoot': pygame.mixer.Sound('data/sfx/shoot.wav'),
-            'ambience': pygame.mixer.Sound('data/sfx/ambience.wav'),
+            'jump': sound('data/sfx/jump.wav'),
+            'dash': sound('data/sfx/dash.wav'),
+            'hit': sound('data/sfx/hit.wav'),
+            'shoot': sound('data/sfx/shoot.wav'),
+            'ambience': sound('data/sfx/ambience.wav'),
         }
 
         # Apply mixing (best practice is to load sfx audio files too loud then scale down volume in-game)
@@ -80,17 +123,45 @@ class Game:
         self.sfx['dash'].set_volume(0.3)
         self.sfx['jump'].set_volume(0.7)
 
-        self.movement = [False,False]
+        self.movement = [False,False] # left / right keys held down
+        self.pressed = 0 # JUMP / DASH keys pressed since the last tick (see scripts/inputs.py)
+        self.inputs = 0 # inputs of the tick being simulated
+
+        # Input recording and replay (see scripts/replay.py)
+        self.recording = None # Recording that every tick's inputs get added to
+        self.recording_path = None # where the recording is saved when the game quits
+        self.replay = None # Replay whose inputs are used instead of the keyboard
+
+        # Effects that only exist on screen (screen shake) use their own random numbers, so the number of frames that get
+        # rendered doesn't change the random numbers the simulation gets
+        self.fx_random = random.Random()
 
         self.player = Player(self,(50,50),(8,15))
+        self.activation = EnemyActivation() # decides which enemies are near enough to the camera to simulate (see scripts/activation.py)
+        self.physics = PhysicsWorld() # moves the awake enemies all at once when there are lots of them (see scripts/physics.py)
 
         self.tilemap = Tilemap(self, 16)
 
+        # Parsed levels are kept in memory so restarting a level doesn't have to reload it (see scripts/level.py)
+        self.levels = LevelCache()
+
+        # Count the levels in data/maps (a level can have a binary .map version next to its .json file)
+        self.level_count = len([name for name in os.listdir('data/maps') if name.endswith('.json')])
+
         # Load the starting level
         self.level = 0
         self.load_level(self.level)
 
         self.screenshake = 0 # Timer for screen shake effect
+        self.paused = False
+
+        # The simulation runs at a fixed tick rate, independent of how fast frames are rendered (see scripts/timestep.py)
+        self.timestep = FixedTimestep()
+        self.render_fps = 60 # frame rate cap, can be raised (e.g. 144) without changing the speed of the game
+
+        # Timing of every stage of the game loop, shown on screen with F3 (see scripts/profiler.py)
+        self.profiler = Profiler()
+        self.profile_path = 'profile.json' # where F4 (and quitting, if the profiler is on) saves the profile
 
     def run(self): # This is the game loop
 
@@ -100,191 +171,360 @@ class Game:
         pygame.mixer.music.play(-1) # play music on an endless loop
         self.sfx['ambience'].play(-1)
 
+        self.clock.tick() # start timing frames from here
+        profiler = self.profiler
         while True:
-            
-            # Render the base background
-            self.display.fill((0,0,0,0)) # fill display with transparant background
-            self.display_2.blit(pygame.transform.scale(self.assets['background'],self.display.get_size()),(0,0))
-
-            # Increment screen shake timer
-            self.screenshake = max(0, self.screenshake - 1)
-
-            # Check if all the enemies are gone
-            if not len(self.enemies):
-                self.transition += 1
-                # Load the next level
-                if self.transition > 30:
-                    self.level = min(self.level + 1, len(os.listdir('data/maps'))-1)
-                    self.load_level(self.level)
-            if self.transition < 0:
-                self.transition += 1
-
-            # Restart the level if the player dies
-            if self.dead:
-                self.dead += 1
-                if self.dead >= 10:
-                    self.transition = min(30, self.transition + 1) # cap at 30 to prevent level transition from occuring outside of self.dead counter
-                if self.dead > 60:
-                    self.load_level(self.level)
-
-            # Move the Camera
-            self.scroll[0] += (self.player.rect().centerx - self.display.get_width() / 2 - self.scroll[0]) / 2
-            self.scroll[1] += (self.player.rect().centery - self.display.get_height() / 2 - self.scroll[1]) / 2
-            render_scroll = (int(self.scroll[0]),int(self.scroll[1])) # integer version of scroll position
-
-            # Spawn Particles
-            for rect in self.leaf_spawners:
-                # Note: spawn rate of particles is proportional to the size of the particle emitter rectangle
-                if random.random() * 49999 < rect.width * rect.height: 
-                    pos = (rect.x + random.random() * rect.width, rect.y + random.random() * rect.height)
-                    self.particles.append(Particle(self, 'leaf', pos, velocity = [-0.1, 0.3], frame = random.randint(0,20)))
-
-
-            # Update and render the level / environment
-            self.clouds.update() # move the clouds
-            self.clouds.render(self.display_2, offset = render_scroll) # render the clouds (render on display_2 to prevent adding the outline)
-
-            self.tilemap.render(self.display, offset = render_scroll) # render tilemap objects
-
-            # Update and Render the enemies
-            for enemy in self.enemies.copy():
-                kill = enemy.update(self.tilemap, (0,0))
-                enemy.render(self.display, offset = render_scroll)
-                if kill:
-                    self.enemies.remove(enemy)
-
-
-            # Update and Render the player (if they have not died)
-            if not self.dead:
-                self.player.update(self.tilemap, (2*(self.movement[1] - self.movement[0]),0))
-                self.player.render(self.display, offset = render_scroll)
-
-            # Update and Render Projectiles
-            self.process_projectiles(offset = render_scroll)
-
-
-            # Update and render sparks
-            for spark in self.sparks.copy():
-                kill = spark.update()
-                spark.render(self.display, offset = render_scroll)
-                if kill:
-                    self.sparks.remove(spark)
-
-            # Render the "outline" effect:
-            # this logic generates a surface with black "sillhouettes" everywhere we rendered graphics onto display
-            display_mask = pygame.mask.from_surface(self.display) # create a mask from the display
-            display_sillhouette = display_mask.to_surface(setcolor=(0,0,0,180), unsetcolor=(0,0,0,0)) # turn the mask into a surface
-
-            for offset in [(1,0), (-1,0), (0,-1), (0,1)]:
-                self.display_2.blit(display_sillhouette,offset) # render the sillhouette onto the game graphics display
-
-            # Update and Render Particles
-            for particle in self.particles.copy(): # work with a copy of the particles list because we are removing items!
-                kill = particle.update() # update particle and check if it is EOL
-                particle.render(self.display,offset = render_scroll) # render each particle
-                if particle.type == 'leaf':
-                    particle.pos[0] += math.sin(particle.animation.frame * 0.035) * 0.3 # add some oscillations in x-axis movement
-
-                if kill: self.particles.remove(particle) # remove EOL particles
-
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
+            profiler.begin('wait')
+            elapsed = self.clock.tick(self.render_fps) # time since the last frame (this also caps the frame rate)
+            profiler.end('wait')
+            profiler.frame()
+
+            # While paused the last frame stays on the screen and nothing gets updated or presented
+            if self.paused:
+                self.pause_events()
+                self.presenter.present(self.display_2, dirty = [])
+                continue
+
+            profiler.begin('events')
+            self.handle_events()
+            profiler.end('events')
+
+            # Run the simulation for however many fixed ticks fit in the time since the last frame (can be none)
+            for i in range(self.timestep.advance(elapsed)):
+                self.step(self.next_inputs())
+
+            # Render the game part of the way between the last two ticks
+            self.render(self.timestep.alpha())
+
+    # Run one tick of the simulation with the given inputs (a combination of the flags in scripts/inputs.py).
+    # This doesn't render or wait, so a headless game runs as fast as the simulation allows
+    def step(self, inputs = 0):
+        if self.recording is not None:
+            self.recording.record(inputs)
+        self.inputs = inputs
+        self.update()
+
+    # inputs for the next tick: from the replay while one is playing, otherwise from the keyboard
+    def next_inputs(self):
+        if self.replay is not None:
+            if not self.replay.done():
+                return self.replay.next()
+            self.finish_replay()
+        inputs = (LEFT if self.movement[0] else 0) | (RIGHT if self.movement[1] else 0) | self.pressed
+        self.pressed = 0
+        return inputs
+
+    # Start a session that can be recorded or replayed: the global random module is seeded, and the player and the
+    # level start from scratch
+    def reset(self, level_id = 0, seed = None):
+        if seed is not None:
+            random.seed(seed)
+        self.player = Player(self,(50,50),(8,15))
+        self.movement = [False,False]
+        self.pressed = 0
+        self.screenshake = 0
+        self.level = level_id
+        self.load_level(level_id)
+
+    # start a new session and record it, the recording gets saved to path when the game quits
+    def start_recording(self, path, level_id = 0, seed = None):
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(63)
+        self.reset(level_id, seed)
+        self.recording = Recording(level_id, seed)
+        self.recording_path = path
+
+    # play a recording from the start. fast_forward ticks are simulated straight away without rendering
+    # (e.g. to get to a reported frame time spike quickly)
+    def start_replay(self, recording, fast_forward = 0):
+        self.reset(recording.level, recording.seed)
+        self.replay = Replay(recording)
+        while fast_forward > 0 and not self.replay.done():
+            self.step(self.replay.next())
+            fast_forward -= 1
+
+    # the replay ran out of inputs: check that it played out the same way, then hand control back to the keyboard
+    def finish_replay(self):
+        matched = self.replay.matches(self)
+        if matched is not None:
+            print('replay finished after ' + str(self.replay.tick) + ' ticks: ' + ('matches the recording' if matched else 'DIVERGED from the recording'))
+        self.replay = None
+
+    # ============ Simulation Tick ===================#
+    # Everything that changes the state of the game. This runs exactly TICK_RATE times per second of game time
+    def update(self):
+        profiler = self.profiler
+        profiler.begin('tick')
+
+        # Remember where everything was before this tick (for interpolated rendering)
+        self.prev_scroll[0] = self.scroll[0]
+        self.prev_scroll[1] = self.scroll[1]
+        self.player.start_tick()
+        for enemy in self.activation.awake:
+            enemy.start_tick()
+
+        # Apply the jumps and dashes that were pressed since the last tick
+        if self.inputs & JUMP:
+            if self.player.jump():
+                self.sfx['jump'].play()
+        if self.inputs & DASH:
+            self.player.dash()
+
+        # Increment screen shake timer
+        self.screenshake = max(0, self.screenshake - 1)
+
+        # Check if all the enemies are gone
+        if not len(self.enemies):
+            self.transition += 1
+            # Load the next level
+            if self.transition > 30:
+                self.level = min(self.level + 1, self.level_count-1)
+                self.load_level(self.level)
+        if self.transition < 0:
+            self.transition += 1
+
+        # Restart the level if the player dies
+        if self.dead:
+            self.dead += 1
+            if self.dead >= 10:
+                self.transition = min(30, self.transition + 1) # cap at 30 to prevent level transition from occuring outside of self.dead counter
+            if self.dead > 60:
+                self.load_level(self.level)
+
+        # Move the Camera
+        self.scroll[0] += (self.player.rect().centerx - self.display.get_width() / 2 - self.scroll[0]) / 2
+        self.scroll[1] += (self.player.rect().centery - self.display.get_height() / 2 - self.scroll[1]) / 2
+
+        # Spawn Particles
+        for rect in self.leaf_spawners:
+            # Note: spawn rate of particles is proportional to the size of the particle emitter rectangle
+            if random.random() * 49999 < rect.width * rect.height: 
+                pos = (rect.x + random.random() * rect.width, rect.y + random.random() * rect.height)
+                self.particles.add('leaf', pos, velocity = [-0.1, 0.3], frame = random.randint(0,20))
+
+        # Update the level / environment
+        self.clouds.update() # move the clouds
+
+        # Update the enemies (only the ones near the camera are awake, the others sleep)
+        profiler.begin('enemies')
+        view = (self.scroll[0], self.scroll[1], self.display.get_width(), self.display.get_height())
+        for enemy, kill in self.physics.update_enemies(self.activation.update(view, self.tilemap), self.tilemap, self.player):
+            if kill:
+                self.enemies.remove(enemy)
+                self.activation.remove(enemy)
+            else:
+                self.activation.moved(enemy)
+        profiler.end('enemies')
+
+        # Update the player (if they have not died)
+        profiler.begin('player')
+        if not self.dead:
+            self.player.update(self.tilemap, (2*(bool(self.inputs & RIGHT) - bool(self.inputs & LEFT)),0))
+        profiler.end('player')
+
+        # Update Projectiles
+        profiler.begin('projectiles')
+        self.process_projectiles()
+        profiler.end('projectiles')
+
+        # Update sparks and particles (all particles are updated at once, including the swaying of leaves)
+        profiler.begin('effects')
+        self.sparks.update()
+        self.particles.update()
+        profiler.end('effects')
+
+        profiler.end('tick')
+
+    # ============ Rendering ===================#
+    # Draw the current state of the game. alpha is how far this frame is between the previous tick and the latest one;
+    # the camera, entities and projectiles are drawn at their interpolated positions
+    def render(self, alpha = 1):
+        profiler = self.profiler
+        profiler.begin('render')
+
+        # Render the base background
+        profiler.begin('background')
+        self.display.fill((0,0,0,0)) # fill display with transparant background
+        self.display_2.blit(self.resources.background(self.display.get_size()),(0,0)) # background is only scaled once
+
+        scroll = (self.prev_scroll[0] + (self.scroll[0] - self.prev_scroll[0]) * alpha, self.prev_scroll[1] + (self.scroll[1] - self.prev_scroll[1]) * alpha)
+        render_scroll = (int(scroll[0]),int(scroll[1])) # integer version of scroll position
+
+        # Render the level / environment
+        self.clouds.render(self.display_2, offset = render_scroll) # render the clouds (render on display_2 to prevent adding the outline)
+        profiler.end('background')
+
+        profiler.begin('tilemap')
+        chunks_drawn = self.tilemap.render(self.display, offset = render_scroll) # render tilemap objects
+        profiler.end('tilemap')
+
+        # Render the enemies
+        profiler.begin('entities')
+        for enemy in self.activation.awake: # (sleeping enemies are all off screen)
+            enemy.render(self.display, offset = enemy.lerp_offset(render_scroll, alpha))
+
+        # Render the player (if they have not died)
+        if not self.dead:
+            self.player.render(self.display, offset = self.player.lerp_offset(render_scroll, alpha))
+        profiler.end('entities')
+
+        # Render Projectiles and sparks
+        profiler.begin('shots')
+        self.projectiles.render(self.display, offset = render_scroll, alpha = alpha)
+        self.sparks.render(self.display, offset = render_scroll)
+        profiler.end('shots')
+
+        # Render the "outline" effect:
+        # black "sillhouettes" of everything we rendered onto display get drawn around it onto display_2
+        profiler.begin('outline')
+        self.outline.apply(self.display, self.display_2)
+        profiler.end('outline')
+
+        # Render Particles
+        profiler.begin('particles')
+        self.particles.render(self.display, offset = render_scroll)
+        profiler.end('particles')
+
+        # Draw a circle for transitions
+        if self.transition:
+            # the circle for each step of the transition is only drawn once, then reused
+            self.display.blit(self.resources.iris(self.display.get_size(), self.transition),(0,0))
+
+        # Handle screen shake rendering
+        screenshake_offset = (self.fx_random.random() * self.screenshake - self.screenshake / 2, self.fx_random.random() * self.screenshake - self.screenshake / 2 )
+
+        # Render the game graphics onto an up-scaled display
+        self.display_2.blit(self.display, (0,0)) # add nominal graphics onto the game display
+        profiler.end('render')
+
+        if profiler.enabled:
+            profiler.count('enemies', len(self.enemies))
+            profiler.count('awake', len(self.activation.awake))
+            profiler.count('projectiles', len(self.projectiles))
+            profiler.count('particles', len(self.particles))
+            profiler.count('sparks', len(self.sparks))
+            profiler.count('chunks', chunks_drawn)
+            # images blitted this frame: tile chunks, clouds, enemies and their guns, the player, projectiles, particles
+            profiler.count('blits', chunks_drawn + len(self.clouds.clouds) + 2 * len(self.activation.awake) + 1 + len(self.projectiles) + len(self.particles))
+            profiler.render(self.display_2)
+
+        profiler.begin('present')
+        self.presenter.present(self.display_2, screenshake_offset) # (a whole frame, see scripts/present.py)
+        profiler.end('present')
+
+    # ===== Handle User Inputs ===== #
+    # Movement keys are held down, so the ticks just read self.movement. Jumps and dashes are remembered in self.pressed
+    # and applied at the start of the next tick (see next_inputs)
+    def handle_events(self):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self.quit()
+
+            if event.type == pygame.KEYDOWN:
+                
+                # Horizontal Movement Detection (This input detection logic is similar to axis() in unity)
+                if event.key == pygame.K_LEFT or event.key == pygame.K_a:
+                    self.movement[0] = True
+                if event.key == pygame.K_RIGHT or event.key == pygame.K_d:
+                    self.movement[1] = True
+
+                # Handle Jumping (Allows multiple jumps)
+                if (event.key == pygame.K_UP or event.key == pygame.K_w):
+                    self.pressed |= JUMP
+
+                # Handle Dashing
+                if event.key == pygame.K_x:
+                    self.pressed |= DASH
+
+                # Pause the game
+                if event.key == pygame.K_p:
+                    self.paused = True
+
+                # Cycle the quality of the outline effect
+                if event.key == pygame.K_F2:
+                    self.outline.toggle()
+
+                # Show / hide the profiler, and save what it has measured
+                if event.key == pygame.K_F3:
+                    self.profiler.toggle()
+                if event.key == pygame.K_F4:
+                    self.profiler.export(self.profile_path)
+
+                # Handle exit via escape key
+                if event.key == pygame.K_ESCAPE:
                     self.quit()
-
-            # ===== Handle User Inputs ===== #
-                if event.type == pygame.KEYDOWN:
-                    
-                    # Horizontal Movement Detection (This input detection logic is similar to axis() in unity)
-                    if event.key == pygame.K_LEFT or event.key == pygame.K_a:
-                        self.movement[0] = True
-                    if event.key == pygame.K_RIGHT or event.key == pygame.K_d:
-                        self.movement[1] = True
-
-                    # Handle Jumping (Allows multiple jumps)
-                    if (event.key == pygame.K_UP or event.key == pygame.K_w):
-                        if self.player.jump():
-                            self.sfx['jump'].play()
-
-                    # Handle Dashing
-                    if event.key == pygame.K_x:
-                        self.player.dash()
-
-                    # Handle exit via escape key
-                    if event.key == pygame.K_ESCAPE:
-                        self.quit()
-                    
-
-                if event.type == pygame.KEYUP:
-                    if event.key == pygame.K_LEFT or event.key == pygame.K_a:
-                        self.movement[0] = False
-                    if event.key == pygame.K_RIGHT or event.key == pygame.K_d:
-                        self.movement[1] = False
-
-            # Draw a circle for transitions
-            if self.transition:
-                # Note that this draw operation is a bit computationally expensive
-                transition_surf = pygame.Surface(self.display.get_size())
-                pygame.draw.circle(transition_surf, (255, 255, 255), (self.display.get_width()//2, self.display.get_height()//2), (30 - abs(self.transition))*int(self.display.get_width()/30))
-                transition_surf.set_colorkey((255,255,255)) # this makes the color white transparent on this surface
-                self.display.blit(transition_surf,(0,0))
-
-            # Handle screen shake rendering
-            screenshake_offset = (random.random() * self.screenshake - self.screenshake / 2, random.random() * self.screenshake - self.screenshake / 2 )
-
-            # Render the game graphics onto an up-scaled display
-            self.display_2.blit(self.display, (0,0)) # add nominal graphics onto the game display
-            self.screen.blit(pygame.transform.scale(self.display_2, self.screen.get_size()),screenshake_offset)
-            pygame.display.update()
-            self.clock.tick(60)
+                
+
+            if event.type == pygame.KEYUP:
+                if event.key == pygame.K_LEFT or event.key == pygame.K_a:
+                    self.movement[0] = False
+                if event.key == pygame.K_RIGHT or event.key == pygame.K_d:
+                    self.movement[1] = False
+
+    # Handle the inputs while the game is paused
+    def pause_events(self):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self.quit()
+            if event.type == pygame.WINDOWEXPOSED:
+                self.presenter.invalidate() # the window has to be drawn again
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_p:
+                    self.paused = False
+                if event.key == pygame.K_ESCAPE:
+                    self.quit()
+            # keep track of keys that are let go while paused
+            if event.type == pygame.KEYUP:
+                if event.key == pygame.K_LEFT or event.key == pygame.K_a:
+                    self.movement[0] = False
+                if event.key == pygame.K_RIGHT or event.key == pygame.K_d:
+                    self.movement[1] = False
 
     def quit(self):
+        if self.profiler.enabled:
+            self.profiler.export(self.profile_path)
+        if self.recording is not None:
+            self.recording.digest = state_digest(self)
+            self.recording.save(self.recording_path)
         pygame.quit()
         sys.exit()
 
-    def process_projectiles(self,offset=(0,0)):
-        # Update and Render Projectiles
-            # Projectiles is a list of all the projectiles in the game.
-            # Each projectile is a 3-Dimensional list with the following data:
-            # [[x,y], direction, timer]
-            # Based on how Python handles lists, here are some tips:
-            # projectile[0][0] is the x-coordinate
-            # projectile[0][1] is the y-coordinate
-            # projectile[1] is the velocity
-            # projectile[2] is the number of frames that projectile has existed
-            for projectile in self.projectiles.copy():
-                projectile[0][0] += projectile[1]
-                projectile[2] += 1
-                img = self.assets['projectile']
-                self.display.blit(img,(projectile[0][0]-img.get_width() / 2 - offset[0], \
-                                  projectile[0][1] - img.get_height() / 2 - offset[1]))
-                if self.tilemap.solid_check(projectile[0]):
-                    self.projectiles.remove(projectile)
-                    # Spawn spark particles upon collision with a wall
-                    for i in range(4):
-                        self.sparks.append(Spark(projectile[0], random.random() - 0.5 + (math.pi if projectile[1]>0 else 0) , 2 + random.random() ))
-                elif projectile[2] > 360:
-                    self.projectiles.remove(projectile)
-
-                # Logic for player collision with projectile
-                elif abs(self.player.dashing) < 50 and not self.dead: # if the player is not in a dash or already dead
-                    if self.player.rect().collidepoint(projectile[0]):
-                        self.projectiles.remove(projectile)
-                        self.dead += 1 # take damage
-                        self.screenshake = max(25,self.screenshake) # this prevents a larger screen shake from being overwritten by a smaller one
-                        # Play death sound
-                        self.sfx['hit'].play()
-                        # Spawn a mess of particles
-                        for i in range(30):
-                            angle = random.random() * math.pi * 2
-                            speed = random.random() * 5
-                            self.sparks.append(Spark(self.player.rect().center,angle, 2 + random.random()))
-                            self.particles.append(Particle(self, 'particle', self.player.rect().center, \
-                                                   velocity=[math.cos(angle+math.pi) * speed * 0.5, \
-                                                             math.sin(angle+math.pi) * speed * 0.5], frame = random.randint(0,7)))
+    def process_projectiles(self):
+        # Update Projectiles
+            # Projectiles are stored in arrays inside self.projectiles (see scripts/projectile.py), which moves all of them,
+            # removes the ones that expire and checks them against the tilemap and the player in one batch.
+            # The player can only be hit if they are not in a dash or already dead
+            can_hit_player = abs(self.player.dashing) < 50 and not self.dead
+            wall_hits, player_hit = self.projectiles.update(self.tilemap, self.player.rect() if can_hit_player else None)
+
+            # Spawn spark particles upon collision with a wall
+            for x, y, velocity in wall_hits:
+                for i in range(4):
+                    self.sparks.add((x, y), random.random() - 0.5 + (math.pi if velocity>0 else 0) , 2 + random.random())
+
+            # Logic for player collision with projectile
+            if player_hit is not None:
+                self.dead += 1 # take damage
+                self.screenshake = max(25,self.screenshake) # this prevents a larger screen shake from being overwritten by a smaller one
+                # Play death sound
+                self.sfx['hit'].play()
+                # Spawn a mess of particles
+                for i in range(30):
+                    angle = random.random() * math.pi * 2
+                    speed = random.random() * 5
+                    self.sparks.add(self.player.rect().center,angle, 2 + random.random())
+                    self.particles.add('particle', self.player.rect().center, \
+                                       velocity=[math.cos(angle+math.pi) * speed * 0.5, \
+                                                 math.sin(angle+math.pi) * speed * 0.5], frame = random.randint(0,7))
         
     def load_level(self,map_id):
-        # Load the tilemap
-        self.tilemap.load('data/maps/' + str(map_id) + '.json')
+        # Get the level from the level cache (it is only read from disk the first time) and restore the tilemap from it
+        level = self.levels.get(map_id)
+        self.tilemap.restore(level)
+
+        # Start loading the next level in the background while this one is being played
+        if map_id + 1 < self.level_count:
+            self.levels.preload(map_id + 1)
 
         # ===== Initilize the Level ===== #
 
@@ -293,6 +533,7 @@ class Game:
         
         # initialize camera position
         self.scroll = [0,0] # create a list representing the camera position
+        self.prev_scroll = [0,0] # camera position at the start of the latest tick
 
         # Game Over State
         self.dead = 0
@@ -300,33 +541,50 @@ class Game:
         # Scene transition counter
         self.transition = -30
 
-        # initilize leaf particle spawners
-        self.leaf_spawners = []
-        # Create rectangles representing leaf spawning areas of all the trees
-        for tree in self.tilemap.extract([('large_decor',2)], keep=True):
-                self.leaf_spawners.append(pygame.Rect(4 + tree['pos'][0], 4 + tree['pos'][1], 23, 13))
+        # initilize leaf particle spawners (rectangles representing leaf spawning areas of all the trees)
+        self.leaf_spawners = [pygame.Rect(rect) for rect in level.leaf_spawners]
 
-        # initilize list of particles for particle controllers
-        self.particles = []
-        self.sparks = []
+        # clear out the particles and sparks
+        self.particles.clear()
+        self.sparks.clear()
 
         # initialize list of enemies
         self.enemies = []
         
-        # initialize list of projectiles
-        self.projectiles = []
+        # clear out the projectiles
+        self.projectiles.clear()
         
 
-        # Spawn player and enemies by looping over all spawners in the level
-        for spawner in self.tilemap.extract([('spawners',0), ('spawners',1)],keep=False):
-            if spawner['variant'] == 0:
-                self.player.pos = spawner['pos'] # move the player to the starting position
+        # Spawn player and enemies by looping over all spawners in the level (the spawners were taken out of the map when it was loaded)
+        for variant, pos in level.spawners:
+            if variant == 0:
+                self.player.pos = list(pos) # move the player to the starting position
                 self.player.air_time = 0
                 self.player.dashing = 0
                 self.player.velocity = [0,0]
                 self.player.flip = False
             else:
                 # Spawn enemies
-                self.enemies.append(Enemy(self,spawner['pos'],(8,15)))
-
-Game().run()
\ No newline at end of file
+                self.enemies.append(Enemy(self,pos,(8,15)))
+        self.activation.reset(self.enemies)
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description = 'ninja game')
+    parser.add_argument('--record', metavar = 'PATH', help = 'record the session to this file (saved when the game quits)')
+    parser.add_argument('--replay', metavar = 'PATH', help = 'play back a recorded session')
+    parser.add_argument('--fast-forward', type = int, default = 0, metavar = 'TICKS', help = 'skip this many ticks of the replay without rendering')
+    parser.add_argument('--level', type = int, default = 0, help = 'level to record from')
+    parser.add_argument('--seed', type = int, help = 'random seed of the recording (random by default)')
+    parser.add_argument('--profile', metavar = 'PATH', help = 'turn the profiler on and save it to this .csv or .json file when the game quits')
+    args = parser.parse_args()
+
+    game = Game()
+    if args.profile:
+        game.profile_path = args.profile
+        game.profiler.toggle()
+    if args.replay:
+        game.start_replay(load_recording(args.replay), args.fast_forward)
+    elif args.record:
+        game.start_recording(args.record, args.level, args.seed)
+    game.run()
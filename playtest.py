@@ -0,0 +1,182 @@
+import os
+import sys
+import json
+import random
+import argparse
+import statistics
+from multiprocessing import Pool
+from scripts.inputs import LEFT, RIGHT, JUMP, DASH
+from scripts.timestep import TICK_RATE
+
+# ============ Playtest Farm ===================#
+# Plays every level many times with the headless game (see Game.step) to check that the levels can be cleared,
+# and how often and how quickly. Episodes are spread over a pool of worker processes (one per core by default), each
+# with its own headless Game. Every episode seeds the global random module (which the enemies and effects use) and
+# its own input generator from the level id and the episode seed, so any single run can be reproduced exactly:
+#   python playtest.py --levels 2 --seed 17 --runs 1
+# An episode ends when every enemy has been killed (cleared), or after --ticks ticks of game time (timeout). The
+# player respawns at the start of the level after dying, like in the game, and every death is counted.
+
+# Random player: holds a direction for a while, and presses jump and dash every so often
+class RandomInputs:
+    def __init__(self, rng):
+        self.rng = rng
+        self.direction = 0
+        self.hold = 0 # ticks left before picking a new direction
+
+    def next(self):
+        if self.hold <= 0:
+            self.direction = self.rng.choice((LEFT, RIGHT, RIGHT, 0)) # slightly biased towards moving right
+            self.hold = self.rng.randint(10, 90)
+        self.hold -= 1
+        inputs = self.direction
+        if self.rng.random() < 0.08:
+            inputs |= JUMP
+        if self.rng.random() < 0.03:
+            inputs |= DASH
+        return inputs
+
+# ============ Worker Process ===================#
+worker_game = None # every worker process builds one headless game and reuses it for all of its episodes
+
+def start_worker():
+    global worker_game
+    from game import Game
+    worker_game = Game(headless = True)
+    worker_game.levels.preload_enabled = False # episodes jump between levels, so preloading the next one is wasted work
+
+def run_episode(episode):
+    level_id, seed, max_ticks = episode
+    game = worker_game
+    inputs = RandomInputs(random.Random('inputs:%d:%d' % (level_id, seed)))
+
+    result = {'level': level_id, 'seed': seed, 'outcome': 'timeout', 'ticks': max_ticks, 'deaths': 0}
+    try:
+        game.reset(level_id, '%d:%d' % (level_id, seed)) # fresh start on the level, with the global random module seeded
+        enemies = game.enemies # enemies are removed from this list when they die
+        spawned = list(enemies) # every enemy in spawn order
+        killed = [False] * len(spawned) # which of them have been killed in any of the player's lives
+        live = len(spawned) # how many of them are still alive in the current life
+        tile_size = game.tilemap.tile_size
+        visited = set() # tiles the player has been in
+        was_dead = False
+
+        for tick in range(max_ticks):
+            game.step(inputs.next())
+
+            # count each death once (the game keeps counting up while the player is dead)
+            if game.dead and not was_dead:
+                result['deaths'] += 1
+            was_dead = bool(game.dead)
+            if not game.dead:
+                visited.add((int(game.player.pos[0] // tile_size), int(game.player.pos[1] // tile_size)))
+
+            # restarting the level after a death spawns a new list of enemies (in the same order)
+            if game.enemies is not enemies:
+                enemies = game.enemies
+                spawned = list(enemies)
+                live = len(spawned)
+            elif len(enemies) < live:
+                for i, enemy in enumerate(spawned):
+                    if enemy is not None and enemy not in enemies:
+                        killed[i] = True
+                        spawned[i] = None
+                live = len(enemies)
+
+            # the level is cleared once every enemy is gone (the game then moves on to the next level)
+            if not game.enemies and not game.dead:
+                result['outcome'] = 'cleared'
+                result['ticks'] = tick + 1
+                break
+
+        if result['outcome'] == 'cleared':
+            killed = [True] * len(killed)
+        result['killed'] = killed
+        result['visited'] = sorted(visited)
+    except Exception as e: # report broken levels instead of stopping the whole sweep
+        result['outcome'] = 'error'
+        result['error'] = type(e).__name__ + ': ' + str(e)
+        result['killed'] = []
+        result['visited'] = []
+    return result
+
+# ============ Report ===================#
+def summarize(results):
+    levels = {}
+    for result in results:
+        levels.setdefault(result['level'], []).append(result)
+
+    report = {}
+    for level_id, runs in sorted(levels.items()):
+        cleared = [run for run in runs if run['outcome'] == 'cleared']
+        clear_times = [run['ticks'] / TICK_RATE for run in cleared]
+        enemy_count = max(len(run['killed']) for run in runs)
+        kill_rates = [sum(run['killed'][i] for run in runs if i < len(run['killed'])) / len(runs) for i in range(enemy_count)]
+        visited = set()
+        for run in runs:
+            visited.update(map(tuple, run['visited']))
+        report[level_id] = {
+            'runs': len(runs),
+            'cleared': len(cleared),
+            'errors': sorted(set(run['error'] for run in runs if run['outcome'] == 'error')),
+            'clear_rate': len(cleared) / len(runs),
+            'clear_time_median': statistics.median(clear_times) if clear_times else None, # seconds of game time
+            'clear_time_mean': statistics.mean(clear_times) if clear_times else None,
+            'deaths_per_run': statistics.mean(run['deaths'] for run in runs),
+            'enemy_kill_rates': kill_rates, # fraction of runs that killed each enemy (0 may mean it can't be reached)
+            'tiles_visited': len(visited),
+        }
+    return report
+
+def print_report(report, elapsed):
+    print('level   runs  cleared  clear time (median / mean)  deaths/run  tiles visited  never killed')
+    for level_id, stats in report.items():
+        if stats['clear_time_median'] is None:
+            clear_time = '-'
+        else:
+            clear_time = '%.1fs / %.1fs' % (stats['clear_time_median'], stats['clear_time_mean'])
+        never_killed = [i for i, rate in enumerate(stats['enemy_kill_rates']) if rate == 0]
+        print('%5d  %5d  %6.1f%%  %26s  %10.2f  %13d  %s' % (level_id, stats['runs'], stats['clear_rate'] * 100, clear_time,
+              stats['deaths_per_run'], stats['tiles_visited'], ', '.join(map(str, never_killed)) or '-'))
+        for error in stats['errors']:
+            print('       error: ' + error)
+    print('%d episodes in %.1fs' % (sum(stats['runs'] for stats in report.values()), elapsed))
+
+def main():
+    import time
+
+    parser = argparse.ArgumentParser(description = 'play every level many times with random inputs and report the results')
+    parser.add_argument('--levels', type = int, nargs = '*', help = 'level ids to test (default: every level in data/maps)')
+    parser.add_argument('--runs', type = int, default = 100, help = 'episodes per level')
+    parser.add_argument('--seed', type = int, default = 0, help = 'seed of the first episode (the others count up from it)')
+    parser.add_argument('--ticks', type = int, default = TICK_RATE * 180, help = 'longest an episode can last, in ticks')
+    parser.add_argument('--workers', type = int, default = os.cpu_count(), help = 'number of worker processes')
+    parser.add_argument('--json', help = 'also write the report (and every episode) to this file')
+    args = parser.parse_args()
+
+    levels = args.levels
+    if not levels:
+        levels = sorted(int(name[:-5]) for name in os.listdir('data/maps') if name.endswith('.json'))
+    episodes = [(level_id, args.seed + run, args.ticks) for level_id in levels for run in range(args.runs)]
+
+    start = time.time()
+    pool = Pool(args.workers, initializer = start_worker)
+    results = pool.map(run_episode, episodes, chunksize = max(1, len(episodes) // (args.workers * 8)))
+    pool.close()
+    pool.join()
+    elapsed = time.time() - start
+
+    report = summarize(results)
+    print_report(report, elapsed)
+    if args.json:
+        f = open(args.json, 'w')
+        json.dump({'report': {str(level_id): stats for level_id, stats in report.items()},
+                   'episodes': [{key: value for key, value in result.items() if key != 'visited'} for result in results]}, f, indent = 1)
+        f.close()
+
+    # fail (e.g. on CI) if any episode crashed
+    if any(stats['errors'] for stats in report.values()):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
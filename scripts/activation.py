@@ -0,0 +1,135 @@
+ACTIVATION_MARGIN = 192 # enemies this far outside the camera view (in pixels) or closer are fully simulated
+ACTIVATION_CELL = 128 # size of the grid cells enemies are bucketed into (pixels)
+COARSE_INTERVAL = 30 # sleeping enemies take one coarse step every this many ticks
+
+# what happens to enemies that are asleep
+SLEEP_NONE = 0 # nobody sleeps: every enemy is simulated every tick (the original behaviour)
+SLEEP_FROZEN = 1 # sleeping enemies don't move at all
+SLEEP_COARSE = 2 # sleeping enemies keep walking their patrol in big cheap steps (see coarse_step)
+
+# ============ Enemy Activation ===================#
+# Only the enemies near the camera are awake: they get the full update (physics, the ledge probe, the random walk
+# timer, shooting at the player) and get drawn. Everyone else sleeps, so the cost of a tick follows the number of
+# enemies around the player instead of the number of enemies in the level.
+# Enemies are bucketed into a grid of ACTIVATION_CELL sized cells, so finding the awake ones only looks at the cells
+# around the camera. The awake enemies always come back in spawn order, which keeps the simulation deterministic
+# (enemies draw from the global random module, see scripts/replay.py).
+# The margin has to be bigger than the screen plus an enemy, so every enemy that is on screen is awake. Enemies only
+# fall asleep standing on the ground, and a new level starts with every enemy awake so they can land first. Sleeping
+# enemies can't shoot, so the player can't be shot from further than the margin (the game never relied on that).
+
+class EnemyActivation:
+    def __init__(self, margin = ACTIVATION_MARGIN, sleep = SLEEP_COARSE, cell_size = ACTIVATION_CELL, coarse_interval = COARSE_INTERVAL):
+        self.margin = margin
+        self.sleep = sleep
+        self.cell_size = cell_size
+        self.coarse_interval = coarse_interval
+        self.reset([])
+
+    # start tracking a new list of enemies (when a level is loaded)
+    def reset(self, enemies):
+        self.enemies = list(enemies) # every live enemy, in spawn order
+        self.cells = {} # (cell x, cell y) -> {spawn index: enemy}
+        self.entries = {} # id(enemy) -> [spawn index, cell]
+        self.groups = [[] for i in range(self.coarse_interval)] # enemies take their coarse steps in turns, spread over the interval
+        self.awake = list(enemies) # enemies that were simulated in the latest tick, in spawn order
+        self.awake_ids = set(map(id, enemies))
+        self.ticks = 0
+        for index, enemy in enumerate(enemies):
+            cell = self.cell_of(enemy)
+            self.entries[id(enemy)] = [index, cell]
+            self.cells.setdefault(cell, {})[index] = enemy
+            self.groups[index % self.coarse_interval].append(enemy)
+
+    def cell_of(self, enemy):
+        return (int(enemy.pos[0] // self.cell_size), int(enemy.pos[1] // self.cell_size))
+
+    # the enemy may have moved into another cell
+    def moved(self, enemy):
+        entry = self.entries[id(enemy)]
+        cell = self.cell_of(enemy)
+        if cell != entry[1]:
+            bucket = self.cells[entry[1]]
+            del bucket[entry[0]]
+            if not bucket:
+                del self.cells[entry[1]]
+            self.cells.setdefault(cell, {})[entry[0]] = enemy
+            entry[1] = cell
+
+    def remove(self, enemy):
+        index, cell = self.entries.pop(id(enemy))
+        bucket = self.cells[cell]
+        del bucket[index]
+        if not bucket:
+            del self.cells[cell]
+        self.groups[index % self.coarse_interval].remove(enemy)
+        self.enemies.remove(enemy)
+        if id(enemy) in self.awake_ids:
+            self.awake_ids.discard(id(enemy))
+            self.awake = [other for other in self.awake if other is not enemy] # (a new list, the old one may be getting looped over)
+
+    # ============ Ticks ===================#
+    # work out which enemies are awake this tick, for a camera view (x, y, w, h in pixels), and give the sleeping ones
+    # their coarse steps. Returns the awake enemies in spawn order
+    def update(self, view, tilemap):
+        self.ticks += 1
+        if self.sleep == SLEEP_NONE:
+            self.awake = list(self.enemies)
+            self.awake_ids = set(map(id, self.awake))
+            return self.awake
+
+        # every enemy whose position is within the margin around the view
+        left = view[0] - self.margin
+        top = view[1] - self.margin
+        right = view[0] + view[2] + self.margin
+        bottom = view[1] + view[3] + self.margin
+        size = self.cell_size
+        found = []
+        for cx in range(int(left // size), int(right // size) + 1):
+            for cy in range(int(top // size), int(bottom // size) + 1):
+                bucket = self.cells.get((cx, cy))
+                if bucket:
+                    for index, enemy in bucket.items():
+                        if left <= enemy.pos[0] < right and top <= enemy.pos[1] < bottom:
+                            found.append((index, enemy))
+        # enemies that were awake and haven't landed yet stay awake until they do (sleeping enemies have no gravity,
+        # so they would be left hanging in the air, e.g. enemies that spawn above the ground far away from the player)
+        for enemy in self.awake:
+            if not enemy.collisions['down'] and not (left <= enemy.pos[0] < right and top <= enemy.pos[1] < bottom):
+                found.append((self.entries[id(enemy)][0], enemy))
+        found.sort(key = lambda pair: pair[0])
+        awake = [enemy for index, enemy in found]
+        awake_ids = set(map(id, awake))
+
+        # enemies that just woke up haven't been keeping track of where they were before the tick
+        for enemy in awake:
+            if id(enemy) not in self.awake_ids:
+                enemy.start_tick()
+        self.awake = awake
+        self.awake_ids = awake_ids
+
+        if self.sleep == SLEEP_COARSE:
+            for enemy in self.groups[self.ticks % self.coarse_interval]:
+                if id(enemy) not in awake_ids:
+                    self.coarse_step(enemy, tilemap, self.coarse_interval)
+                    self.moved(enemy)
+        return awake
+
+    # Advance a sleeping enemy by a number of ticks at once: it keeps walking (turning around at walls and ledges,
+    # using the same probe as Enemy.update) until its walk timer runs out, but it has no physics and never shoots
+    # or uses random numbers (so sleeping enemies don't change the random numbers the awake ones get)
+    def coarse_step(self, enemy, tilemap, ticks):
+        if enemy.walking:
+            steps = min(ticks, enemy.walking)
+            direction = -1 if enemy.flip else 1
+            x = enemy.pos[0] + direction * 0.5 * steps
+            rect = enemy.bounds_rect()
+            center_x = x + rect.width // 2
+            center_y = rect.centery
+            # turn around instead of walking into a wall or off a ledge
+            if tilemap.solid_check((center_x + direction * rect.width // 2, center_y)) or not tilemap.solid_check((center_x + direction * 7, center_y + 23)):
+                enemy.flip = not enemy.flip
+            else:
+                enemy.pos[0] = x
+            enemy.walking -= steps
+            enemy.start_tick()
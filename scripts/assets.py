@@ -0,0 +1,180 @@
+import pygame
+import os
+import struct
+import hashlib
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from scripts.utils import BASE_IMG_PATH
+
+ATLAS_CACHE_PATH = 'data/cache/images.atlas'
+ATLAS_MAGIC = b'NJAT'
+ATLAS_VERSION = 1
+ATLAS_HEADER = struct.Struct('<4sH20sI') # magic, version, fingerprint of the source images, number of images
+ATLAS_ENTRY = struct.Struct('<HHH') # length of the image path, width, height (followed by the path and the RGB pixels)
+
+# ============ Asset Loader ===================#
+# Decodes the PNGs under data/images on a pool of threads (pygame releases the GIL while decoding), then
+# converts them on the main thread (convert() needs the display). Every image is packed into a single binary
+# atlas file of raw pixels, so the next launch (of the game or the editor) only needs one file read and no PNG
+# decoding. The atlas is rebuilt whenever an image is added, removed or modified.
+# Images are only turned into surfaces when a group of them is first asked for (load_group): prepare() just reads
+# the atlas and indexes where each image's pixels are. Only when the atlas has to be rebuilt does every image get
+# decoded up front.
+
+# decode an image file without converting it (safe to run on a worker thread)
+def decode_image(path):
+    return pygame.image.load(BASE_IMG_PATH + path)
+
+# finish loading a decoded image the same way as load_image does
+def finish_image(img):
+    img = img.convert()
+    img.set_colorkey((0,0,0))
+    return img
+
+class AssetLoader:
+    def __init__(self, cache_path = ATLAS_CACHE_PATH, workers = None):
+        self.cache_path = cache_path
+        self.workers = workers # number of decoding threads (None lets the thread pool decide)
+        self.surfaces = {} # image path (relative to BASE_IMG_PATH) -> loaded surface
+        self.atlas = None # contents of the atlas file, once prepare() found it up to date
+        self.atlas_index = {} # image path -> (offset, width, height) of its pixels in the atlas
+
+    # all the image paths in a folder (relative to BASE_IMG_PATH), in the same order as load_images
+    def list_images(self, folder):
+        return [folder + '/' + name for name in sorted(os.listdir(BASE_IMG_PATH + folder))]
+
+    # every png under BASE_IMG_PATH
+    def all_images(self):
+        paths = []
+        for root, dirs, files in os.walk(BASE_IMG_PATH):
+            for name in files:
+                if name.lower().endswith('.png'):
+                    paths.append(os.path.relpath(os.path.join(root, name), BASE_IMG_PATH).replace(os.sep, '/'))
+        return sorted(paths)
+
+    # hash of the names, sizes and modification times of the source images (changes whenever the atlas is out of date)
+    def fingerprint(self, paths):
+        digest = hashlib.sha1()
+        for path in paths:
+            stat = os.stat(BASE_IMG_PATH + path)
+            digest.update(('%s:%d:%d;' % (path, stat.st_size, stat.st_mtime_ns)).encode())
+        return digest.digest()
+
+    # get ready to load images: index the atlas if it is up to date, otherwise decode every image and rebuild the atlas
+    def prepare(self):
+        paths = self.all_images()
+        fingerprint = self.fingerprint(paths)
+        if self.cache_path and self.read_atlas(fingerprint):
+            return
+        self.decode(paths)
+        if self.cache_path:
+            self.write_atlas(fingerprint, paths)
+
+    # load every image
+    def load_all(self):
+        self.prepare()
+        self.load_group(self.all_images())
+
+    # make sure a group of images is loaded (pulling them out of the atlas when they are in it), returns their surfaces
+    def load_group(self, paths):
+        missing = []
+        for path in paths:
+            if path in self.surfaces:
+                continue
+            entry = self.atlas_index.get(path)
+            if entry is not None:
+                offset, w, h = entry
+                self.surfaces[path] = finish_image(pygame.image.frombytes(bytes(self.atlas[offset:offset + w * h * 3]), (w, h), 'RGB'))
+            else:
+                missing.append(path)
+        self.decode(missing)
+        return [self.surfaces[path] for path in paths]
+
+    # decode a list of images on the thread pool
+    def decode(self, paths):
+        paths = [path for path in paths if path not in self.surfaces]
+        if not paths:
+            return
+        if len(paths) == 1:
+            self.surfaces[paths[0]] = finish_image(decode_image(paths[0]))
+            return
+        with ThreadPoolExecutor(max_workers = self.workers) as pool:
+            for path, img in zip(paths, pool.map(decode_image, paths)):
+                self.surfaces[path] = finish_image(img)
+
+    # the loader's versions of load_image and load_images (anything not loaded yet gets decoded on demand)
+    def image(self, path):
+        return self.load_group([path])[0]
+
+    def images(self, folder):
+        return self.load_group(self.list_images(folder))
+
+    # ============ Atlas Cache ===================#
+    def read_atlas(self, fingerprint):
+        try:
+            f = open(self.cache_path, 'rb')
+        except OSError:
+            return False
+        data = memoryview(f.read()) # the whole atlas comes in with one read
+        f.close()
+
+        try:
+            magic, version, atlas_fingerprint, count = ATLAS_HEADER.unpack_from(data, 0)
+            if magic != ATLAS_MAGIC or version != ATLAS_VERSION or atlas_fingerprint != fingerprint:
+                return False
+            index = {}
+            offset = ATLAS_HEADER.size
+            for i in range(count):
+                path_len, w, h = ATLAS_ENTRY.unpack_from(data, offset)
+                offset += ATLAS_ENTRY.size
+                path = bytes(data[offset:offset + path_len]).decode()
+                offset += path_len
+                index[path] = (offset, w, h) # (the pixels are only converted when the image is first used)
+                offset += w * h * 3
+            if offset > len(data):
+                return False # cut off
+        except (struct.error, ValueError, UnicodeDecodeError):
+            return False # a damaged atlas is simply rebuilt
+
+        self.atlas = data
+        self.atlas_index = index
+        return True
+
+    def write_atlas(self, fingerprint, paths):
+        chunks = [ATLAS_HEADER.pack(ATLAS_MAGIC, ATLAS_VERSION, fingerprint, len(paths))]
+        for path in paths:
+            img = self.surfaces[path]
+            encoded = path.encode()
+            chunks.append(ATLAS_ENTRY.pack(len(encoded), img.get_width(), img.get_height()))
+            chunks.append(encoded)
+            chunks.append(pygame.image.tobytes(img, 'RGB'))
+
+        # write to a temporary file and swap it in, so a crash can't leave a half written atlas behind
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok = True)
+            temp_path = self.cache_path + '.tmp'
+            f = open(temp_path, 'wb')
+            f.write(b''.join(chunks))
+            f.close()
+            os.replace(temp_path, self.cache_path)
+        except OSError:
+            pass # the cache is only an optimization
+
+# ============ Lazy Assets ===================#
+# Dictionary of assets where each entry is created by a function the first time it is accessed,
+# so groups of assets that are never used are never built.
+class LazyAssets(Mapping):
+    def __init__(self, factories):
+        self.factories = dict(factories)
+        self.loaded = {}
+
+    def __getitem__(self, key):
+        if key not in self.loaded:
+            self.loaded[key] = self.factories[key]()
+        return self.loaded[key]
+
+    def __iter__(self):
+        return iter(self.factories)
+
+    def __len__(self):
+        return len(self.factories)
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import queue
+import threading
+
+AUTOSAVE_INTERVAL = 60 # seconds between full snapshots of the map while it is being edited
+JOURNAL_INTERVAL = 0.5 # seconds between writes of the latest edits to the journal
+
+# ============ Autosave ===================#
+# Keeps the map being edited safe on disk without ever making the editor wait for a save:
+#   - every edit is written to an append-only journal next to the map (map.journal for map.json) within about
+#     JOURNAL_INTERVAL seconds, and only the cells that changed get written
+#   - every AUTOSAVE_INTERVAL seconds (and when asked to save) a copy of the whole map is written out as a snapshot,
+#     after which the journal starts over from that snapshot. Autosaved snapshots go next to the map
+#     (map.autosave.json), the map file itself is only written by save()
+# All the writing happens on a background thread. The editor's thread only copies the map (or the edited cells) to
+# hand over, and every file is written to a temporary file first and then swapped in (see Tilemap.save).
+#
+# The first line of the journal says which snapshot the edits apply to, and what its size and modification time were
+# when the journal was started. After a crash, recover() loads that snapshot and replays the journal on top of it.
+# A journal whose snapshot has been replaced since then is out of date and is ignored.
+#
+# Journal lines (JSON):
+#   {"base": path, "stamp": [modification time (ns), size] or null if the file didn't exist}   (first line)
+#   [x, y, type, variant]      a tile was placed
+#   [x, y]                     a tile was removed
+#   {"offgrid": [...]}         the decorations were edited (all of them are written, there aren't many)
+
+# size and modification time of a file, to tell whether it has changed
+def file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+class Autosave:
+    def __init__(self, tilemap, path, interval = AUTOSAVE_INTERVAL, journal_interval = JOURNAL_INTERVAL):
+        self.tilemap = tilemap
+        self.path = path
+        base, extension = os.path.splitext(path)
+        self.autosave_path = base + '.autosave' + extension
+        self.journal_path = base + '.journal'
+        self.interval = interval
+        self.journal_interval = journal_interval
+
+        # edits that haven't been handed to the background thread yet
+        self.changed = set() # cells
+        self.offgrid_dirty = False
+        self.unsaved = False # edited since the last snapshot
+        self.last_journal = time.time()
+        self.last_snapshot = time.time()
+
+        self.jobs = queue.Queue()
+        self.thread = None
+        self.error = None # the last error the background thread ran into (it keeps going after errors)
+
+    # ============ Editor Thread ===================#
+    # Load whatever the journal left behind by a crash describes into the tilemap (the map file should already be
+    # loaded into it), then start journaling. Returns the number of journaled edits that were recovered
+    def start(self):
+        recovered = self.recover()
+        self.tilemap.journal = self
+        if recovered:
+            # the journal is still valid for the recovered map, so keep adding to it
+            self.unsaved = True
+        else:
+            self.jobs.put(('begin', self.path))
+        self.thread = threading.Thread(target = self.work, daemon = True)
+        self.thread.start()
+        return recovered
+
+    def recover(self):
+        try:
+            f = open(self.journal_path)
+        except FileNotFoundError:
+            return 0
+        lines = f.read().splitlines()
+        f.close()
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, ValueError):
+            return 0
+        if file_stamp(header['base']) != header['stamp']:
+            return 0 # the snapshot the journal was started from has been replaced since
+        if header['base'] != self.path:
+            self.tilemap.load(header['base']) # an autosaved snapshot is newer than the map file
+
+        count = 0
+        tilemap = self.tilemap
+        with tilemap.batch():
+            for line in lines[1:]:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break # the crash cut off the last line
+                if isinstance(record, dict):
+                    tilemap.offgrid_tiles = record['offgrid']
+                elif len(record) == 4:
+                    tilemap.set_tile(record[0], record[1], record[2], record[3])
+                else:
+                    tilemap.remove_tile(record[0], record[1])
+                count += 1
+        return count
+
+    # told about every edit by the tilemap
+    def tile_changed(self, x, y):
+        self.changed.add((x, y))
+        self.unsaved = True
+
+    def offgrid_changed(self):
+        self.offgrid_dirty = True
+        self.unsaved = True
+
+    # call once a frame: hands the latest edits to the journal, and autosaves a snapshot every so often
+    def update(self):
+        now = time.time()
+        if self.unsaved and now - self.last_snapshot >= self.interval:
+            self.snapshot(self.autosave_path)
+        elif now - self.last_journal >= self.journal_interval:
+            self.flush_journal()
+
+    # save the map (in the background), then start a new journal from it
+    def save(self, path = None):
+        self.snapshot(path or self.path)
+
+    def snapshot(self, path):
+        # everything edited so far is in the snapshot, so the edits waiting for the journal aren't needed anymore
+        self.changed.clear()
+        self.offgrid_dirty = False
+        self.unsaved = False
+        self.last_snapshot = self.last_journal = time.time()
+        self.jobs.put(('snapshot', path, self.tilemap.copy()))
+
+    # turn the edited cells into journal lines (only looks at the cells that changed)
+    def flush_journal(self):
+        self.last_journal = time.time()
+        if not self.changed and not self.offgrid_dirty:
+            return
+        chunks = self.tilemap.chunks
+        records = []
+        for x, y in self.changed:
+            tile = chunks.get(x, y)
+            records.append([x, y, tile[0], tile[1]] if tile is not None else [x, y])
+        if self.offgrid_dirty:
+            records.append({'offgrid': self.tilemap.offgrid_tiles})
+        self.changed.clear()
+        self.offgrid_dirty = False
+        self.jobs.put(('journal', ''.join(json.dumps(record) + '\n' for record in records)))
+
+    # write out the last edits and wait for the background thread to finish everything it was given
+    def close(self):
+        self.tilemap.journal = None
+        if self.thread is None:
+            return
+        self.flush_journal()
+        self.jobs.put(None)
+        self.thread.join()
+        self.thread = None
+
+    # ============ Background Thread ===================#
+    def work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            try:
+                if job[0] == 'journal':
+                    self.append_journal(job[1])
+                elif job[0] == 'snapshot':
+                    job[2].save(job[1])
+                    self.begin_journal(job[1])
+                    if job[1] == self.path and os.path.exists(self.autosave_path):
+                        os.remove(self.autosave_path) # the map file is newer than the last autosave now
+                else:
+                    self.begin_journal(job[1])
+            except (OSError, ValueError) as e:
+                self.error = e
+                print('autosave failed: ' + str(e))
+
+    # start an empty journal on top of the snapshot at base
+    def begin_journal(self, base):
+        temp_path = self.journal_path + '.tmp'
+        f = open(temp_path, 'w')
+        f.write(json.dumps({'base': base, 'stamp': file_stamp(base)}) + '\n')
+        f.close()
+        os.replace(temp_path, self.journal_path)
+
+    def append_journal(self, lines):
+        f = open(self.journal_path, 'a')
+        f.write(lines)
+        f.flush()
+        os.fsync(f.fileno()) # the journal is only any use if it actually made it to the disk
+        f.close()
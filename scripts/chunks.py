@@ -0,0 +1,142 @@
+from array import array
+
+CHUNK_SHIFT = 4 # chunks are 2**4 = 16 tiles wide
+CHUNK_SIZE = 1 << CHUNK_SHIFT
+CHUNK_MASK = CHUNK_SIZE - 1
+CHUNK_AREA = CHUNK_SIZE * CHUNK_SIZE
+
+# ============ Chunked Tile Storage ===================#
+# Tiles are stored in fixed size chunks of CHUNK_SIZE x CHUNK_SIZE cells. Each chunk is a flat array of
+# unsigned 16-bit tile ids (0 means the cell is empty), and the chunks are kept in a dictionary keyed by
+# integer chunk coordinates. A tile id is an index into the palette, which holds one (type, variant) pair
+# for every distinct kind of tile in the map. This means a tile costs 2 bytes instead of a whole dictionary,
+# and looking up a tile only needs integer math (no string keys have to be built).
+# Chunks can also be registered as "pending" with a function that decodes them, in which case they are only
+# decoded the first time something looks inside them (this is how binary maps are loaded lazily).
+
+class TileChunk:
+    def __init__(self, tiles = None):
+        self.tiles = tiles if tiles is not None else array('H', bytes(2 * CHUNK_AREA))
+        self.count = CHUNK_AREA - self.tiles.count(0) # number of populated cells (empty chunks get deleted)
+
+    def copy(self):
+        return TileChunk(array('H', self.tiles))
+
+class ChunkStore:
+    def __init__(self, solid_types = ()):
+        self.solid_types = set(solid_types)
+        self.clear()
+
+    # remove every tile (and forget the palette, since nothing refers to it anymore)
+    def clear(self):
+        self.chunks = {} # (chunk x, chunk y) -> TileChunk
+        self.pending = {} # (chunk x, chunk y) -> function that decodes the chunk, for chunks that haven't been decoded yet
+        self.palette = [None] # tile id -> (type, variant); id 0 is reserved for empty cells
+        self.palette_ids = {} # (type, variant) -> tile id
+        self.solid = bytearray(1) # tile id -> 1 if the tile type has physics enabled
+        self.tile_count = 0
+
+    # independent copy of every tile (pending chunks are decoded first, so the copy doesn't depend on a map file)
+    def copy(self):
+        store = ChunkStore(self.solid_types)
+        store.chunks = {cpos: chunk.copy() for cpos, chunk in self.items()}
+        store.palette = list(self.palette)
+        store.palette_ids = dict(self.palette_ids)
+        store.solid = bytearray(self.solid)
+        store.tile_count = self.tile_count
+        return store
+
+    # get the id of a (type, variant) pair, adding it to the palette if we haven't seen it before
+    def tile_id(self, tile_type, variant):
+        key = (tile_type, variant)
+        tile_id = self.palette_ids.get(key)
+        if tile_id is None:
+            tile_id = len(self.palette)
+            if tile_id > 0xFFFF:
+                raise ValueError('too many distinct tiles for a 16-bit palette')
+            self.palette.append(key)
+            self.palette_ids[key] = tile_id
+            self.solid.append(tile_type in self.solid_types)
+        return tile_id
+
+    # ============ Lazily Decoded Chunks ===================#
+    # register a chunk that will be decoded by calling decode() the first time it is needed
+    def add_pending(self, cpos, count, decode):
+        self.pending[cpos] = decode
+        self.tile_count += count
+
+    def decode(self, cpos):
+        chunk = self.chunks[cpos] = self.pending.pop(cpos)()
+        return chunk
+
+    def decode_all(self):
+        for cpos in list(self.pending):
+            self.decode(cpos)
+
+    # all the chunks as ((chunk x, chunk y), TileChunk) pairs (decoding any pending chunks)
+    def items(self):
+        self.decode_all()
+        return list(self.chunks.items())
+
+    # returns the tile id at a grid position (0 if empty)
+    def get_id(self, x, y):
+        cpos = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+        chunk = self.chunks.get(cpos)
+        if chunk is None:
+            if cpos not in self.pending:
+                return 0
+            chunk = self.decode(cpos)
+        return chunk.tiles[((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)]
+
+    # returns the (type, variant) pair at a grid position, or None if the cell is empty
+    def get(self, x, y):
+        tile_id = self.get_id(x, y)
+        if tile_id:
+            return self.palette[tile_id]
+        return None
+
+    def is_solid(self, x, y):
+        return self.solid[self.get_id(x, y)]
+
+    # write a tile id into a grid position (an id of 0 clears the cell)
+    def set_id(self, x, y, tile_id):
+        cpos = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+        chunk = self.chunks.get(cpos)
+        if chunk is None and cpos in self.pending:
+            chunk = self.decode(cpos)
+        if chunk is None:
+            if not tile_id:
+                return
+            chunk = self.chunks[cpos] = TileChunk()
+        i = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+        old = chunk.tiles[i]
+        chunk.tiles[i] = tile_id
+        # keep track of the tile counts so empty chunks can be thrown away
+        if old and not tile_id:
+            chunk.count -= 1
+            self.tile_count -= 1
+            if not chunk.count:
+                del self.chunks[cpos]
+        elif tile_id and not old:
+            chunk.count += 1
+            self.tile_count += 1
+
+    def set(self, x, y, tile_type, variant):
+        self.set_id(x, y, self.tile_id(tile_type, variant))
+
+    def remove(self, x, y):
+        self.set_id(x, y, 0)
+
+    def __len__(self):
+        return self.tile_count
+
+    # loop through every populated cell as (x, y, tile id)
+    def __iter__(self):
+        for (cx, cy), chunk in self.items():
+            base_x = cx << CHUNK_SHIFT
+            base_y = cy << CHUNK_SHIFT
+            tiles = chunk.tiles
+            for i in range(CHUNK_AREA):
+                tile_id = tiles[i]
+                if tile_id:
+                    yield base_x + (i & CHUNK_MASK), base_y + (i >> CHUNK_SHIFT), tile_id
@@ -1,8 +1,7 @@
 import pygame
 import math
 import random
-from scripts.particle import Particle
-from scripts.spark import Spark
+from scripts.utils import flip_image
 
 GRAVITY = 0.4
 TERMINAL_VELOCITY = 12
@@ -12,7 +11,9 @@ class PhysicsEntity:
         self.game = game
         self.type = e_type
         self.pos = list(pos) # ensures position is always a unique class parameter rather than a reference to a list
+        self.prev_pos = list(pos) # position at the start of the latest tick (rendering interpolates between the two)
         self.size = size    # this is used to create the bounding rectangle (these dimensions are relative to anim_offset, which is the origin point)
+        self.bounds = pygame.Rect(0, 0, size[0], size[1]) # the entity rectangle, reused by bounds_rect() instead of making a new one every call
         self.velocity = [0, 0]
         self.collisions = {'up': False, 'down': False, 'left': False, 'right': False}
         self.last_movement = [0,0]
@@ -23,8 +24,25 @@ class PhysicsEntity:
         self.flip = False
         self.set_action('idle')
 
-    def rect(self): # this function returns the entity rectangle
-        return pygame.Rect(self.pos[0],self.pos[1],self.size[0], self.size[1])
+    def rect(self): # this function returns the entity rectangle (a new Rect at the current position, the caller can keep or change it)
+        return pygame.Rect(self.pos[0], self.pos[1], self.size[0], self.size[1])
+
+    # The same rectangle without making a new Rect: it is the entity's own self.bounds moved to the current position, so
+    # it is only good until the next call and must not be kept or changed (the physics and the per-tick checks use this)
+    def bounds_rect(self):
+        bounds = self.bounds
+        bounds.x = int(self.pos[0]) # int() because Rect rounds floats that are assigned to it (but truncates them in the constructor)
+        bounds.y = int(self.pos[1])
+        return bounds
+
+    # remember where the entity was before this tick
+    def start_tick(self):
+        self.prev_pos[0] = self.pos[0]
+        self.prev_pos[1] = self.pos[1]
+
+    # camera offset that renders the entity part of the way (alpha) from its previous position to its current one
+    def lerp_offset(self, offset, alpha):
+        return (offset[0] + (self.pos[0] - self.prev_pos[0]) * (1 - alpha), offset[1] + (self.pos[1] - self.prev_pos[1]) * (1 - alpha))
 
     # Function for controlling the animation state
     def set_action(self, action):
@@ -33,7 +51,14 @@ class PhysicsEntity:
             self.animation = self.game.assets[self.type + '/' + self.action].copy() # grab the new animation
 
     def update(self, tilemap, movement = (0,0)):
-        self.collisions = {'up': False, 'down': False, 'left': False, 'right': False}
+        self.move(tilemap, movement)
+        self.finish_update(movement)
+
+    # The physics part of the update: gravity, moving and resolving collisions with the tilemap (scripts/physics.py does
+    # this for lots of enemies at once)
+    def move(self, tilemap, movement = (0,0)):
+        collisions = self.collisions
+        collisions['up'] = collisions['down'] = collisions['left'] = collisions['right'] = False
         # Apply acceleration due to gravity
         self.velocity[1] = min(TERMINAL_VELOCITY, self.velocity[1]+GRAVITY) # include a cap for terminal velocity
         
@@ -44,38 +69,35 @@ class PhysicsEntity:
 
         # Attempt to move the entity along the x-axis
         self.pos[0] += frame_movement[0]
-        entity_rect = self.rect()
-    
-        # Check for collisions with tilemap physics objects 
-        for rect in tilemap.physics_rects_around(self.pos): # loop across neighboring tiles only
-
-            # resolve collisions in the x-axis
-            if entity_rect.colliderect(rect):
-                if frame_movement[0] > 0:
-                    entity_rect.right = rect.left
-                    self.collisions['right'] = True
-                if frame_movement[0] < 0:
-                    entity_rect.left = rect.right
-                    self.collisions['left'] = True
-                self.pos[0] = entity_rect.x
+        entity_rect = self.bounds_rect()
+
+        # Resolve collisions in the x-axis with the tilemap physics objects (neighboring tiles only, see Tilemap.collide_x)
+        if tilemap.collide_x(entity_rect, frame_movement[0], self.pos):
+            if frame_movement[0] > 0:
+                collisions['right'] = True
+            if frame_movement[0] < 0:
+                collisions['left'] = True
+            self.pos[0] = entity_rect.x
 
         # Attempt to move the entity along the y-axis
         self.pos[1] += frame_movement[1]
-        entity_rect = self.rect() # get a copy of the entitiy's rectangle
-        
-        # Check for collisions with tilemap physics objects 
-        for rect in tilemap.physics_rects_around(self.pos): # loop across neighboring tiles only
-        
+        entity_rect = self.bounds_rect()
+
         # Resolve collisions in the y-axis
-            if entity_rect.colliderect(rect):
-                if frame_movement[1] > 0:
-                    entity_rect.bottom = rect.top
-                    self.collisions['down'] = True
-                if frame_movement[1] < 0:
-                    entity_rect.top = rect.bottom
-                    self.collisions['up'] = True
-                self.pos[1] = entity_rect.y
+        if tilemap.collide_y(entity_rect, frame_movement[1], self.pos):
+            if frame_movement[1] > 0:
+                collisions['down'] = True
+            if frame_movement[1] < 0:
+                collisions['up'] = True
+            self.pos[1] = entity_rect.y
+
+        if collisions['down'] or collisions['up']:
+            self.velocity[1] = 0 # set y-velocity = 0 after collision occurs
+        if collisions['left'] or collisions['right']:
+            self.velocity[0] = 0 # set x-velocity = 0 after collision occurs
 
+    # the rest of the update, once the entity has moved
+    def finish_update(self, movement):
         if movement[0] > 0:
             self.flip = False
         if movement[0] < 0: 
@@ -83,15 +105,10 @@ class PhysicsEntity:
 
         self.last_movement = movement # Store the last movement input
 
-        if self.collisions['down'] or self.collisions['up']:
-            self.velocity[1] = 0 # set y-velocity = 0 after collision occurs
-        if self.collisions['left'] or self.collisions['right']:
-            self.velocity[0] = 0 # set x-velocity = 0 after collision occurs
-
         self.animation.update()
 
     def render(self,surf,offset):
-        surf.blit(pygame.transform.flip(self.animation.img(),self.flip,False),\
+        surf.blit(self.animation.img(self.flip),\
                   (self.pos[0]-offset[0]+self.anim_offset[0],self.pos[1]-offset[1]+self.anim_offset[1]))
 
 # Enemy class
@@ -103,16 +120,24 @@ class Enemy(PhysicsEntity):
         self.flip = False
 
     def update(self, tilemap, movement = (0,0)):
-        
+        movement = self.pre_update(tilemap, movement)
+        # Get nominal physics update logic
+        super().update(tilemap, movement = movement)
+        return self.post_update()
+
+    # The enemy's update is split around the physics, so a PhysicsWorld can move lots of enemies at once in between
+    # (see scripts/physics.py). Before the physics: walking, turning around and shooting. Returns the movement to apply
+    def pre_update(self, tilemap, movement = (0,0)):
+
         # walking logic
         if self.walking:
-            my_rect = self.rect() # get this entity's rectangle
+            my_rect = self.bounds_rect() # get this entity's rectangle (it stays put until the physics update below)
             can_walk = False # initilize as false
             
             # DaFluffyPotato Logic: More efficient but not as robust (uses hard-coded values)
             # this can be improved by using anim_offset and size parameters
             # Check for a solid tile 7 pixels in front and 23 pixels below the enemy's origin point
-            if tilemap.solid_check((self.rect().centerx + (-7 if self.flip else 7), self.rect().centery + 23)):
+            if tilemap.solid_check((my_rect.centerx + (-7 if self.flip else 7), my_rect.centery + 23)):
                 can_walk = True
 
             # My Logic: Less efficient but robust to any entity size
@@ -138,18 +163,20 @@ class Enemy(PhysicsEntity):
                 if abs(dis[1] < 16): # if the player is within +/- 1 tile in y
                     if (self.flip and dis[0] < 0): # if the player is to the left of the enemy and the enemy is facing left
                         # Spawn a projectile (left velocity)
-                        self.game.projectiles.append([[self.rect().centerx - 7, self.rect().centery],-5,0])
+                        barrel = (my_rect.centerx - 7, my_rect.centery)
+                        self.game.projectiles.add(barrel, (-5, 0))
                         # Spawn sparks at the end of the gun barrel
                         for i in range(4):
-                            self.game.sparks.append(Spark(self.game.projectiles[-1][0], random.random() - 0.5 + math.pi, 2 + random.random() ))
+                            self.game.sparks.add(barrel, random.random() - 0.5 + math.pi, 2 + random.random())
                         # Play the shooting sound
                         self.game.sfx['shoot'].play()
                     elif (not self.flip and dis[0] > 0):
                         # Spawn a projectile (right velocity)
-                        self.game.projectiles.append([[self.rect().centerx + 7, self.rect().centery],5,0])
+                        barrel = (my_rect.centerx + 7, my_rect.centery)
+                        self.game.projectiles.add(barrel, (5, 0))
                         # Spawn sparks at the end of the gun barrel
                         for i in range(4):
-                            self.game.sparks.append(Spark(self.game.projectiles[-1][0], random.random() - 0.5, 2 - random.random() ))
+                            self.game.sparks.add(barrel, random.random() - 0.5, 2 - random.random())
                         # Play the shooting sound
                         self.game.sfx['shoot'].play()
         
@@ -162,24 +189,26 @@ class Enemy(PhysicsEntity):
             self.set_action('run')
         else:
             self.set_action('idle')
-    
-        # Get nominal physics update logic
-        super().update(tilemap, movement = movement)
+        return movement
 
+    # After the physics: returns True if the enemy got killed
+    def post_update(self):
         # Handle Enemy death (collisions with player dash attack)
         if abs(self.game.player.dashing) >= 50:
-            if self.rect().colliderect(self.game.player.rect()):
+            my_rect = self.bounds_rect()
+            if my_rect.colliderect(self.game.player.bounds_rect()):
+                center = my_rect.center
                 # Generate particles
                 for i in range(30):
                     angle = random.random() * math.pi * 2
                     speed = random.random() * 5
-                    self.game.sparks.append(Spark(self.rect().center,angle, 2 + random.random()))
-                    self.game.particles.append(Particle(self.game, 'particle', self.rect().center, \
+                    self.game.sparks.add(center,angle, 2 + random.random())
+                    self.game.particles.add('particle', center, \
                                             velocity=[math.cos(angle+math.pi) * speed * 0.5, \
                                                         math.sin(angle+math.pi) * speed * 0.5],\
-                                            frame = random.randint(0,7)))
-                    self.game.sparks.append(Spark(self.rect().center, 0,       5+random.random()))
-                    self.game.sparks.append(Spark(self.rect().center, math.pi, 5+random.random()))
+                                            frame = random.randint(0,7))
+                    self.game.sparks.add(center, 0,       5+random.random())
+                    self.game.sparks.add(center, math.pi, 5+random.random())
                 # Apply screenshake
                 self.game.screenshake = max(25,self.game.screenshake)
                 # Play death sound
@@ -194,11 +223,12 @@ class Enemy(PhysicsEntity):
         super().render(surf, offset=offset)
 
         # Render a gun on top of the enemy
+        center = self.rect().center
         if self.flip:
-            surf.blit(pygame.transform.flip(self.game.assets['gun'],True,False),\
-                      (self.rect().centerx - 4 - self.game.assets['gun'].get_width() - offset[0],self.rect().centery - offset[1]))
+            surf.blit(flip_image(self.game.assets['gun']),\
+                      (center[0] - 4 - self.game.assets['gun'].get_width() - offset[0],center[1] - offset[1]))
         else:
-            surf.blit(self.game.assets['gun'],(self.rect().centerx + 4 - offset[0], self.rect().centery - offset[1]))
+            surf.blit(self.game.assets['gun'],(center[0] + 4 - offset[0], center[1] - offset[1]))
             
 
 class Player(PhysicsEntity):
@@ -224,13 +254,14 @@ class Player(PhysicsEntity):
             # Apply screen shake
             self.game.screenshake = max(25,self.game.screenshake)
             # Spawn a mess of particles
+            center = self.rect().center
             for i in range(30):
                 angle = random.random() * math.pi * 2
                 speed = random.random() * 5
-                self.game.sparks.append(Spark(self.rect().center,angle, 2 + random.random()))
-                self.game.particles.append(Particle(self.game, 'particle', self.rect().center, \
+                self.game.sparks.add(center,angle, 2 + random.random())
+                self.game.particles.add('particle', center, \
                                         velocity=[math.cos(angle+math.pi) * speed * 0.5, \
-                                                    math.sin(angle+math.pi) * speed * 0.5], frame = random.randint(0,7)))
+                                                    math.sin(angle+math.pi) * speed * 0.5], frame = random.randint(0,7))
 
         # Logic for restoring your jump / keeping track of air time
         self.air_time += 1
@@ -268,12 +299,13 @@ class Player(PhysicsEntity):
         # Dashing logic
         # Generate a burst of particles for the dash at self.dashing == 60 and 50 (start/end of dash)
         if abs(self.dashing) in {60,50}:
+            center = self.rect().center
             for i in range(20): # repeat 20 times
                 angle = random.random() * math.pi * 2 # 0 to 2pi
                 speed = random.random() * 0.5 + 0.5 # 0.5 to 1
                 particle_vel = [math.cos(angle) * speed, math.sin(angle) * speed]
                 # Spawn the particle
-                self.game.particles.append(Particle(self.game,'particle',self.rect().center,velocity=particle_vel,frame=random.randint(0,7))) 
+                self.game.particles.add('particle',center,velocity=particle_vel,frame=random.randint(0,7))
         
         # Handle Dashing Movement
         if self.dashing > 0:
@@ -287,7 +319,7 @@ class Player(PhysicsEntity):
                    self.velocity[0] *= 0.1 # take away 90% of dash velocity after 9 frames (let air drag remove the remaining velocity)
             # Generate a stream of particles for the duration of the dash
             particle_vel = [abs(self.dashing)/self.dashing * random.random()*3, 0]
-            self.game.particles.append(Particle(self.game,'particle',self.rect().center,velocity=particle_vel,frame=random.randint(0,7))) 
+            self.game.particles.add('particle',self.rect().center,velocity=particle_vel,frame=random.randint(0,7))
         # The remaining 50 frames are for the dash cooldown! (can't dash until self.dashing == 0)
 
 
@@ -0,0 +1,25 @@
+# ============ Scripted Inputs ===================#
+# The player's input for one simulation tick packed into a small integer, used to drive the game without a keyboard
+# (Game.step). LEFT and RIGHT are held buttons; JUMP and DASH mean the button was pressed during that tick.
+LEFT = 1
+RIGHT = 2
+JUMP = 4
+DASH = 8
+
+# build an input value from button states, e.g. pack(right = True, jump = True)
+def pack(left = False, right = False, jump = False, dash = False):
+    return (LEFT if left else 0) | (RIGHT if right else 0) | (JUMP if jump else 0) | (DASH if dash else 0)
+
+# Stand-in for pygame.mixer.Sound when there is no audio device (headless mode)
+class SilentSound:
+    def __init__(self, *args):
+        pass
+
+    def play(self, *args, **kwargs):
+        pass
+
+    def stop(self):
+        pass
+
+    def set_volume(self, volume):
+        pass
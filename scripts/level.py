@@ -0,0 +1,93 @@
+import os
+import threading
+from types import MappingProxyType
+from scripts.tilemap import Tilemap
+from scripts.mapformat import MAP_EXTENSION
+
+LEVEL_PATH = 'data/maps/'
+LEAF_SPAWNER = ('large_decor', 2) # trees spawn leaf particles
+SPAWNERS = [('spawners', 0), ('spawners', 1)] # variant 0 is the player, variant 1 is an enemy
+
+# path of a level's map file (prefer the binary version of the map if one has been made with scripts/mapformat.py)
+def level_path(level_id):
+    path = LEVEL_PATH + str(level_id)
+    return path + MAP_EXTENSION if os.path.exists(path + MAP_EXTENSION) else path + '.json'
+
+# ============ Level Snapshots ===================#
+# A parsed level that never changes: its tiles (with the spawners already taken out), decorations, spawner list and
+# leaf spawner rectangles. Restarting a level copies what it needs out of the snapshot instead of reading and parsing
+# the map file again (see Tilemap.restore).
+class LevelSnapshot:
+    def __init__(self, level_id, tilemap, spawners, leaf_spawners):
+        self.level_id = level_id
+        self.tile_size = tilemap.tile_size
+        self.palette = tuple(tilemap.chunks.palette)
+        self.chunks = MappingProxyType({cpos: chunk.copy() for cpos, chunk in tilemap.chunks.items()})
+        self.offgrid = tuple(MappingProxyType(dict(tile)) for tile in tilemap.offgrid_tiles)
+        self.spawners = tuple((spawner['variant'], tuple(spawner['pos'])) for spawner in spawners) # (variant, position in pixels)
+        self.leaf_spawners = tuple(leaf_spawners) # (x, y, width, height) rectangles
+
+# load a level from disk into a snapshot (doesn't touch pygame, so it is safe to run on a background thread)
+def snapshot_level(level_id):
+    tilemap = Tilemap(None)
+    tilemap.load(level_path(level_id))
+
+    # Create rectangles representing leaf spawning areas of all the trees
+    leaf_spawners = [(4 + tree['pos'][0], 4 + tree['pos'][1], 23, 13) for tree in tilemap.extract([LEAF_SPAWNER], keep=True)]
+    # Take the spawners out of the map
+    spawners = tilemap.extract(SPAWNERS, keep=False)
+    return LevelSnapshot(level_id, tilemap, spawners, leaf_spawners)
+
+# Keeps a snapshot of every level that has been loaded, and can build the snapshot of the next level on a background thread
+class LevelCache:
+    def __init__(self, preload = True):
+        self.preload_enabled = preload
+        self.snapshots = {} # level id -> LevelSnapshot
+        self.loading = {} # level id -> thread that is building its snapshot
+        self.lock = threading.Lock()
+
+    def get(self, level_id):
+        with self.lock:
+            snapshot = self.snapshots.get(level_id)
+            thread = self.loading.get(level_id)
+        if snapshot is not None:
+            return snapshot
+        if thread is not None:
+            thread.join() # the level is already being loaded in the background, wait for it to finish
+            with self.lock:
+                snapshot = self.snapshots.get(level_id)
+            if snapshot is not None:
+                return snapshot
+
+        snapshot = snapshot_level(level_id)
+        with self.lock:
+            self.snapshots[level_id] = snapshot
+        return snapshot
+
+    # start building the snapshot of a level on a background thread (e.g. the next level while this one is being played)
+    def preload(self, level_id):
+        if not self.preload_enabled:
+            return
+        with self.lock:
+            if level_id in self.snapshots or level_id in self.loading:
+                return
+            thread = threading.Thread(target = self.load_in_background, args = (level_id,), daemon = True)
+            self.loading[level_id] = thread
+        thread.start()
+
+    def load_in_background(self, level_id):
+        snapshot = None
+        try:
+            snapshot = snapshot_level(level_id)
+        except Exception:
+            pass # get() will load the level again and report the error
+        finally:
+            # whatever happened, the level mustn't stay marked as loading (get() would wait on a dead thread forever)
+            with self.lock:
+                if snapshot is not None:
+                    self.snapshots[level_id] = snapshot
+                del self.loading[level_id]
+
+    def clear(self):
+        with self.lock:
+            self.snapshots.clear()
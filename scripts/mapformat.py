@@ -0,0 +1,151 @@
+import sys
+import mmap
+import struct
+from array import array
+from scripts.chunks import TileChunk, CHUNK_AREA
+
+MAP_EXTENSION = '.map'
+MAP_MAGIC = b'NJMP'
+MAP_VERSION = 1
+
+# ============ Binary Map Format ===================#
+# A compact alternative to the JSON maps that can be memory-mapped and decoded one chunk at a time.
+# Everything is little-endian:
+#   header:      magic, version, tile size, palette size, chunk count, off-grid count, and the offsets of the sections below
+#   palette:     per entry: flags (bit 0 = used by on-grid tiles), variant, length of the type name, type name (utf-8)
+#   chunk table: per chunk: chunk x, chunk y, number of tiles, offset of its tile data
+#   chunk data:  per chunk: CHUNK_AREA unsigned 16-bit palette indices (row by row, 0 = empty)
+#   off-grid:    per decoration: palette index, x, y (pixels, as doubles)
+# Palette index i refers to entry i - 1 of the palette (0 means an empty cell).
+
+HEADER = struct.Struct('<4sHHIIIIII')
+PALETTE_ENTRY = struct.Struct('<BHB')
+CHUNK_ENTRY = struct.Struct('<iiHI')
+OFFGRID_ENTRY = struct.Struct('<Hdd')
+PALETTE_ONGRID = 1
+
+def write_map(tilemap, path):
+    chunks = tilemap.chunks.items()
+    offgrid = tilemap.offgrid_tiles
+
+    # the file palette starts with the tilemap's own palette so the chunk arrays can be written out as they are
+    palette = list(tilemap.chunks.palette[1:])
+    flags = [PALETTE_ONGRID] * len(palette)
+    palette_ids = {pair: i + 1 for i, pair in enumerate(palette)}
+    for tile in offgrid:
+        pair = (tile['type'], tile['variant'])
+        if pair not in palette_ids:
+            palette.append(pair)
+            flags.append(0)
+            palette_ids[pair] = len(palette)
+
+    palette_data = []
+    for (tile_type, variant), flag in zip(palette, flags):
+        name = tile_type.encode()
+        palette_data.append(PALETTE_ENTRY.pack(flag, variant, len(name)) + name)
+    palette_data = b''.join(palette_data)
+
+    palette_offset = HEADER.size
+    chunk_table_offset = palette_offset + len(palette_data)
+    chunk_data_offset = chunk_table_offset + CHUNK_ENTRY.size * len(chunks)
+    offgrid_offset = chunk_data_offset + 2 * CHUNK_AREA * len(chunks)
+
+    chunk_table = []
+    chunk_data = []
+    for i, ((cx, cy), chunk) in enumerate(chunks):
+        chunk_table.append(CHUNK_ENTRY.pack(cx, cy, chunk.count, chunk_data_offset + 2 * CHUNK_AREA * i))
+        tiles = array('H', chunk.tiles)
+        if sys.byteorder == 'big':
+            tiles.byteswap()
+        chunk_data.append(tiles.tobytes())
+
+    offgrid_data = [OFFGRID_ENTRY.pack(palette_ids[(tile['type'], tile['variant'])], tile['pos'][0], tile['pos'][1]) for tile in offgrid]
+
+    f = open(path, 'wb')
+    f.write(HEADER.pack(MAP_MAGIC, MAP_VERSION, tilemap.tile_size, len(palette), len(chunks), len(offgrid),
+                        palette_offset, chunk_table_offset, offgrid_offset))
+    f.write(palette_data)
+    f.write(b''.join(chunk_table))
+    f.write(b''.join(chunk_data))
+    f.write(b''.join(offgrid_data))
+    f.close()
+
+# A binary map opened with mmap: the header, palette, chunk table and off-grid decorations are read straight away,
+# but the tile data of each chunk is only read when decode_chunk is called for it
+class BinaryMap:
+    def __init__(self, path):
+        f = open(path, 'rb')
+        self.data = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        f.close()
+
+        magic, version, self.tile_size, palette_count, chunk_count, offgrid_count, palette_offset, chunk_table_offset, offgrid_offset \
+            = HEADER.unpack_from(self.data, 0)
+        if magic != MAP_MAGIC or version != MAP_VERSION:
+            raise ValueError(path + ' is not a version ' + str(MAP_VERSION) + ' binary map')
+
+        self.palette = [None] # palette index -> (type, variant)
+        self.ongrid = [False] # palette index -> used by on-grid tiles
+        offset = palette_offset
+        for i in range(palette_count):
+            flag, variant, name_len = PALETTE_ENTRY.unpack_from(self.data, offset)
+            offset += PALETTE_ENTRY.size
+            self.palette.append((self.data[offset:offset + name_len].decode(), variant))
+            self.ongrid.append(bool(flag & PALETTE_ONGRID))
+            offset += name_len
+
+        self.chunks = {} # (chunk x, chunk y) -> (number of tiles, offset of the tile data)
+        for cx, cy, count, data_offset in CHUNK_ENTRY.iter_unpack(self.data[chunk_table_offset:chunk_table_offset + CHUNK_ENTRY.size * chunk_count]):
+            self.chunks[(cx, cy)] = (count, data_offset)
+
+        self.offgrid = []
+        for palette_id, x, y in OFFGRID_ENTRY.iter_unpack(self.data[offgrid_offset:offgrid_offset + OFFGRID_ENTRY.size * offgrid_count]):
+            tile_type, variant = self.palette[palette_id]
+            self.offgrid.append({'type': tile_type, 'variant': variant, 'pos': [x, y]})
+
+    # read the tile data of one chunk, translating palette indices with remap (None if the indices can be used as they are)
+    def decode_chunk(self, cpos, remap = None):
+        count, offset = self.chunks[cpos]
+        tiles = array('H')
+        tiles.frombytes(self.data[offset:offset + 2 * CHUNK_AREA])
+        if sys.byteorder == 'big':
+            tiles.byteswap()
+        if remap is not None:
+            tiles = array('H', [remap[tile_id] for tile_id in tiles])
+        return TileChunk(tiles)
+
+# Load a binary map into a tilemap. Chunks are registered as pending and only decoded when first used
+def read_map(tilemap, path):
+    binary = BinaryMap(path)
+    store = tilemap.chunks
+    store.clear()
+
+    # register the on-grid palette entries with the tile store, remapping the indices if they don't line up
+    remap = [0] * len(binary.palette)
+    for i in range(1, len(binary.palette)):
+        if binary.ongrid[i]:
+            remap[i] = store.tile_id(*binary.palette[i])
+    if all(remap[i] == i for i in range(len(remap)) if binary.ongrid[i]):
+        remap = None
+
+    for cpos, (count, offset) in binary.chunks.items():
+        store.add_pending(cpos, count, lambda cpos = cpos: binary.decode_chunk(cpos, remap))
+
+    tilemap.tile_size = binary.tile_size
+    return binary.offgrid
+
+# Command line converter between the JSON and binary map formats, e.g.
+#   python -m scripts.mapformat data/maps/0.json data/maps/0.map
+if __name__ == '__main__':
+    import argparse
+    from scripts.tilemap import Tilemap
+
+    parser = argparse.ArgumentParser(description = 'convert maps between the JSON and binary (' + MAP_EXTENSION + ') formats')
+    parser.add_argument('source')
+    parser.add_argument('destination')
+    args = parser.parse_args()
+
+    tilemap = Tilemap(None)
+    tilemap.load(args.source)
+    tilemap.save(args.destination)
+    print('converted ' + args.source + ' -> ' + args.destination + ' (' + str(len(tilemap.chunks)) + ' tiles, '
+          + str(len(tilemap.offgrid_tiles)) + ' off-grid)')
@@ -0,0 +1,66 @@
+import pygame
+import numpy as np
+
+OUTLINE_OFF = 0
+OUTLINE_FAST = 1 # darken every pixel next to a graphic once (one blit)
+OUTLINE_FULL = 2 # darken once for every neighboring graphic pixel (the original look: the silhouette blitted 4 times)
+OUTLINE_ALPHA = 180 # opacity of the black outline
+OUTLINE_THRESHOLD = 127 # pixels with more alpha than this are part of the silhouette (same as pygame.mask.from_surface)
+OUTLINE_OFFSETS = [(1,0), (-1,0), (0,-1), (0,1)]
+
+# ============ Outline Post-Process ===================#
+# Draws a dark outline around everything rendered onto the (transparent) game display. The old way built a new
+# pygame.mask from the whole display every frame and turned it back into a new silhouette surface. Here the
+# silhouette is written straight from the display's alpha channel into a silhouette surface that is reused between
+# frames (NumPy through pygame.surfarray). The fast quality grows the silhouette by one pixel in NumPy so it only
+# needs a single blit instead of 4.
+
+class OutlineRenderer:
+    def __init__(self, quality = OUTLINE_FULL):
+        self.quality = quality
+        self.size = None
+
+    # cycle full -> off -> fast -> full
+    def toggle(self):
+        self.quality = (self.quality + 1) % 3
+        return self.quality
+
+    def allocate(self, size):
+        self.size = size
+        self.silhouette = pygame.Surface(size, pygame.SRCALPHA) # black everywhere, only the alpha channel gets written
+        self.silhouette.fill((0,0,0,0))
+        self.mask = np.zeros(size, dtype = bool)
+        self.grown = np.zeros(size, dtype = bool)
+
+    # darken the pixels of background that neighbor a graphic on display (both surfaces must be the same size)
+    def apply(self, display, background):
+        if self.quality == OUTLINE_OFF:
+            return
+        if self.size != display.get_size():
+            self.allocate(display.get_size())
+
+        # silhouette of everything drawn onto the display
+        alpha = pygame.surfarray.pixels_alpha(display)
+        np.greater(alpha, OUTLINE_THRESHOLD, out = self.mask)
+        del alpha # unlock the display
+
+        mask = self.mask
+        if self.quality == OUTLINE_FAST:
+            # grow the silhouette by one pixel in each direction (the union of the 4 shifted copies)
+            grown = self.grown
+            grown[:] = False
+            grown[1:, :] |= mask[:-1, :]
+            grown[:-1, :] |= mask[1:, :]
+            grown[:, 1:] |= mask[:, :-1]
+            grown[:, :-1] |= mask[:, 1:]
+            mask = grown
+
+        silhouette_alpha = pygame.surfarray.pixels_alpha(self.silhouette)
+        np.multiply(mask, OUTLINE_ALPHA, out = silhouette_alpha, casting = 'unsafe')
+        del silhouette_alpha # unlock the silhouette
+
+        if self.quality == OUTLINE_FAST:
+            background.blit(self.silhouette, (0,0))
+        else:
+            for offset in OUTLINE_OFFSETS:
+                background.blit(self.silhouette, offset) # render the sillhouette onto the game graphics display
@@ -1,29 +1,128 @@
-class Particle:
-    def __init__(self, game, p_type, pos, velocity = [0,0], frame = 0):
+import numpy as np
+
+# ============ Particle System ===================#
+# Stores every live particle in preallocated NumPy arrays (one array per property, a "structure of arrays")
+# so the whole population can be updated in a few vectorized operations instead of one Python object per particle.
+# Dead particles are removed by moving live particles from the end of the arrays into their slots (swap-remove).
+
+LEAF_SWAY_SPEED = 0.035 # how fast leaves sway from side to side
+LEAF_SWAY_AMOUNT = 0.3 # how far leaves sway each frame
+
+class ParticleSystem:
+    def __init__(self, game, p_types = ('leaf', 'particle'), capacity = 1024):
         self.game = game
-        self.type = p_type
-        self.pos = list(pos)
-        self.velocity = list(velocity)
-        self.animation = self.game.assets['particle/' + p_type].copy()
-        self.animation.frame = frame
+        self.count = 0 # number of live particles (they always occupy the first self.count slots)
+        self.enabled = True # a disabled system ignores new particles (headless games don't need them)
+
+        # Flatten the animation frames of every particle type into one list of images
+        self.type_ids = {}
+        self.images = []
+        first_image, img_dur, length, loop, sway = [], [], [], [], []
+        for p_type in p_types:
+            animation = self.game.assets['particle/' + p_type]
+            self.type_ids[p_type] = len(self.type_ids)
+            first_image.append(len(self.images))
+            img_dur.append(animation.img_duration)
+            length.append(animation.img_duration * len(animation.images)) # number of game frames in the animation
+            loop.append(animation.loop)
+            sway.append(p_type == 'leaf') # leaves sway side to side as they fall
+            self.images += animation.images
+
+        # Per type lookup tables (indexed by type id)
+        self.first_image = np.array(first_image, dtype = np.int32)
+        self.img_dur = np.array(img_dur, dtype = np.int32)
+        self.length = np.array(length, dtype = np.int32)
+        self.loop = np.array(loop, dtype = bool)
+        self.sway = np.array(sway, dtype = bool)
+
+        # Half sizes of each image, used to center particles on their position
+        self.half_sizes = np.array([(img.get_width() / 2, img.get_height() / 2) for img in self.images], dtype = np.float64).reshape(-1, 2)
+
+        self.allocate(capacity)
+
+    def allocate(self, capacity):
+        old = self.count
+        pos = np.zeros((capacity, 2), dtype = np.float64)
+        velocity = np.zeros((capacity, 2), dtype = np.float64)
+        frame = np.zeros(capacity, dtype = np.int32)
+        p_type = np.zeros(capacity, dtype = np.int16)
+        done = np.zeros(capacity, dtype = bool)
+        # copy over the live particles when growing
+        if old:
+            pos[:old] = self.pos[:old]
+            velocity[:old] = self.velocity[:old]
+            frame[:old] = self.frame[:old]
+            p_type[:old] = self.type[:old]
+            done[:old] = self.done[:old]
+        self.pos, self.velocity, self.frame, self.type, self.done = pos, velocity, frame, p_type, done
+        self.capacity = capacity
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+
+    def add(self, p_type, pos, velocity = (0,0), frame = 0):
+        if not self.enabled:
+            return
+        if self.count == self.capacity:
+            self.allocate(self.capacity * 2) # double the storage when we run out of room
+        i = self.count
+        type_id = self.type_ids[p_type]
+        self.pos[i] = pos
+        self.velocity[i] = velocity
+        self.frame[i] = frame
+        self.type[i] = type_id
+        self.done[i] = False
+        self.count += 1
 
     def update(self):
+        n = self.count
+        if not n:
+            return
+        pos = self.pos[:n]
+        frame = self.frame[:n]
+        types = self.type[:n]
+
+        # logic for detecting end of particle life (the animation finished on the previous frame)
+        kill = self.done[:n].copy()
+
+        # move particles
+        pos += self.velocity[:n]
+
+        # update animations
+        length = self.length[types]
+        loop = self.loop[types]
+        frame[:] = np.where(loop, (frame + 1) % length, np.minimum(frame + 1, length - 1))
+        self.done[:n] = ~loop & (frame >= length - 1)
 
-        # logic for detecting end of particle life
-        kill = False
-        if self.animation.done:
-            kill = True
+        # add some oscillations in x-axis movement for swaying particles (leaves)
+        sway = self.sway[types]
+        if sway.any():
+            pos[sway, 0] += np.sin(frame[sway] * LEAF_SWAY_SPEED) * LEAF_SWAY_AMOUNT
 
-        # move particle
-        self.pos[0] += self.velocity[0]
-        self.pos[1] += self.velocity[1]
+        # remove EOL particles
+        if kill.any():
+            self.remove(kill)
 
-        # update animation
-        self.animation.update()
+    # swap-remove: fill the holes left by dead particles with the live particles at the end of the arrays
+    def remove(self, kill):
+        n = self.count
+        new_count = n - int(np.count_nonzero(kill))
+        holes = np.flatnonzero(kill[:new_count])
+        fillers = np.flatnonzero(~kill[new_count:]) + new_count
+        for arr in (self.pos, self.velocity, self.frame, self.type, self.done):
+            arr[holes] = arr[fillers]
+        self.count = new_count
 
-        return kill
-    
     def render(self, surf, offset = (0,0)):
-        img = self.animation.img()
-        surf.blit(img, (self.pos[0] - offset[0] - img.get_width()/2, self.pos[1] - offset[1] - img.get_height()/2))
-              
\ No newline at end of file
+        n = self.count
+        if not n:
+            return
+        types = self.type[:n]
+        image_ids = self.first_image[types] + self.frame[:n] // self.img_dur[types]
+        # blit positions are the top-left corner of each image (particles are centered on their position)
+        dest = self.pos[:n] - self.half_sizes[image_ids] - offset
+        images = self.images
+        surf.blits([(images[i], p) for i, p in zip(image_ids.tolist(), dest.tolist())], doreturn = False)
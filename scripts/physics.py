@@ -0,0 +1,142 @@
+import numpy as np
+from scripts.entities import GRAVITY, TERMINAL_VELOCITY
+from scripts.tilemap import NEIGHBOR_OFFSETS
+
+BATCH_MIN = 64 # fewer awake enemies than this are cheaper to update one at a time than to set up arrays for
+KILL_MARGIN = 64 # an enemy moves less than this many pixels in a tick (12 at most, plus being pushed out of a neighbouring tile)
+
+# ============ Batched Physics ===================#
+# Moves a whole population of entities at once: their positions, velocities, sizes and collision flags are copied into
+# NumPy arrays (one array per property), and gravity, movement and the tile collisions are done for all of them in
+# a few vectorized passes against the tilemap's occupancy grid (Tilemap.solid_grid).
+# The passes do exactly what PhysicsEntity.move does, step for step: the nine neighbouring tiles are tested in the same
+# order, and the positions and velocities that get written back have the same values (and the same int/float types,
+# since the replay digest hashes their repr), so it doesn't matter to the game which of the two moved an entity.
+
+class PhysicsWorld:
+    def __init__(self, batched = True, batch_min = BATCH_MIN):
+        self.batched = batched
+        self.batch_min = batch_min
+        # the arrays of the latest step, one row per entity
+        self.pos = np.zeros((0, 2))
+        self.velocity = np.zeros((0, 2))
+        self.size = np.zeros((0, 2), dtype = np.int64)
+        self.collisions = np.zeros((0, 4), dtype = bool) # up, down, left, right
+
+    # ============ Enemies ===================#
+    # Run the update of a list of enemies (in order), the same as calling enemy.update(tilemap) on each of them.
+    # Returns (enemy, killed) pairs.
+    # The enemy updates use the global random module, so they have to draw their random numbers in the same order as
+    # they would one at a time: the enemies before the physics (Enemy.pre_update) can draw numbers, but after the physics
+    # (Enemy.post_update) only an enemy that gets killed by the player's dash does. So the enemies that could possibly
+    # get killed this tick are updated one at a time, and the runs of enemies in between are batched
+    def update_enemies(self, enemies, tilemap, player):
+        if not self.batched or len(enemies) < self.batch_min:
+            return [(enemy, enemy.update(tilemap)) for enemy in enemies]
+
+        results = []
+        run = []
+        if abs(player.dashing) >= 50:
+            reach = player.bounds_rect().inflate(2 * KILL_MARGIN, 2 * KILL_MARGIN)
+            for enemy in enemies:
+                if reach.colliderect(enemy.bounds_rect()):
+                    self.update_batch(run, tilemap, results)
+                    run = []
+                    results.append((enemy, enemy.update(tilemap)))
+                else:
+                    run.append(enemy)
+        else:
+            run = enemies
+        self.update_batch(run, tilemap, results)
+        return results
+
+    def update_batch(self, enemies, tilemap, results):
+        if not enemies:
+            return
+        movements = [enemy.pre_update(tilemap) for enemy in enemies]
+        self.step(enemies, movements, tilemap)
+        for enemy, movement in zip(enemies, movements):
+            enemy.finish_update(movement)
+            results.append((enemy, enemy.post_update()))
+
+    # ============ Physics Step ===================#
+    # PhysicsEntity.move for every entity, with movements[i] as the movement of entities[i]
+    def step(self, entities, movements, tilemap):
+        pos = np.array([entity.pos for entity in entities], dtype = np.float64)
+        velocity = np.array([entity.velocity for entity in entities], dtype = np.float64)
+        size = np.array([entity.size for entity in entities], dtype = np.int64)
+        movement = np.array(movements, dtype = np.float64)
+
+        # Apply acceleration due to gravity (capped at terminal velocity)
+        fall = velocity[:, 1] + GRAVITY
+        terminal = fall >= TERMINAL_VELOCITY
+        velocity[:, 1] = np.where(terminal, TERMINAL_VELOCITY, fall)
+        frame_movement = movement + velocity
+
+        # Move along the x-axis and resolve collisions, then the same along the y-axis
+        pos[:, 0] += frame_movement[:, 0]
+        hit_x, x = self.collide(pos, size, frame_movement[:, 0], 0, tilemap)
+        pos[hit_x, 0] = x[hit_x]
+        pos[:, 1] += frame_movement[:, 1]
+        hit_y, y = self.collide(pos, size, frame_movement[:, 1], 1, tilemap)
+        pos[hit_y, 1] = y[hit_y]
+
+        collisions = np.empty((len(entities), 4), dtype = bool)
+        collisions[:, 0] = hit_y & (frame_movement[:, 1] < 0)
+        collisions[:, 1] = hit_y & (frame_movement[:, 1] > 0)
+        collisions[:, 2] = hit_x & (frame_movement[:, 0] < 0)
+        collisions[:, 3] = hit_x & (frame_movement[:, 0] > 0)
+        velocity[hit_y, 1] = 0
+        velocity[hit_x, 0] = 0
+        self.pos, self.velocity, self.size, self.collisions = pos, velocity, size, collisions
+
+        # Write the results back to the entities, as ints wherever PhysicsEntity.move would have left an int: positions
+        # that were resolved by a collision (they come from a Rect), positions that were ints and only had ints added
+        # to them, and the velocities that got stopped or capped
+        for entity, move, (px, py), vy, at_terminal, hx, hy, (up, down, left, right) in zip(entities, movements, pos.tolist(),
+                velocity[:, 1].tolist(), terminal.tolist(), hit_x.tolist(), hit_y.tolist(), collisions.tolist()):
+            entity_pos = entity.pos
+            entity_velocity = entity.velocity
+            if hx or (type(entity_pos[0]) is int and type(move[0]) is int and type(entity_velocity[0]) is int):
+                px = int(px)
+            if hy or (type(entity_pos[1]) is int and type(move[1]) is int and at_terminal):
+                py = int(py)
+            entity_pos[0] = px
+            entity_pos[1] = py
+            entity_velocity[1] = 0 if hy else (TERMINAL_VELOCITY if at_terminal else vy)
+            if hx:
+                entity_velocity[0] = 0
+            flags = entity.collisions
+            flags['up'] = up
+            flags['down'] = down
+            flags['left'] = left
+            flags['right'] = right
+
+    # Vectorized Tilemap.collide_x / collide_y: push every box that has just moved by d along the axis out of the solid
+    # tiles around it. Returns which boxes hit something, and the resolved coordinate along the axis
+    def collide(self, pos, size, d, axis, tilemap):
+        ts = tilemap.tile_size
+        # the entity rectangles (int() truncates, like PhysicsEntity.rect)
+        x = np.trunc(pos[:, 0]).astype(np.int64)
+        y = np.trunc(pos[:, 1]).astype(np.int64)
+        w = size[:, 0]
+        h = size[:, 1]
+        tile_x = np.floor_divide(pos[:, 0], ts).astype(np.int64)
+        tile_y = np.floor_divide(pos[:, 1], ts).astype(np.int64)
+        hit = np.zeros(len(pos), dtype = bool)
+        forward = d > 0
+        backward = d < 0
+        for ox, oy in NEIGHBOR_OFFSETS:
+            left = (tile_x + ox) * ts
+            top = (tile_y + oy) * ts
+            touching = (x < left + ts) & (x + w > left) & (y < top + ts) & (y + h > top)
+            if not touching.any():
+                continue
+            touching &= tilemap.solid_cells(tile_x + ox, tile_y + oy)
+            # each tile pushes the box before the next one is tested, like the loop in collide_x / collide_y
+            if axis == 0:
+                x = np.where(touching & forward, left - w, np.where(touching & backward, left + ts, x))
+            else:
+                y = np.where(touching & forward, top - h, np.where(touching & backward, top + ts, y))
+            hit |= touching
+        return hit, (x if axis == 0 else y)
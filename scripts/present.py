@@ -0,0 +1,76 @@
+import pygame
+
+# ============ Presenter ===================#
+# Upscales the low resolution game display onto the window and shows it. The original code scaled into a brand new
+# window sized surface every frame and then blitted that onto the window; here the display is scaled straight into
+# the window surface (transform.scale with a destination), and a persistent surface is only used while the screen
+# is shaking (the scaled frame then has to be blitted at an offset).
+#
+# present() can also be told which parts of the display changed:
+#   dirty = None          the whole frame changed (the default)
+#   dirty = []            nothing changed (pause, menus, an idle editor): nothing is scaled and the window isn't updated
+#   dirty = [rects, ...]  only these rectangles (in display pixels) changed
+# Partial updates need the window to be an exact integer multiple of the display (like all the SUPPORTED_RESOLUTIONS
+# presets except QHD and WQHD), so every display pixel covers a whole block of window pixels and a dirty rectangle
+# can be scaled on its own without changing the result. Otherwise the whole frame is presented.
+#
+# The partial updates only help callers that can say what changed: the paused game and the idle editor (dirty = []),
+# and anything that passes rectangles. Normal gameplay frames are always whole frames (the camera moves and the
+# background and clouds are redrawn every frame), so they go through the plain transform.scale into the window.
+# The integer factor doesn't make that any cheaper: scaling straight into the window is the fastest full frame
+# scale (measured against scale_by, scaling into an intermediate surface and a NumPy repeat)
+
+class Presenter:
+    def __init__(self, screen, source_size):
+        self.screen = screen
+        self.source_size = tuple(source_size)
+        self.size = screen.get_size()
+        self.frame = None # scaled frame used while shaking (created the first time it's needed)
+        self.valid = False # does the window currently show an unshifted, fully scaled frame
+
+        # integer scaling factor (0 if the window isn't an exact multiple of the display)
+        factor = self.size[0] // self.source_size[0]
+        exact = factor * self.source_size[0] == self.size[0] and factor * self.source_size[1] == self.size[1]
+        self.factor = factor if exact else 0
+
+    # make the next present() redraw the whole window (e.g. after the window was covered up)
+    def invalidate(self):
+        self.valid = False
+
+    # returns True if anything was sent to the window
+    def present(self, src, offset = (0,0), dirty = None):
+        offset = (round(offset[0]), round(offset[1])) # where pygame's blit would have put the frame
+        shaking = offset != (0,0)
+
+        if dirty is not None and self.valid and not shaking:
+            if not dirty:
+                return False # the window already shows this frame
+            if self.factor:
+                self.present_rects(src, dirty)
+                return True
+
+        if shaking:
+            if self.frame is None:
+                self.frame = pygame.Surface(self.size).convert(self.screen)
+            pygame.transform.scale(src, self.size, self.frame)
+            self.screen.blit(self.frame, offset)
+        else:
+            pygame.transform.scale(src, self.size, self.screen)
+        pygame.display.update()
+        self.valid = not shaking
+        return True
+
+    # scale only the changed rectangles (integer factor only)
+    def present_rects(self, src, dirty):
+        k = self.factor
+        bounds = src.get_rect()
+        screen_rects = []
+        for rect in dirty:
+            rect = pygame.Rect(rect).clip(bounds)
+            if not rect.w or not rect.h:
+                continue
+            screen_rect = pygame.Rect(rect.x * k, rect.y * k, rect.w * k, rect.h * k)
+            pygame.transform.scale(src.subsurface(rect), screen_rect.size, self.screen.subsurface(screen_rect))
+            screen_rects.append(screen_rect)
+        if screen_rects:
+            pygame.display.update(screen_rects)
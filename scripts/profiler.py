@@ -0,0 +1,157 @@
+import csv
+import json
+import pygame
+import numpy as np
+from time import perf_counter
+from collections import deque
+
+PROFILE_WINDOW = 300 # number of recent samples kept for each scope (5 seconds at 60 fps)
+OVERLAY_REFRESH = 15 # frames between redraws of the overlay text
+OVERLAY_COLOR = (255, 255, 255)
+OVERLAY_BACKGROUND = (0, 0, 0, 160)
+
+# ============ Frame Profiler ===================#
+# Named timing scopes around the stages of the game loop:
+#     profiler.begin('tilemap')
+#     self.tilemap.render(...)
+#     profiler.end('tilemap')
+# Every scope keeps its last PROFILE_WINDOW durations (in milliseconds), from which the mean, p50, p95, p99 and max
+# are worked out when the overlay is redrawn or the profile is exported. Counters hold the latest value of anything
+# worth counting (entities, particles, blits...). While the profiler is disabled, begin, end and count return
+# straight away, so the scopes can stay in the game loop for good.
+
+class Profiler:
+    def __init__(self, window = PROFILE_WINDOW):
+        self.enabled = False
+        self.window = window
+        self.samples = {} # scope name -> deque of durations (ms), in the order the scopes were first seen
+        self.counters = {} # counter name -> latest value
+        self.started = {} # scope name -> perf_counter() when it began
+        self.frame_start = None
+        self.frames = 0
+
+        # on-screen overlay
+        self.font = None
+        self.overlay = None # rendered overlay text (redrawn every OVERLAY_REFRESH frames)
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.started.clear()
+        self.frame_start = None
+        self.overlay = None
+        return self.enabled
+
+    def reset(self):
+        self.samples.clear()
+        self.counters.clear()
+        self.started.clear()
+        self.frames = 0
+
+    # ============ Scopes and Counters ===================#
+    def begin(self, name):
+        if self.enabled:
+            self.started[name] = perf_counter()
+
+    def end(self, name):
+        if self.enabled:
+            start = self.started.pop(name, None)
+            if start is not None:
+                self.add_sample(name, (perf_counter() - start) * 1000)
+
+    def add_sample(self, name, ms):
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = deque(maxlen = self.window)
+        samples.append(ms)
+
+    def count(self, name, value):
+        if self.enabled:
+            self.counters[name] = value
+
+    # the whole frame is timed from one call of frame() to the next
+    def frame(self):
+        if self.enabled:
+            now = perf_counter()
+            if self.frame_start is not None:
+                self.add_sample('frame', (now - self.frame_start) * 1000)
+            self.frame_start = now
+            self.frames += 1
+
+    # mean, percentiles and max of every scope
+    def summary(self):
+        stats = {}
+        for name, samples in self.samples.items():
+            if not samples:
+                continue
+            values = np.fromiter(samples, dtype = np.float64, count = len(samples))
+            p50, p95, p99 = np.percentile(values, (50, 95, 99))
+            stats[name] = {'samples': len(values), 'mean': float(values.mean()), 'p50': float(p50), 'p95': float(p95),
+                           'p99': float(p99), 'max': float(values.max())}
+        return stats
+
+    # ============ Export ===================#
+    # write the summary to a .csv or .json file (chosen by the extension)
+    def export(self, path):
+        if path.endswith('.csv'):
+            self.export_csv(path)
+        else:
+            self.export_json(path)
+
+    def export_csv(self, path):
+        f = open(path, 'w', newline = '')
+        writer = csv.writer(f)
+        writer.writerow(['scope', 'samples', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'])
+        for name, stats in self.summary().items():
+            writer.writerow([name, stats['samples']] + ['%.4f' % stats[key] for key in ('mean', 'p50', 'p95', 'p99', 'max')])
+        writer.writerow([])
+        writer.writerow(['counter', 'value'])
+        for name, value in self.counters.items():
+            writer.writerow([name, value])
+        f.close()
+
+    def export_json(self, path):
+        f = open(path, 'w')
+        json.dump({'frames': self.frames, 'window': self.window, 'scopes': self.summary(), 'counters': self.counters}, f, indent = 1)
+        f.close()
+
+    # ============ Overlay ===================#
+    # draw the stats in the top left corner of surf
+    def render(self, surf):
+        if not self.enabled:
+            return
+        if self.overlay is None or self.frames % OVERLAY_REFRESH == 0:
+            self.overlay = self.render_overlay()
+        surf.blit(self.overlay, (2, 2))
+
+    def render_overlay(self):
+        if self.font is None:
+            self.font = pygame.font.Font(None, 12)
+        font = self.font
+
+        # a table of the scopes (the default font isn't monospaced, so every column is lined up by its widest cell)
+        rows = [['ms', 'p50', 'p95', 'p99']]
+        for name, stats in self.summary().items():
+            rows.append([name, '%.2f' % stats['p50'], '%.2f' % stats['p95'], '%.2f' % stats['p99']])
+        cells = [[font.render(text, False, OVERLAY_COLOR) for text in row] for row in rows]
+        widths = [max(row[i].get_width() for row in cells) + 6 for i in range(len(rows[0]))]
+
+        # the counters go underneath, a few per line
+        counters = ['%s %s' % (name, value) for name, value in self.counters.items()]
+        counter_lines = [font.render('  '.join(counters[i:i + 3]), False, OVERLAY_COLOR) for i in range(0, len(counters), 3)]
+
+        line_height = font.get_linesize()
+        width = max([sum(widths)] + [line.get_width() for line in counter_lines]) + 4
+        overlay = pygame.Surface((width, line_height * (len(cells) + len(counter_lines)) + 4), pygame.SRCALPHA)
+        overlay.fill(OVERLAY_BACKGROUND)
+        y = 2
+        for row in cells:
+            x = 2
+            for i, cell in enumerate(row):
+                # numbers are right aligned
+                overlay.blit(cell, (x + (widths[i] - 6 - cell.get_width() if i else 0), y))
+                x += widths[i]
+            y += line_height
+        for line in counter_lines:
+            overlay.blit(line, (2, y))
+            y += line_height
+        return overlay
@@ -0,0 +1,86 @@
+import numpy as np
+
+PROJECTILE_LIFETIME = 360 # number of frames before a projectile disappears on its own
+
+# ============ Projectile Store ===================#
+# All the projectiles in the game live in fixed size NumPy arrays. Every frame they are moved, aged and tested
+# against the tilemap and the player in a handful of vectorized operations, and the ones that hit something or
+# expire are swap-removed (the last live projectile is moved into the free slot). When the store is full, new
+# projectiles recycle the slot of the oldest projectile.
+
+class ProjectileStore:
+    def __init__(self, game, capacity = 4096):
+        self.game = game
+        self.capacity = capacity
+        self.count = 0 # number of live projectiles (they always occupy the first self.count slots)
+        self.pos = np.zeros((capacity, 2), dtype = np.float64)
+        self.velocity = np.zeros((capacity, 2), dtype = np.float64)
+        self.timer = np.zeros(capacity, dtype = np.int32) # number of frames each projectile has existed
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+
+    def add(self, pos, velocity):
+        if self.count < self.capacity:
+            i = self.count
+            self.count += 1
+        else:
+            i = int(np.argmax(self.timer)) # recycle the oldest projectile
+        self.pos[i] = pos
+        self.velocity[i] = velocity
+        self.timer[i] = 0
+
+    # Move all the projectiles and resolve their collisions.
+    # Returns a list of (x, y, x velocity) for every projectile that hit a wall, and the position of the projectile
+    # that hit the player (or None). Only one projectile can hit the player per frame, since the player dies on a hit
+    def update(self, tilemap, player_rect = None):
+        n = self.count
+        if not n:
+            return [], None
+        pos = self.pos[:n]
+        pos += self.velocity[:n]
+        self.timer[:n] += 1
+
+        # batched collision tests with the tilemap, and lifetime expiry
+        hit_wall = tilemap.solid_points(pos)
+        expired = ~hit_wall & (self.timer[:n] > PROJECTILE_LIFETIME)
+        kill = hit_wall | expired
+        wall_hits = [(p[0], p[1], v) for p, v in zip(pos[hit_wall].tolist(), self.velocity[:n, 0][hit_wall].tolist())]
+
+        # batched collision test with the player (pygame.Rect.collidepoint rules: left/top inclusive, right/bottom exclusive)
+        player_hit = None
+        if player_rect is not None:
+            hit_player = ~kill & (pos[:, 0] >= player_rect.left) & (pos[:, 0] < player_rect.right) \
+                               & (pos[:, 1] >= player_rect.top) & (pos[:, 1] < player_rect.bottom)
+            if hit_player.any():
+                first = int(np.argmax(hit_player))
+                player_hit = tuple(pos[first])
+                kill[first] = True
+
+        if kill.any():
+            self.remove(kill)
+        return wall_hits, player_hit
+
+    # swap-remove: fill the holes left by dead projectiles with the live projectiles at the end of the arrays
+    def remove(self, kill):
+        n = self.count
+        new_count = n - int(np.count_nonzero(kill))
+        holes = np.flatnonzero(kill[:new_count])
+        fillers = np.flatnonzero(~kill[new_count:]) + new_count
+        for arr in (self.pos, self.velocity, self.timer):
+            arr[holes] = arr[fillers]
+        self.count = new_count
+
+    # alpha < 1 draws the projectiles part of the way back towards where they were before the latest tick
+    def render(self, surf, offset = (0,0), alpha = 1):
+        n = self.count
+        if not n:
+            return
+        img = self.game.assets['projectile']
+        dest = self.pos[:n] - (img.get_width() / 2 + offset[0], img.get_height() / 2 + offset[1])
+        if alpha < 1:
+            dest -= self.velocity[:n] * (1 - alpha)
+        surf.blits([(img, p) for p in dest.tolist()], doreturn = False)
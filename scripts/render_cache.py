@@ -0,0 +1,126 @@
+import math
+import pygame
+from collections import OrderedDict
+from scripts.chunks import CHUNK_SIZE, CHUNK_SHIFT
+
+# ============ Chunk Render Cache ===================#
+# Instead of blitting every visible tile each frame, the decorations and tiles inside each chunk are
+# pre-composited ("baked") onto one surface per chunk. A frame then only needs a handful of chunk blits.
+# Baked surfaces are kept in a least-recently-used cache so memory stays flat on huge levels, and a chunk is
+# only re-baked after something inside of it has been edited.
+
+class ChunkRenderCache:
+    def __init__(self, tilemap, max_chunks = 64):
+        self.tilemap = tilemap
+        self.max_chunks = max_chunks # upper bound on the number of baked chunk surfaces kept in memory
+        self.surfaces = OrderedDict() # (chunk x, chunk y) -> baked surface (or None for empty chunks), oldest first
+        self.stale = set() # chunks that were thrown away because they were edited (re-baking these counts as a rebake)
+
+        # Counters for profiling the cache
+        self.hits = 0
+        self.misses = 0
+        self.rebakes = 0
+        self.evictions = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'rebakes': self.rebakes,
+                'evictions': self.evictions, 'cached': len(self.surfaces)}
+
+    # size of a chunk in pixels
+    def chunk_span(self):
+        return CHUNK_SIZE * self.tilemap.tile_size
+
+    # throw away the baked surface of a chunk so it gets re-baked the next time it is drawn
+    def invalidate(self, cpos):
+        if cpos in self.surfaces:
+            del self.surfaces[cpos]
+            self.stale.add(cpos)
+
+    # a tile was edited: its own chunk needs re-baking, and so do the chunks to the right and below
+    # since the tile image can overhang into them
+    def invalidate_tile(self, x, y):
+        self.invalidate_chunk_tiles(x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+
+    # some tiles inside a chunk were edited (same as invalidate_tile, for a whole batch of edits in one chunk)
+    def invalidate_chunk_tiles(self, cx, cy):
+        for cpos in ((cx, cy), (cx + 1, cy), (cx, cy + 1), (cx + 1, cy + 1)):
+            self.invalidate(cpos)
+
+    # invalidate every chunk touched by a rectangle in pixel coordinates
+    def invalidate_area(self, x, y, w, h):
+        span = self.chunk_span()
+        for cx in range(int(x // span), int((x + w) // span) + 1):
+            for cy in range(int(y // span), int((y + h) // span) + 1):
+                self.invalidate((cx, cy))
+
+    def invalidate_all(self):
+        self.stale.update(self.surfaces)
+        self.surfaces.clear()
+
+    # returns the baked surface of a chunk (baking it if needed)
+    def get(self, cpos):
+        if cpos in self.surfaces:
+            self.hits += 1
+            self.surfaces.move_to_end(cpos) # mark as most recently used
+            return self.surfaces[cpos]
+
+        if cpos in self.stale:
+            self.stale.discard(cpos)
+            self.rebakes += 1
+        else:
+            self.misses += 1
+        surf = self.bake(cpos)
+        self.surfaces[cpos] = surf
+
+        # evict the least recently used chunks
+        while len(self.surfaces) > self.max_chunks:
+            self.surfaces.popitem(last = False)
+            self.evictions += 1
+        return surf
+
+    def bake(self, cpos):
+        tilemap = self.tilemap
+        assets = tilemap.game.assets
+        tile_size = tilemap.tile_size
+        span = self.chunk_span()
+        origin = (cpos[0] * span, cpos[1] * span)
+        surf = None
+
+        # Render decorations first! (only the ones that overlap this chunk)
+        # Decorations can sit at fractional positions (the editor places them at half pixels). The world position is
+        # rounded down once, before the chunk origin is taken off, so a decoration that crosses a chunk border lands on
+        # the same pixel in every chunk it is drawn into (blit would truncate the position relative to each chunk)
+        for tile in tilemap.offgrid_in_rect(origin[0], origin[1], span, span):
+            if surf is None:
+                surf = pygame.Surface((span, span), pygame.SRCALPHA)
+            pos = tile['pos']
+            surf.blit(assets[tile['type']][tile['variant']], (math.floor(pos[0]) - origin[0], math.floor(pos[1]) - origin[1]))
+
+        # Render tiles from this chunk, and from the chunks above and to the left (their images can overhang into this one)
+        get = tilemap.chunks.get
+        first_x = (cpos[0] - 1) * CHUNK_SIZE
+        first_y = (cpos[1] - 1) * CHUNK_SIZE
+        for x in range(first_x, first_x + 2 * CHUNK_SIZE):
+            for y in range(first_y, first_y + 2 * CHUNK_SIZE):
+                tile = get(x, y)
+                if tile is not None:
+                    img = assets[tile[0]][tile[1]]
+                    pos = (x * tile_size - origin[0], y * tile_size - origin[1])
+                    if pos[0] + img.get_width() > 0 and pos[1] + img.get_height() > 0:
+                        if surf is None:
+                            surf = pygame.Surface((span, span), pygame.SRCALPHA)
+                        surf.blit(img, pos)
+
+        return surf # None if there is nothing to draw in this chunk
+
+    # draw all the chunks inside the camera view
+    def render(self, surf, offset = (0,0)):
+        span = self.chunk_span()
+        blits = []
+        for cx in range(offset[0] // span, (offset[0] + surf.get_width()) // span + 1):
+            for cy in range(offset[1] // span, (offset[1] + surf.get_height()) // span + 1):
+                chunk_surf = self.get((cx, cy))
+                if chunk_surf is not None:
+                    blits.append((chunk_surf, (cx * span - offset[0], cy * span - offset[1])))
+        surf.blits(blits, doreturn = False)
+        return len(blits) # number of chunks drawn
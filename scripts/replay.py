@@ -0,0 +1,141 @@
+import struct
+import random
+import hashlib
+
+REPLAY_MAGIC = b'NJRP'
+REPLAY_VERSION = 1
+
+# ============ Input Recordings ===================#
+# A recording is everything needed to play a session again exactly: the level it started on, the seed of the global
+# random module (which the enemies, clouds and particles use), and the inputs of every tick (see scripts/inputs.py).
+# Inputs rarely change from one tick to the next, so they are stored as runs of (inputs, number of ticks).
+# The file also ends with a digest of the game state after the last tick, so a replay can tell whether it played
+# out exactly the same way. Little-endian layout:
+#   header: magic, version, level, seed, number of ticks, number of runs
+#   runs:   per run: inputs (1 byte), number of ticks (2 bytes)
+#   digest: 20 byte SHA-1 of the final game state (see state_digest)
+
+HEADER = struct.Struct('<4sHHQII')
+RUN = struct.Struct('<BH')
+MAX_RUN = 0xFFFF
+DIGEST_SIZE = 20
+
+# hash of the game state that matters for replays (positions are hashed exactly, as the bytes of the floats)
+def state_digest(game):
+    digest = hashlib.sha1()
+    state = [game.level, game.dead, game.transition, game.player.pos, game.player.velocity, game.player.air_time,
+             game.player.jumps, game.player.dashing, len(game.projectiles)]
+    for enemy in game.enemies:
+        state += [enemy.pos, enemy.velocity, enemy.walking]
+    digest.update(repr(state).encode())
+    digest.update(game.projectiles.pos[:len(game.projectiles)].tobytes())
+    digest.update(repr(random.getstate()).encode()) # the random module has to have been used the same way too
+    return digest.digest()
+
+class Recording:
+    def __init__(self, level = 0, seed = 0, runs = None, digest = None):
+        self.level = level
+        self.seed = seed
+        self.runs = runs if runs is not None else [] # [inputs, number of ticks]
+        self.ticks = sum(count for inputs, count in self.runs)
+        self.digest = digest # digest of the state after the last tick (None until the recording is finished)
+
+    # add the inputs of the next tick
+    def record(self, inputs):
+        if self.runs and self.runs[-1][0] == inputs and self.runs[-1][1] < MAX_RUN:
+            self.runs[-1][1] += 1
+        else:
+            self.runs.append([inputs, 1])
+        self.ticks += 1
+
+    # the inputs of every tick, in order
+    def inputs(self):
+        for inputs, count in self.runs:
+            for i in range(count):
+                yield inputs
+
+    def save(self, path):
+        f = open(path, 'wb')
+        f.write(HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, self.level, self.seed, self.ticks, len(self.runs)))
+        f.write(b''.join(RUN.pack(inputs, count) for inputs, count in self.runs))
+        f.write(self.digest or bytes(DIGEST_SIZE))
+        f.close()
+
+def load_recording(path):
+    f = open(path, 'rb')
+    data = f.read()
+    f.close()
+    magic, version, level, seed, ticks, run_count = HEADER.unpack_from(data, 0)
+    if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+        raise ValueError(path + ' is not a version ' + str(REPLAY_VERSION) + ' recording')
+    runs_end = HEADER.size + RUN.size * run_count
+    runs = [list(run) for run in RUN.iter_unpack(data[HEADER.size:runs_end])]
+    digest = data[runs_end:runs_end + DIGEST_SIZE]
+    recording = Recording(level, seed, runs, digest if any(digest) else None)
+    if recording.ticks != ticks:
+        raise ValueError(path + ' is damaged (expected ' + str(ticks) + ' ticks, found ' + str(recording.ticks) + ')')
+    return recording
+
+# ============ Replays ===================#
+# Feeds the inputs of a recording into a game, one tick at a time
+class Replay:
+    def __init__(self, recording):
+        self.recording = recording
+        self.source = recording.inputs()
+        self.tick = 0 # number of ticks played so far
+
+    def done(self):
+        return self.tick >= self.recording.ticks
+
+    def next(self):
+        self.tick += 1
+        return next(self.source)
+
+    # check the state of the game against the recording (None if the recording has no digest)
+    def matches(self, game):
+        if self.recording.digest is None:
+            return None
+        return state_digest(game) == self.recording.digest
+
+# Play a whole recording in a headless game as fast as possible. Returns (whether the final state matched the
+# recording, how long each tick took in seconds)
+def fast_forward(game, recording):
+    import time
+    game.reset(recording.level, recording.seed)
+    replay = Replay(recording)
+    tick_times = []
+    clock = time.perf_counter
+    while not replay.done():
+        start = clock()
+        game.step(replay.next())
+        tick_times.append(clock() - start)
+    return replay.matches(game), tick_times
+
+# Check a recording and time it, e.g.
+#   python -m scripts.replay session.rep
+# Prints whether the replay reproduced the recorded session and the slowest ticks (to find spikes, or to compare
+# the same workload before and after a change)
+if __name__ == '__main__':
+    import argparse
+    import statistics
+    from game import Game
+
+    parser = argparse.ArgumentParser(description = 'replay a recorded session without rendering')
+    parser.add_argument('recording')
+    parser.add_argument('--slowest', type = int, default = 5, help = 'number of slowest ticks to list')
+    args = parser.parse_args()
+
+    recording = load_recording(args.recording)
+    matched, tick_times = fast_forward(Game(headless = True), recording)
+    total = sum(tick_times)
+    print('%d ticks (level %d, seed %d) in %.2fs: mean %.3fms, median %.3fms, max %.3fms' % (recording.ticks, recording.level,
+          recording.seed, total, total / max(1, len(tick_times)) * 1000, statistics.median(tick_times or [0]) * 1000, max(tick_times or [0]) * 1000))
+    slowest = sorted(range(len(tick_times)), key = lambda tick: tick_times[tick], reverse = True)[:args.slowest]
+    for tick in slowest:
+        print('  tick %6d: %.3fms' % (tick, tick_times[tick] * 1000))
+    if matched is None:
+        print('the recording has no final state to compare against')
+    else:
+        print('replay matches the recording' if matched else 'replay DIVERGED from the recording')
+        if not matched:
+            raise SystemExit(1)
@@ -0,0 +1,53 @@
+import pygame
+
+TRANSITION_STEPS = 30 # the transition counter runs from -30 to 30
+TRANSITION_KEY = (255,255,255) # the inside of the iris is see-through
+
+# ============ Render Resources ===================#
+# Surfaces that the game used to create again every frame: the background scaled to the display size and the
+# "iris" masks of the level transition. Everything here is keyed by size and only created the first time it is
+# asked for (the game builds the iris masks up front with prepare_transitions), so nothing full screen gets
+# allocated while the game is running. Call invalidate() when the resolution changes (the old surfaces are then
+# simply thrown away).
+
+class RenderResources:
+    def __init__(self, assets):
+        self.assets = assets
+        self.invalidate()
+
+    def invalidate(self):
+        self.backgrounds = {} # (asset name, size) -> scaled image
+        self.iris_masks = {} # (size, radius) -> transition mask
+
+    # an image asset scaled to a size (e.g. the background scaled to the display)
+    def background(self, size, name = 'background'):
+        key = (name, tuple(size))
+        surf = self.backgrounds.get(key)
+        if surf is None:
+            surf = self.backgrounds[key] = pygame.transform.scale(self.assets[name], size)
+        return surf
+
+    # ============ Transition Iris ===================#
+    # radius of the see-through circle for a value of the transition counter (0 at -30 and 30, fully open at 0)
+    def iris_radius(self, size, transition):
+        return (TRANSITION_STEPS - abs(transition)) * int(size[0] / TRANSITION_STEPS)
+
+    # black surface with a see-through circle in the middle. There are only 31 different radii per display size;
+    # each one is drawn once, on an 8-bit surface to keep the set small
+    def iris(self, size, transition):
+        radius = self.iris_radius(size, transition)
+        key = (tuple(size), radius)
+        surf = self.iris_masks.get(key)
+        if surf is None:
+            surf = pygame.Surface(size, depth = 8)
+            surf.set_palette([(0,0,0), TRANSITION_KEY])
+            surf.fill((0,0,0))
+            pygame.draw.circle(surf, TRANSITION_KEY, (size[0]//2, size[1]//2), radius)
+            surf.set_colorkey(TRANSITION_KEY) # this makes the color white transparent on this surface
+            self.iris_masks[key] = surf
+        return surf
+
+    # build every iris mask for a display size ahead of time
+    def prepare_transitions(self, size):
+        for transition in range(TRANSITION_STEPS + 1):
+            self.iris(size, transition)
@@ -1,25 +1,75 @@
 import math
 import pygame
+import numpy as np
 
-class Spark:
-    def __init__(self, pos, angle, speed):
-        self.pos = list(pos)
-        self.angle = angle
-        self.speed = speed
+# ============ Spark Pool ===================#
+# Stores all the sparks in fixed size NumPy arrays. The direction of each spark (cos and sin of its angle) is
+# worked out once when it spawns, and every spark is moved in one vectorized step per frame. When the pool is
+# full, new sparks recycle the slot of the oldest spark.
 
-    def update(self):
-        self.pos[0] += self.speed * math.cos(self.angle)
-        self.pos[1] += self.speed * math.sin(self.angle)
+SPARK_DRAG = 0.1 # how much speed a spark loses each frame
+SPARK_COLOR = (255, 255, 255)
+
+class SparkPool:
+    def __init__(self, capacity = 2048):
+        self.capacity = capacity
+        self.count = 0 # number of live sparks (they always occupy the first self.count slots)
+        self.enabled = True # a disabled pool ignores new sparks (headless games don't need them)
+        self.spawned = 0 # total number of sparks ever spawned (used to find the oldest spark)
+        self.pos = np.zeros((capacity, 2), dtype = np.float64)
+        self.direction = np.zeros((capacity, 2), dtype = np.float64) # (cos(angle), sin(angle))
+        self.speed = np.zeros(capacity, dtype = np.float64)
+        self.born = np.zeros(capacity, dtype = np.int64)
+
+    def __len__(self):
+        return self.count
 
-        self.speed = max(0, self.speed - 0.1)
-        return not self.speed # once speed runs out, returns the EOL flag to remove it from list of sparks
+    def clear(self):
+        self.count = 0
+
+    def add(self, pos, angle, speed):
+        if not self.enabled:
+            return
+        if self.count < self.capacity:
+            i = self.count
+            self.count += 1
+        else:
+            i = int(np.argmin(self.born)) # recycle the oldest spark
+        self.pos[i] = pos
+        self.direction[i] = (math.cos(angle), math.sin(angle))
+        self.speed[i] = speed
+        self.born[i] = self.spawned
+        self.spawned += 1
+
+    def update(self):
+        n = self.count
+        if not n:
+            return
+        speed = self.speed[:n]
+        self.pos[:n] += self.direction[:n] * speed[:, None]
+        np.maximum(speed - SPARK_DRAG, 0, out = speed)
 
-    def render(self, surf, offset=(0,0)):
-        render_points = [
-            [self.pos[0] + math.cos(self.angle)               * self.speed * 3 - offset[0] ,self.pos[1] + math.sin(self.angle)               * self.speed * 3 - offset[1]],
-            [self.pos[0] + math.cos(self.angle-math.pi/2)     * self.speed *.5 - offset[0] ,self.pos[1] + math.sin(self.angle-math.pi/2)     * self.speed *.5 - offset[1]],
-            [self.pos[0] + math.cos(self.angle-math.pi)       * self.speed * 3 - offset[0] ,self.pos[1] + math.sin(self.angle-math.pi)       * self.speed * 3 - offset[1]],
-            [self.pos[0] + math.cos(self.angle-math.pi*(3/2)) * self.speed *.5 - offset[0] ,self.pos[1] + math.sin(self.angle*math.pi*(3/2)) * self.speed *.5 - offset[1]],
-        ]
+        # once speed runs out, remove the spark (swap-remove with the live sparks at the end of the arrays)
+        kill = speed == 0
+        if kill.any():
+            new_count = n - int(np.count_nonzero(kill))
+            holes = np.flatnonzero(kill[:new_count])
+            fillers = np.flatnonzero(~kill[new_count:]) + new_count
+            for arr in (self.pos, self.direction, self.speed, self.born):
+                arr[holes] = arr[fillers]
+            self.count = new_count
 
-        pygame.draw.polygon(surf, (255,255,255), render_points)
\ No newline at end of file
+    def render(self, surf, offset = (0,0)):
+        n = self.count
+        if not n:
+            return
+        pos = self.pos[:n] - offset
+        direction = self.direction[:n]
+        speed = self.speed[:n, None]
+        # each spark is a diamond: long along its direction of travel, narrow across it
+        along = direction * speed * 3
+        across = np.stack((-direction[:, 1], direction[:, 0]), axis = 1) * speed * 0.5 # direction rotated by 90 degrees
+        points = np.stack((pos + along, pos - across, pos - along, pos + across), axis = 1)
+        polygon = pygame.draw.polygon
+        for spark_points in points.tolist():
+            polygon(surf, SPARK_COLOR, spark_points)
@@ -0,0 +1,98 @@
+from itertools import count
+
+# ============ Spatial Hash ===================#
+# Uniform grid of buckets for finding objects by area. Every object is stored (by identity) in each of the
+# grid cells its rectangle touches, so a query only has to look at the few cells it overlaps instead of every
+# object in the level. Objects also remember the order they were inserted in, so query results come back in
+# that order (this matters for things like decorations, whose draw order is their insertion order).
+
+class SpatialHash:
+    def __init__(self, cell_size = 64):
+        self.cell_size = cell_size
+        self.cells = {} # (cell x, cell y) -> {object id: entry}
+        self.entries = {} # object id -> [serial number, object, rect, cells], kept in insertion order
+        self.serials = count()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        for entry in self.entries.values():
+            yield entry[1]
+
+    def __contains__(self, item):
+        return id(item) in self.entries
+
+    # range of cells covered by a rectangle (x, y, w, h)
+    def cells_for(self, rect):
+        size = self.cell_size
+        x0 = int(rect[0] // size)
+        y0 = int(rect[1] // size)
+        x1 = int((rect[0] + max(rect[2], 1) - 1) // size) # a zero size rect still sits in one cell
+        y1 = int((rect[1] + max(rect[3], 1) - 1) // size)
+        return [(cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)]
+
+    def insert(self, item, rect):
+        key = id(item)
+        if key in self.entries:
+            self.remove(item)
+        entry = [next(self.serials), item, tuple(rect), self.cells_for(rect)]
+        self.entries[key] = entry
+        for cell in entry[3]:
+            self.cells.setdefault(cell, {})[key] = entry
+
+    # file an object that is already in the index under a new rectangle (it keeps its place in the insertion order).
+    # Objects are found by their identity and the rectangle they were given, so this has to be called whenever an
+    # object moves or changes size
+    def move(self, item, rect):
+        key = id(item)
+        entry = self.entries[key]
+        for cell in entry[3]:
+            bucket = self.cells[cell]
+            del bucket[key]
+            if not bucket:
+                del self.cells[cell]
+        entry[2] = tuple(rect)
+        entry[3] = self.cells_for(rect)
+        for cell in entry[3]:
+            self.cells.setdefault(cell, {})[key] = entry
+
+    # removes an object from the index, returns True if it was there
+    def remove(self, item):
+        entry = self.entries.pop(id(item), None)
+        if entry is None:
+            return False
+        for cell in entry[3]:
+            bucket = self.cells[cell]
+            del bucket[id(item)]
+            if not bucket:
+                del self.cells[cell]
+        return True
+
+    def clear(self):
+        self.cells = {}
+        self.entries = {}
+
+    # all the objects whose rectangle overlaps the rectangle (x, y, w, h), in insertion order
+    def query_rect(self, x, y, w, h):
+        found = {}
+        for cell in self.cells_for((x, y, w, h)):
+            bucket = self.cells.get(cell)
+            if bucket:
+                for key, entry in bucket.items():
+                    r = entry[2]
+                    if r[0] < x + w and r[0] + r[2] > x and r[1] < y + h and r[1] + r[3] > y:
+                        found[key] = entry
+        if len(found) > 1:
+            return [entry[1] for entry in sorted(found.values(), key = lambda entry: entry[0])]
+        return [entry[1] for entry in found.values()]
+
+    # all the objects whose rectangle contains the point, in insertion order
+    def query_point(self, x, y):
+        size = self.cell_size
+        bucket = self.cells.get((int(x // size), int(y // size)))
+        if not bucket:
+            return []
+        hits = [entry for entry in bucket.values() if entry[2][0] <= x < entry[2][0] + entry[2][2] and entry[2][1] <= y < entry[2][1] + entry[2][3]]
+        hits.sort(key = lambda entry: entry[0])
+        return [entry[1] for entry in hits]
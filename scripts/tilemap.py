@@ -1,5 +1,13 @@
+import os
 import pygame
 import json
+import numpy as np
+from contextlib import contextmanager
+from collections.abc import MutableMapping
+from scripts.chunks import ChunkStore, CHUNK_SIZE, CHUNK_SHIFT
+from scripts.render_cache import ChunkRenderCache
+from scripts.spatial import SpatialHash
+from scripts.mapformat import MAP_EXTENSION, read_map, write_map
 
 NEIGHBOR_OFFSETS = [(-1,0),(-1,-1),(0,-1),(1,-1),(1,0),(0,0),(1,1),(0,1),(-1,1)] # get all the tiles in these grid positions relative to the player
 PHYSICS_TILES = {'grass','stone'} # this is a set; it is faster to check if a value is in a set rather than if a value is in a list
@@ -21,48 +29,373 @@ AUTOTILE_MAP = {
     tuple(sorted([(-1, 0,), (1, 0), (0, -1), (0, 1)])):  8, # tiles on left, right, above, and below
 }
 
+# The same rules keyed by a bitmask of the populated neighbors (one bit per entry of AUTOTILE_SHIFTS), so a tile can be
+# looked up with integer math instead of building and sorting a tuple
+AUTOTILE_SHIFTS = ((1,0),(-1,0),(0,-1),(0,1))
+AUTOTILE_MASKS = {sum(1 << AUTOTILE_SHIFTS.index(shift) for shift in neighbors): variant for neighbors, variant in AUTOTILE_MAP.items()}
+
+# One tile of a TilemapView, looks like the old {'type', 'variant', 'pos'} dictionary. It reads straight from the map,
+# and setting its 'type' or 'variant' goes through Tilemap.set_tile, so the caches and the journal hear about the edit
+class TileView(MutableMapping):
+    KEYS = ('type', 'variant', 'pos')
+
+    def __init__(self, tilemap, x, y):
+        self.tilemap = tilemap
+        self.x = x
+        self.y = y
+
+    def __getitem__(self, key):
+        tile = self.tilemap.chunks.get(self.x, self.y)
+        if tile is None:
+            raise KeyError(key) # the tile has been removed since
+        if key == 'type':
+            return tile[0]
+        if key == 'variant':
+            return tile[1]
+        if key == 'pos':
+            return [self.x, self.y]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        tile = self.tilemap.chunks.get(self.x, self.y)
+        if tile is None:
+            raise KeyError(key)
+        if key == 'type':
+            self.tilemap.set_tile(self.x, self.y, value, tile[1])
+        elif key == 'variant':
+            self.tilemap.set_tile(self.x, self.y, tile[0], value)
+        else:
+            raise KeyError(key + " can't be changed (move a tile with Tilemap.set_tile and Tilemap.remove_tile)")
+
+    def __delitem__(self, key):
+        raise KeyError(key + " can't be removed from a tile")
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+# Compatibility view of the chunked tile storage that behaves like the old {'x;y': {'type', 'variant', 'pos'}} dictionary.
+# The tiles it hands out are TileViews, so editing them (like the old autotile and editor did) edits the map
+class TilemapView(MutableMapping):
+    def __init__(self, tilemap):
+        self.tilemap = tilemap
+
+    @staticmethod
+    def parse_loc(loc):
+        x, y = loc.split(';')
+        return int(x), int(y)
+
+    def __getitem__(self, loc):
+        x, y = self.parse_loc(loc)
+        if not self.tilemap.chunks.get_id(x, y):
+            raise KeyError(loc)
+        return TileView(self.tilemap, x, y)
+
+    def __setitem__(self, loc, tile):
+        x, y = self.parse_loc(loc)
+        self.tilemap.set_tile(x, y, tile['type'], tile['variant'])
+
+    def __delitem__(self, loc):
+        x, y = self.parse_loc(loc)
+        if not self.tilemap.remove_tile(x, y):
+            raise KeyError(loc)
+
+    def __contains__(self, loc):
+        try:
+            return bool(self.tilemap.chunks.get_id(*self.parse_loc(loc)))
+        except (AttributeError, ValueError):
+            return False
+
+    def __iter__(self):
+        for x, y, tile_id in self.tilemap.chunks:
+            yield str(x) + ';' + str(y)
+
+    def __len__(self):
+        return len(self.tilemap.chunks)
+
+# every cell on the straight line between two cells, in order (Bresenham's line algorithm)
+def line_cells(start, end):
+    x, y = start
+    x1, y1 = end
+    dx = abs(x1 - x)
+    dy = -abs(y1 - y)
+    step_x = 1 if x < x1 else -1
+    step_y = 1 if y < y1 else -1
+    error = dx + dy
+    while True:
+        yield (x, y)
+        if x == x1 and y == y1:
+            return
+        e2 = 2 * error
+        if e2 >= dy:
+            error += dy
+            x += step_x
+        if e2 <= dx:
+            error += dx
+            y += step_y
+
+# A block of tiles copied out of a map (see Tilemap.copy_region), with everything relative to its top left corner
+class TileRegion:
+    def __init__(self, size, tiles, offgrid):
+        self.size = size # (width, height) in tiles
+        self.tiles = tiles # (x, y, type, variant) of every populated cell
+        self.offgrid = offgrid # decorations, with their positions in pixels
+
 class Tilemap:
     def __init__(self, game, tile_size = 16): # 16 is the default tile size
         self.game = game
         self.tile_size = tile_size
-        self.tilemap = {} # this is a dictionary to map each tile to a location
-        self.offgrid_tiles = [] # this is a list of all decorations to be placed off the tile grid
+        self.chunks = ChunkStore(PHYSICS_TILES) # chunked storage of all the on-grid tiles (see scripts/chunks.py)
+        self.render_cache = ChunkRenderCache(self) # pre-baked chunk surfaces used by render (see scripts/render_cache.py)
+        self.offgrid_index = SpatialHash() # all decorations placed off the tile grid, bucketed by area (see scripts/spatial.py)
+        self.solid_cache = None # occupancy grid of physics tiles for vectorized queries (built on demand by solid_grid)
+        self.revision = 0 # incremented on every edit
+        self.dirty_cells = set() # cells edited since the last autotile pass (see autotile_changed)
+        self.batch_chunks = None # chunks edited inside the current batch() (None when not in a batch)
+        self.journal = None # gets told about every edit (see scripts/autosave.py)
+        self.source = None # level snapshot this map was last restored from (see restore)
+        self.source_revision = -1
 
 
         # ============ Tilemap Data ===================#
-        # Note: Tilemap data are dictionaries whose key is a string representing a position (tile coordinates for tilemap objects, 
-        # pixels for off-grid tile objects), and whose entry is another dictionary containing image and position info for each object
-
-        # Template for putting tiles into a dictionary
-        # {(0,0): 'grass', (0,1): 'dirt', (9999, 0): 'grass'} # save individual tile locations as specific tiles 
-        # (this allows you to not have to code empty spaces into a list!)
+        # Note: on-grid tiles live in self.chunks, which maps integer chunk coordinates to compact arrays of tile ids.
+        # self.tilemap still gives the old dictionary interface, whose key is a string representing a position
+        # (e.g. '3;10' in tile coordinates), and whose entry is another dictionary containing image and position info.
+        # Off-grid tile objects are those dictionaries too (with their position in pixels); they are stored in a spatial index
+        # so they can be found by area, and self.offgrid_tiles gives them back as a tuple in the order they were placed.
+        # The index remembers where each decoration was when it was added, so decorations are only edited through
+        # add_offgrid, remove_offgrid and move_offgrid (changing a decoration's 'pos' in place would leave it filed in the wrong place)
 
         # Generate sample tilemap data
         # for i in range(10):
         #     # results in positions 3 thru 12 on x, 10 on y being grass tiles
-        #     self.tilemap[str(3+i) + ';10'] = {'type': 'grass', 'variant': 1, 'pos': (3+i,10)} # keep pos as a tuple, everything else is a string
-        #     self.tilemap['10;' + str(5+i)] = {'type': 'stone', 'variant': 1, 'pos': (10,5+i)}
+        #     self.set_tile(3+i, 10, 'grass', 1)
+        #     self.set_tile(10, 5+i, 'stone', 1)
 
         # # generate decorations data (note that position refers to the top-left of each image!)
-        # self.offgrid_tiles.append({'type': 'large_decor', 'variant': 2, 'pos': (100,100)}) # add a tree at (100,100) in pixel coordinates
-        # self.offgrid_tiles.append({'type': 'large_decor', 'variant': 0, 'pos': (200,130)}) # add a rock at (200,130) in pixel coordinates
+        # self.add_offgrid({'type': 'large_decor', 'variant': 2, 'pos': (100,100)}) # add a tree at (100,100) in pixel coordinates
+        # self.add_offgrid({'type': 'large_decor', 'variant': 0, 'pos': (200,130)}) # add a rock at (200,130) in pixel coordinates
 
-    def render(self,surf, offset = (0,0)):
+    # dictionary style view of the on-grid tiles (kept for compatibility with code that uses 'x;y' keys)
+    @property
+    def tilemap(self):
+        return TilemapView(self)
 
-        # Render decorations first!
-        for tile in self.offgrid_tiles: # this will render all decoration items, even if they are not inside the camera view
-            surf.blit(self.game.assets[tile['type']][tile['variant']],(tile['pos'][0] - offset[0],\
-                tile['pos'][1] - offset[1])) # position is in pixels for off-grid graphics
-    
-        # identify and loop through tilemap tiles inside the camera view
-        for x in range(offset[0] // self.tile_size - 1, (offset[0] + surf.get_width()) // self.tile_size + 1):
-            for y in range(offset[1] // self.tile_size - 1, (offset[1] + surf.get_height()) // self.tile_size + 1):
-                tile_loc =  str(x) + ';' + str(y)
-                if tile_loc in self.tilemap:
-                    tile = self.tilemap[tile_loc] 
-                    # render this tile if it is in the camera view 
-                    surf.blit(self.game.assets[tile['type']][tile['variant']],\
-                              (tile['pos'][0]*self.tile_size - offset[0], tile['pos'][1]*self.tile_size - offset[1]))
+    @tilemap.setter
+    def tilemap(self, tiles):
+        self.chunks.clear()
+        self.render_cache.invalidate_all()
+        self.solid_cache = None
+        self.dirty_cells.clear()
+        for tile in tiles.values():
+            self.chunks.set(tile['pos'][0], tile['pos'][1], tile['type'], tile['variant']) # (everything was invalidated above already)
+        self.revision += 1
+
+    # all the decorations placed off the tile grid. This is a tuple, so code that still edits it like the old list
+    # (offgrid_tiles.append / remove) fails instead of changing a copy; use add_offgrid/remove_offgrid/move_offgrid
+    @property
+    def offgrid_tiles(self):
+        return tuple(self.offgrid_index)
+
+    @offgrid_tiles.setter
+    def offgrid_tiles(self, tiles):
+        self.offgrid_index.clear()
+        self.render_cache.invalidate_all()
+        for tile in tiles:
+            self.add_offgrid(tile)
+
+    # ============ Tile Access ===================#
+    # returns a dictionary describing the tile at a grid position, or None if there is no tile there
+    def tile_at(self, x, y):
+        tile = self.chunks.get(x, y)
+        if tile is not None:
+            return {'type': tile[0], 'variant': tile[1], 'pos': [x, y]}
+
+    def set_tile(self, x, y, tile_type, variant):
+        tile_id = self.chunks.tile_id(tile_type, variant)
+        if self.chunks.get_id(x, y) != tile_id:
+            self.chunks.set_id(x, y, tile_id)
+            self.tile_changed(x, y)
+            return True
+        return False
+
+    # remove the tile at a grid position, returns True if there was a tile to remove
+    def remove_tile(self, x, y):
+        if self.chunks.get_id(x, y):
+            self.chunks.remove(x, y)
+            self.tile_changed(x, y)
+            return True
+        return False
+
+    # called whenever an on-grid tile is edited so anything derived from the tiles can be updated
+    def tile_changed(self, x, y):
+        self.dirty_cells.add((x, y))
+        if self.journal is not None:
+            self.journal.tile_changed(x, y)
+        if self.batch_chunks is not None:
+            self.batch_chunks.add((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)) # the caches get updated when the batch ends
+            return
+        self.revision += 1
+        self.render_cache.invalidate_tile(x, y)
+        self.solid_cache = None
+
+    # ============ Batched Edits ===================#
+    # Edits made inside
+    #     with tilemap.batch():
+    #         ...
+    # only update the caches that depend on the tiles (baked chunks, the solid grid, the revision) once, when the
+    # outermost batch ends, instead of once per tile. Batches can be nested.
+    @contextmanager
+    def batch(self):
+        if self.batch_chunks is not None:
+            yield
+            return
+        self.batch_chunks = set()
+        try:
+            yield
+        finally:
+            chunks = self.batch_chunks
+            self.batch_chunks = None
+            if chunks:
+                for cx, cy in chunks:
+                    self.render_cache.invalidate_chunk_tiles(cx, cy)
+                self.solid_cache = None
+                self.revision += 1
+
+    # ============ Bulk Edits ===================#
+    # Each of these is one batch, so the caches are updated once per operation. A tile_type of None erases.
+    # They return the number of cells that changed.
+
+    # put a tile at a cell (or erase it), returns True if anything changed
+    def paint(self, x, y, tile_type, variant = 0):
+        if tile_type is None:
+            return self.remove_tile(x, y)
+        return self.set_tile(x, y, tile_type, variant)
+
+    def fill_rect(self, x, y, w, h, tile_type = None, variant = 0):
+        changed = 0
+        with self.batch():
+            for tile_y in range(y, y + h):
+                for tile_x in range(x, x + w):
+                    changed += self.paint(tile_x, tile_y, tile_type, variant)
+        return changed
+
+    # paint every cell on the line between two cells, so a fast mouse drag doesn't leave gaps
+    def paint_line(self, start, end, tile_type = None, variant = 0):
+        changed = 0
+        with self.batch():
+            for x, y in line_cells(start, end):
+                changed += self.paint(x, y, tile_type, variant)
+        return changed
+
+    # paint the area of cells connected to (x, y) (up, down, left and right) that hold the same tile as it, empty
+    # cells included. bounds (x, y, w, h in tiles) stops it from spreading forever into the empty space around the map
+    def flood_fill(self, x, y, tile_type, variant, bounds):
+        left, top, w, h = bounds
+        right = left + w
+        bottom = top + h
+        if not (left <= x < right and top <= y < bottom):
+            return 0
+        get_id = self.chunks.get_id
+        target = get_id(x, y)
+        if target == (self.chunks.tile_id(tile_type, variant) if tile_type is not None else 0):
+            return 0 # already filled
+        changed = 0
+        stack = [(x, y)]
+        with self.batch():
+            while stack:
+                x, y = stack.pop()
+                # painted cells stop matching the target, so every cell only gets filled once
+                if get_id(x, y) != target:
+                    continue
+                changed += self.paint(x, y, tile_type, variant)
+                for shift in AUTOTILE_SHIFTS:
+                    nx = x + shift[0]
+                    ny = y + shift[1]
+                    if left <= nx < right and top <= ny < bottom and get_id(nx, ny) == target:
+                        stack.append((nx, ny))
+        return changed
+
+    # copy the tiles and decorations in a rectangle (in tiles)
+    def copy_region(self, x, y, w, h):
+        tiles = []
+        for tile_y in range(y, y + h):
+            for tile_x in range(x, x + w):
+                tile = self.chunks.get(tile_x, tile_y)
+                if tile is not None:
+                    tiles.append((tile_x - x, tile_y - y, tile[0], tile[1]))
+        ts = self.tile_size
+        offgrid = []
+        for tile in self.offgrid_in_rect(x * ts, y * ts, w * ts, h * ts):
+            # only decorations placed inside the rectangle (not ones that just overhang into it)
+            if x * ts <= tile['pos'][0] < (x + w) * ts and y * ts <= tile['pos'][1] < (y + h) * ts:
+                offgrid.append(dict(tile, pos = [tile['pos'][0] - x * ts, tile['pos'][1] - y * ts]))
+        return TileRegion((w, h), tiles, offgrid)
+
+    # paste a copied region with its top left corner at (x, y) (cells that are empty in the region are left alone)
+    def paste_region(self, region, x, y):
+        ts = self.tile_size
+        changed = 0
+        with self.batch():
+            for tile_x, tile_y, tile_type, variant in region.tiles:
+                changed += self.set_tile(x + tile_x, y + tile_y, tile_type, variant)
+            for tile in region.offgrid:
+                self.add_offgrid(dict(tile, pos = [x * ts + tile['pos'][0], y * ts + tile['pos'][1]]))
+        return changed
+
+    # ============ Off-grid Tile Access ===================#
+    def add_offgrid(self, tile):
+        self.offgrid_index.insert(tile, self.offgrid_rect(tile))
+        self.offgrid_changed(tile)
+
+    # remove a decoration (matched by identity, not by value)
+    def remove_offgrid(self, tile):
+        if self.offgrid_index.remove(tile):
+            self.offgrid_changed(tile)
+
+    # move a decoration to a new position in pixels (it keeps its place in the draw order)
+    def move_offgrid(self, tile, pos):
+        if tile not in self.offgrid_index:
+            raise ValueError('the decoration is not in this tilemap')
+        self.offgrid_changed(tile) # redraw where it was
+        tile['pos'] = list(pos)
+        self.offgrid_index.move(tile, self.offgrid_rect(tile))
+        self.offgrid_changed(tile)
+
+    # decorations whose image overlaps a rectangle in pixel coordinates
+    def offgrid_in_rect(self, x, y, w, h):
+        return self.offgrid_index.query_rect(x, y, w, h)
+
+    # decorations whose image contains a point in pixel coordinates
+    def offgrid_at(self, pos):
+        return self.offgrid_index.query_point(pos[0], pos[1])
+
+    # size of an off-grid tile's image in pixels (falls back to one tile for assets that aren't loaded, e.g. spawners in the game)
+    def offgrid_size(self, tile):
+        try:
+            return self.game.assets[tile['type']][tile['variant']].get_size()
+        except (KeyError, IndexError, AttributeError):
+            return (self.tile_size, self.tile_size)
+
+    def offgrid_rect(self, tile):
+        size = self.offgrid_size(tile)
+        return (tile['pos'][0], tile['pos'][1], size[0], size[1])
+
+    def offgrid_changed(self, tile):
+        self.revision += 1
+        if self.journal is not None:
+            self.journal.offgrid_changed()
+        self.render_cache.invalidate_area(*self.offgrid_rect(tile))
+
+    def render(self,surf, offset = (0,0)):
+        # Decorations and tiles are pre-composited into one surface per chunk, so we only need to blit the chunks
+        # inside the camera view (decorations still get drawn underneath the tiles)
+        return self.render_cache.render(surf, offset = offset) # returns the number of chunks drawn
 
     def extract(self, id_pairs, keep = False):
 
@@ -72,31 +405,26 @@ class Tilemap:
         matches = [] # initialize empty list of matches w/ id pairs
         
         # Loop through off-grid tiles
-        for tile in self.offgrid_tiles.copy(): # work with a copy of offgrid_tiles rather than the actual parameter
+        for tile in self.offgrid_tiles: # offgrid_tiles is already a copy, so we can remove tiles while looping
             # if the tile type and variant listed in id_pairs exists in offgrid tiles:
             if (tile['type'],tile['variant']) in id_pairs:
                 matches.append(tile.copy()) # pass the tile information to matches list
                 # remove from offgrid tiles if specified
                 if not keep:
-                    self.offgrid_tiles.remove(tile)
+                    self.remove_offgrid(tile)
 
-        # Loop through on grid tiles (by dictionary keys)
-        for loc in self.tilemap.copy():
-            tile = self.tilemap[loc] # tilemap is a dictionary; get the entry corresponding to [loc] (this is the actual dictionary entry, not a working copy!)
-            if (tile['type'], tile['variant']) in id_pairs:
+        # Loop through on grid tiles, only looking at the palette ids of the requested tiles
+        wanted = {self.chunks.palette_ids[pair] for pair in id_pairs if pair in self.chunks.palette_ids}
+        if wanted:
+            for x, y, tile_id in self.chunks:
+                if tile_id in wanted:
+                    tile_type, variant = self.chunks.palette[tile_id]
+                    # convert tilemap position to pixel coordinates
+                    matches.append({'type': tile_type, 'variant': variant, 'pos': [x * self.tile_size, y * self.tile_size]})
 
-                # Create a clean copy of the tile data to avoid modifying the actual data
-                # in self.tilemap
-                matches.append(tile.copy()) # pass the tile information to matches list
-                # create a copy of the matches list entry (list.copy function)
-                matches[-1]['pos'] = matches[-1]['pos'].copy() # don't really understand why we have to copy this one
-                # convert tilemap position to pixel coordinates
-                matches[-1]['pos'][0] *= self.tile_size
-                matches[-1]['pos'][1] *= self.tile_size
-
-                # remove from tilemap if specified
-                if not keep:
-                    del self.tilemap[loc] # remove from dictionary
+                    # remove from tilemap if specified
+                    if not keep:
+                        self.remove_tile(x, y)
 
         return matches
    
@@ -104,64 +432,233 @@ class Tilemap:
         
         tiles = [] # initialize list of tiles to return
         # converta pixel position into a grid position
-        tile_loc = (int(pos[0] // self.tile_size),int(pos[1] // self.tile_size)) # double slash is integer division, which drops the decimals after division
+        tile_x = int(pos[0] // self.tile_size) # double slash is integer division, which drops the decimals after division
+        tile_y = int(pos[1] // self.tile_size)
         for offset in NEIGHBOR_OFFSETS:
-            check_loc = str(tile_loc[0] + offset[0]) + ';' + str(tile_loc[1] + offset[1])
-            if check_loc in self.tilemap: # check if there is a tile in this location ( I guess this already knows to check the 'pos' key)
-                tiles.append(self.tilemap[check_loc])
+            tile = self.tile_at(tile_x + offset[0], tile_y + offset[1])
+            if tile is not None: # check if there is a tile in this location
+                tiles.append(tile)
         return tiles
     
     # filter tiles that have physics enabled
     def physics_rects_around(self, pos):
         rects = []
-        for tile in self.tiles_around(pos):
-            if tile['type'] in PHYSICS_TILES:
-                rects.append(pygame.Rect(tile['pos'][0]*self.tile_size, tile['pos'][1]*self.tile_size,self.tile_size,self.tile_size))
+        tile_x = int(pos[0] // self.tile_size)
+        tile_y = int(pos[1] // self.tile_size)
+        for offset in NEIGHBOR_OFFSETS:
+            x = tile_x + offset[0]
+            y = tile_y + offset[1]
+            if self.chunks.is_solid(x, y):
+                rects.append(pygame.Rect(x*self.tile_size, y*self.tile_size,self.tile_size,self.tile_size))
         return rects
-    
+
+    # ============ Collision Sweeps ===================#
+    # Push a box that has just moved by dx (or dy) out of the solid tiles around pos, the way the entities resolve
+    # collisions one axis at a time. rect is moved in place, and the return value says whether it hit anything.
+    # This is the same test as looping over physics_rects_around with colliderect (same neighbours, same order),
+    # but done with integer tile math, so no strings, lists or Rects get built on the way.
+    def collide_x(self, rect, dx, pos):
+        ts = self.tile_size
+        tile_x = int(pos[0] // ts)
+        tile_y = int(pos[1] // ts)
+        x, y, w, h = rect.x, rect.y, rect.w, rect.h
+        get_id = self.chunks.get_id
+        solid = self.chunks.solid
+        hit = False
+        for ox, oy in NEIGHBOR_OFFSETS:
+            left = (tile_x + ox) * ts
+            top = (tile_y + oy) * ts
+            # cheap overlap test first, the tile lookup only happens for tiles the box is actually touching
+            if x < left + ts and x + w > left and y < top + ts and y + h > top and solid[get_id(tile_x + ox, tile_y + oy)]:
+                if dx > 0:
+                    x = left - w
+                elif dx < 0:
+                    x = left + ts
+                hit = True
+        rect.x = x
+        return hit
+
+    def collide_y(self, rect, dy, pos):
+        ts = self.tile_size
+        tile_x = int(pos[0] // ts)
+        tile_y = int(pos[1] // ts)
+        x, y, w, h = rect.x, rect.y, rect.w, rect.h
+        get_id = self.chunks.get_id
+        solid = self.chunks.solid
+        hit = False
+        for ox, oy in NEIGHBOR_OFFSETS:
+            left = (tile_x + ox) * ts
+            top = (tile_y + oy) * ts
+            if x < left + ts and x + w > left and y < top + ts and y + h > top and solid[get_id(tile_x + ox, tile_y + oy)]:
+                if dy > 0:
+                    y = top - h
+                elif dy < 0:
+                    y = top + ts
+                hit = True
+        rect.y = y
+        return hit
+
     # function to check if a solid physics tile exists at a query point and return said tile
     def solid_check(self, pos):
-        tile_loc = str(int(pos[0] // self.tile_size)) + ';' + str(int(pos[1] // self.tile_size)) # convert pos to tile coordinates
-        if tile_loc in self.tilemap:
-            if self.tilemap[tile_loc]['type'] in PHYSICS_TILES:
-                return self.tilemap[tile_loc]
+        x = int(pos[0] // self.tile_size) # convert pos to tile coordinates
+        y = int(pos[1] // self.tile_size)
+        if self.chunks.is_solid(x, y):
+            return self.tile_at(x, y)
 
-    # Save Tilemap data
+    # ============ Vectorized Queries ===================#
+    # Returns a boolean grid of where the physics tiles are, indexed by [x, y] in tile coordinates relative to
+    # the returned origin (the grid covers the bounding box of all the chunks in the map)
+    def solid_grid(self):
+        if self.solid_cache is None:
+            chunks = dict(self.chunks.items())
+            if chunks:
+                first_cx = min(cpos[0] for cpos in chunks)
+                first_cy = min(cpos[1] for cpos in chunks)
+                width = (max(cpos[0] for cpos in chunks) - first_cx + 1) * CHUNK_SIZE
+                height = (max(cpos[1] for cpos in chunks) - first_cy + 1) * CHUNK_SIZE
+                grid = np.zeros((width, height), dtype = bool)
+                solid_lookup = np.array(self.chunks.solid, dtype = bool) # tile id -> has physics
+                for (cx, cy), chunk in chunks.items():
+                    x = (cx - first_cx) * CHUNK_SIZE
+                    y = (cy - first_cy) * CHUNK_SIZE
+                    # chunk arrays are stored row by row, so they have to be transposed into [x, y] order
+                    ids = np.frombuffer(chunk.tiles, dtype = np.uint16).reshape(CHUNK_SIZE, CHUNK_SIZE)
+                    grid[x:x + CHUNK_SIZE, y:y + CHUNK_SIZE] = solid_lookup[ids].T
+                self.solid_cache = (grid, first_cx * CHUNK_SIZE, first_cy * CHUNK_SIZE)
+            else:
+                self.solid_cache = (np.zeros((0, 0), dtype = bool), 0, 0)
+        return self.solid_cache
+
+    # vectorized solid_check: takes an (n, 2) array of pixel positions and returns an array of n booleans
+    def solid_points(self, points):
+        tile_x = np.floor_divide(points[:, 0], self.tile_size).astype(np.int64)
+        tile_y = np.floor_divide(points[:, 1], self.tile_size).astype(np.int64)
+        return self.solid_cells(tile_x, tile_y)
+
+    # vectorized is_solid: takes arrays of tile coordinates and returns an array of booleans
+    def solid_cells(self, tile_x, tile_y):
+        grid, origin_x, origin_y = self.solid_grid()
+        tile_x = tile_x - origin_x
+        tile_y = tile_y - origin_y
+        inside = (tile_x >= 0) & (tile_x < grid.shape[0]) & (tile_y >= 0) & (tile_y < grid.shape[1])
+        solid = np.zeros(len(tile_x), dtype = bool)
+        solid[inside] = grid[tile_x[inside], tile_y[inside]]
+        return solid
+
+    # Save Tilemap data (JSON files keep the original 'x;y' dictionary layout, .map files use the binary format in scripts/mapformat.py)
+    # The map is written to a temporary file first and then swapped in, so a crash halfway through a save can't
+    # leave a half-written map behind
     def save(self, path): 
-        f = open(path, 'w') # create file with write access
-        json.dump({'tilemap': self.tilemap, 'tile_size': self.tile_size, 'offgrid': self.offgrid_tiles},f)
-        f.close()
+        temp_path = path + '.tmp'
+        if path.endswith(MAP_EXTENSION):
+            write_map(self, temp_path)
+        else:
+            tiles = {}
+            for x, y, tile_id in self.chunks:
+                tile_type, variant = self.chunks.palette[tile_id]
+                tiles[str(x) + ';' + str(y)] = {'type': tile_type, 'variant': variant, 'pos': [x, y]}
+            f = open(temp_path, 'w') # create file with write access
+            json.dump({'tilemap': tiles, 'tile_size': self.tile_size, 'offgrid': self.offgrid_tiles},f)
+            f.close()
+        os.replace(temp_path, path)
+
+    # independent copy of the map (e.g. for saving it on another thread while this one keeps getting edited)
+    def copy(self):
+        tilemap = Tilemap(self.game, self.tile_size)
+        tilemap.chunks = self.chunks.copy()
+        for tile in self.offgrid_tiles:
+            tilemap.add_offgrid(dict(tile))
+        return tilemap
 
     # Load Tilemap data
     def load(self, path): 
-        # Load a saved json file
-        f = open(path, 'r')
-        map_data = json.load(f)
-        f.close()
+        if path.endswith(MAP_EXTENSION):
+            # Binary maps are memory-mapped, and their chunks only get decoded when something looks at them
+            offgrid = read_map(self, path)
+        else:
+            # Load a saved json file
+            f = open(path, 'r')
+            map_data = json.load(f)
+            f.close()
+
+            # Parse loaded data to class parameters (on-grid tiles get converted into chunks)
+            self.tilemap = map_data['tilemap']
+            self.tile_size = map_data['tile_size']
+            offgrid = map_data['offgrid']
+        self.offgrid_tiles = offgrid
+        self.solid_cache = None
+        self.dirty_cells.clear() # a freshly loaded map has no edits to autotile
+        self.render_cache.invalidate_all() # nothing baked for the old map is valid anymore
+        self.revision += 1
+
+    # Restore the map from a level snapshot (see scripts/level.py). Chunks are copied out of the snapshot the first time
+    # they are used, and restoring the same snapshot again when nothing has been edited since costs nothing at all
+    def restore(self, snapshot):
+        if self.source is snapshot and self.source_revision == self.revision:
+            return
+        self.chunks.clear()
+        for pair in snapshot.palette[1:]:
+            self.chunks.tile_id(*pair)
+        for cpos, chunk in snapshot.chunks.items():
+            self.chunks.add_pending(cpos, chunk.count, chunk.copy)
+        self.tile_size = snapshot.tile_size
+        self.offgrid_tiles = [dict(tile) for tile in snapshot.offgrid]
+        self.solid_cache = None
+        self.dirty_cells.clear()
+        self.render_cache.invalidate_all()
+        self.source = snapshot
+        self.revision += 1
+        self.source_revision = self.revision
+
+    # Auto-tiling
+    # pick the variant of the tile at (x, y) from the rules in AUTOTILE_MAP (only the tile type of the neighbors matters,
+    # so changing a variant never changes what its neighbors should be)
+    def autotile_cell(self, x, y):
+        chunks = self.chunks
+        tile_id = chunks.get_id(x, y)
+        if tile_id:
+            tile_type, variant = chunks.palette[tile_id]
+            if tile_type in AUTOTILE_TYPES:
+                variant = AUTOTILE_MASKS.get(self.autotile_mask(x, y, tile_type), variant)
+                if variant != chunks.palette[tile_id][1]:
+                    self.set_tile(x, y, tile_type, variant)
 
-        # Parse loaded data to class parameters
-        self.tilemap = map_data['tilemap']
-        self.tile_size = map_data['tile_size']
-        self.offgrid_tiles = map_data['offgrid']
+    # bitmask of the 4 neighbors of (x, y) that hold tile_type (bits in the order of AUTOTILE_SHIFTS)
+    def autotile_mask(self, x, y, tile_type):
+        get_id = self.chunks.get_id
+        palette = self.chunks.palette
+        mask = 0
+        neighbor = get_id(x + 1, y)
+        if neighbor and palette[neighbor][0] == tile_type:
+            mask = 1
+        neighbor = get_id(x - 1, y)
+        if neighbor and palette[neighbor][0] == tile_type:
+            mask |= 2
+        neighbor = get_id(x, y - 1)
+        if neighbor and palette[neighbor][0] == tile_type:
+            mask |= 4
+        neighbor = get_id(x, y + 1)
+        if neighbor and palette[neighbor][0] == tile_type:
+            mask |= 8
+        return mask
 
-    # Auto-tiling 
+    # autotile the whole map
     def autotile(self):
-        # loop through all the keys in the tilemap dictionary
-        for loc in self.tilemap:
-            tile = self.tilemap[loc]
-            neighbors = set()
-            for shift in [(1,0),(-1,0),(0,-1),(0,1)]:
-                # build a string representation of the location we want to check
-                check_loc = str(tile['pos'][0] + shift[0]) + ';' + str(tile['pos'][1] + shift[1])
-                # Check if something exists in the checked location
-                if check_loc in self.tilemap:
-                    # if yes, make sure the neighbor is the same type of tile
-                    if self.tilemap[check_loc]['type'] == tile['type']:
-                        neighbors.add(shift) # add this location to the set of populated neighbors
-
-            # Convert neighbors set into a tuple for compatability with the autotile rule dictionary
-            neighbors = tuple(sorted(neighbors))
-            if (tile['type'] in AUTOTILE_TYPES) and (neighbors in AUTOTILE_MAP):
-                # set this tile's variant to the entry in the rule dictionary
-                tile['variant'] = AUTOTILE_MAP[neighbors] 
+        for x, y, tile_id in self.chunks:
+            self.autotile_cell(x, y)
+        self.dirty_cells.clear() # (including the cells the pass just changed itself)
 
+    # autotile only the cells edited since the last pass and their 4 neighbors (which is all an edit can affect), so it
+    # costs about the same whatever the size of the map. Returns the number of cells that were looked at
+    def autotile_changed(self):
+        if not self.dirty_cells:
+            return 0
+        cells = set()
+        for x, y in self.dirty_cells:
+            cells.add((x, y))
+            for shift in AUTOTILE_SHIFTS:
+                cells.add((x + shift[0], y + shift[1]))
+        for x, y in cells:
+            self.autotile_cell(x, y)
+        self.dirty_cells.clear()
+        return len(cells)
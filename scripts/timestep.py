@@ -0,0 +1,36 @@
+TICK_RATE = 60 # simulation ticks per second (all the gameplay constants are tuned for 60)
+MAX_TICKS_PER_FRAME = 5 # the most ticks that get run to catch up in one rendered frame
+
+# ============ Fixed Timestep ===================#
+# Runs the simulation at a fixed rate no matter how fast frames are rendered. The time between frames is added to
+# an accumulator, and every whole tick in the accumulator is simulated. What is left over (alpha, between 0 and 1)
+# tells the renderer how far it is between the last two ticks, so positions can be interpolated for smooth motion
+# at any frame rate. If rendering falls far behind, only MAX_TICKS_PER_FRAME ticks are run and the rest of the time
+# is dropped (the game slows down instead of getting stuck trying to catch up).
+
+class FixedTimestep:
+    def __init__(self, tick_rate = TICK_RATE, max_ticks = MAX_TICKS_PER_FRAME):
+        self.tick_ms = 1000 / tick_rate # length of a tick in milliseconds
+        self.max_ticks = max_ticks
+        self.accumulator = 0 # simulation time (ms) that hasn't been run yet
+        self.ticks = 0 # total number of ticks run
+        self.dropped = 0 # total number of ticks skipped because the game couldn't keep up
+
+    # add the time since the last frame, returns how many ticks to run this frame
+    def advance(self, elapsed_ms):
+        self.accumulator += elapsed_ms
+        ticks = int(self.accumulator // self.tick_ms)
+        if ticks > self.max_ticks:
+            self.dropped += ticks - self.max_ticks
+            ticks = self.max_ticks
+            self.accumulator = self.tick_ms * ticks # throw away the time we can't catch up on
+        self.accumulator -= self.tick_ms * ticks
+        self.ticks += ticks
+        return ticks
+
+    # how far the current frame is between the last two ticks (0 = the previous tick, 1 = the latest tick)
+    def alpha(self):
+        return min(1.0, self.accumulator / self.tick_ms)
+
+    def reset(self):
+        self.accumulator = 0
@@ -1,5 +1,6 @@
 import pygame
 import os
+import weakref
 
 BASE_IMG_PATH = 'data/images/'
 
@@ -9,6 +10,17 @@ def load_image(path):
     img.set_colorkey((0,0,0))
     return img
 
+# cache of horizontally flipped copies of images, so entities facing left don't allocate a new surface every frame
+# (weak keys let the flipped copy go away along with the original image)
+flipped_images = weakref.WeakKeyDictionary()
+
+# returns a horizontally flipped copy of an image (only created the first time it is asked for)
+def flip_image(img):
+    flipped = flipped_images.get(img)
+    if flipped is None:
+        flipped = flipped_images[img] = pygame.transform.flip(img, True, False)
+    return flipped
+
 # loads all the images in a folder (returns a list of surfaces)
 def load_images(path):
     images = []
@@ -18,8 +30,10 @@ def load_images(path):
 
 # Class for playing animations
 class Animation:
-    def __init__(self, images, img_dur=5, loop = True):
+    def __init__(self, images, img_dur=5, loop = True, flipped = None):
         self.images = images
+        # flipped versions of every frame are made once when the animation is loaded and shared by all copies
+        self.flipped = flipped if flipped is not None else [flip_image(img) for img in images]
         self.loop = loop
         self.img_duration = img_dur
         self.done = False
@@ -27,11 +41,12 @@ class Animation:
 
     # create a copy instance of this animation (saves memory, somehow..)
     def copy(self):
-        return Animation(self.images, self.img_duration, self.loop)
+        return Animation(self.images, self.img_duration, self.loop, self.flipped)
     
-    # returns current image of the animation
-    def img(self):
-        return self.images[int(self.frame / self.img_duration)] # gives us whatever frame we are on for the current frame of the game
+    # returns current image of the animation (optionally flipped horizontally)
+    def img(self, flip = False):
+        images = self.flipped if flip else self.images
+        return images[int(self.frame / self.img_duration)] # gives us whatever frame we are on for the current frame of the game
     
     def update(self):
         if self.loop: